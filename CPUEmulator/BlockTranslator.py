@@ -0,0 +1,105 @@
+from HackCPU import HackCPU, c_instruction_source, JUMP_MNEMONICS
+
+# ========================= BlockCPU CLASS
+
+MAX_BLOCK_SIZE = 256
+
+
+class BlockCPU(HackCPU):
+    """
+    Hack emulator translating the program into basic blocks. A block starts at
+    the address the execution reaches and ends with a jump instruction, before
+    a static jump target (an address loaded right before a jump instruction),
+    or after MAX_BLOCK_SIZE instructions. Every block is compiled into one
+    Python function holding the registers in locals, and cached by its start
+    address until reset.
+    """
+    def __init__(self, rom):
+        HackCPU.__init__(self, rom)
+        self._targets = self._static_targets()
+        self._blocks = [None]*len(self.rom)
+
+    def reset(self):
+        """
+        Resets the registers and the cycle counter, and drops the translated blocks.
+        """
+        HackCPU.reset(self)
+        self._blocks = [None]*len(self.rom)
+
+    def _static_targets(self):
+        """
+        Finds the addresses loaded into A right before a jump instruction.
+        """
+        targets = set()
+        for pc in range(1, len(self.rom)):
+            word, previous = self.rom[pc], self.rom[pc-1]
+            if word >= 0x8000 and word & 0x7 and previous < 0x8000:
+                targets.add(previous)
+        return targets
+
+    def _translate(self, start):
+        """
+        Compiles the block starting at the address start.
+        output:
+            (function (a, d, ram) -> (a, d, pc), number of instructions)
+        """
+        lines = ['def block_{}(a, d, ram):'.format(start)]
+        pc = start
+        while True:
+            word = self.rom[pc]
+            lines.append('    # {}'.format(pc))
+            if word < 0x8000:
+                lines.append('    a = {}'.format(word))
+            else:
+                statements, condition = c_instruction_source(word)
+                if JUMP_MNEMONICS[word & 0x7]:
+                    lines.append('    target = a')
+                    lines.extend(statements)
+                    if condition == 'True':
+                        lines.append('    return a, d, target')
+                    else:
+                        lines.append('    if {}: return a, d, target'.format(condition))
+                        lines.append('    return a, d, {}'.format(pc+1))
+                    break
+                lines.extend(statements)
+            pc += 1
+            if pc == len(self.rom) or pc in self._targets or pc-start == MAX_BLOCK_SIZE:
+                lines.append('    return a, d, {}'.format(pc))
+                pc -= 1
+                break
+        namespace = {}
+        exec('\n'.join(lines)+'\n', namespace)
+        block = (namespace['block_{}'.format(start)], pc-start+1)
+        self._blocks[start] = block
+        return block
+
+    def run(self, max_cycles):
+        """
+        Executes at most max_cycles instructions; stops earlier if the PC leaves the ROM.
+        Whole blocks are executed while they fit into max_cycles, the rest instruction by instruction.
+        output:
+            number of executed instructions
+        """
+        blocks = self._blocks
+        ram = self.ram
+        a, d, pc = self.a, self.d, self.pc
+        n_rom = len(blocks)
+        cycles = 0
+        try:
+            while pc < n_rom:
+                block = blocks[pc]
+                if block is None:
+                    block = self._translate(pc)
+                function, length = block
+                if cycles+length > max_cycles:
+                    break
+                a, d, pc = function(a, d, ram)
+                cycles += length
+        except IndexError:
+            raise IndexError('Address outside of the RAM in the block starting at ROM[{}].'.format(pc))
+        finally:
+            self.a, self.d, self.pc = a, d, pc
+            self.cycles += cycles
+        if pc < n_rom and cycles < max_cycles:
+            cycles += HackCPU.run(self, max_cycles-cycles)
+        return cycles
@@ -0,0 +1,100 @@
+import argparse
+import os.path
+import re
+import sys
+import time
+
+from HackCPU import HackCPU
+from BlockTranslator import BlockCPU
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'HackAssembler'))
+from HackBinary import load_hackbin, read_hack
+
+# ========================= CPU emulator
+
+def load_program(path):
+    """
+    Loads the ROM words from a '.hack' or '.hackbin' file.
+    """
+    if path.endswith('.hackbin'):
+        return load_hackbin(path)
+    elif path.endswith('.hack'):
+        return read_hack(path)
+    raise ValueError("The file has to end with '.hack' or '.hackbin' extension.")
+
+
+_RAM_RE = re.compile(r'RAM\[(\d+)\]')
+
+def run_test_script(path, cpu_class=HackCPU):
+    """
+    Runs the subset of a CPU emulator test script ('.tst') used by the project
+    tests: load, set RAM[i] v, repeat n { ticktock; }, ticktock, output-list of
+    RAM cells, and output. The other commands are ignored.
+    input:
+        path        -path to the '.tst' file
+        cpu_class   -HackCPU or BlockCPU
+    output:
+        list of the output rows; a row is a list of (name, value)
+    """
+    src_file = open(path, 'r')
+    script = re.sub(r'//[^\n]*|/\*.*?\*/', '', src_file.read(), flags=re.S)
+    src_file.close()
+
+    cpu = None
+    output_list = []
+    rows = []
+    for command in re.split(r'[;,]', script):
+        command = command.strip().lstrip('}').strip()
+        repeat = re.match(r'repeat\s+(\d+)\s*\{\s*ticktock', command)
+        if command.startswith('load'):
+            cpu = cpu_class(load_program(os.path.join(os.path.dirname(path), command.split()[1])))
+        elif command.startswith('set'):
+            _, target, value = command.split()
+            cpu.poke(int(_RAM_RE.match(target).group(1)), int(value))
+        elif repeat:
+            cpu.run(int(repeat.group(1)))
+        elif command.startswith('ticktock'):
+            cpu.run(1)
+        elif command.startswith('output-list'):
+            output_list = [int(address) for address in _RAM_RE.findall(command)]
+        elif command == 'output':
+            rows.append([('RAM[{}]'.format(address), cpu.peek(address)) for address in output_list])
+    return rows
+
+
+def _address_range(string):
+    """
+    Parses 'ADDR' or 'FIRST-LAST'.
+    """
+    first, _, last = string.partition('-')
+    return range(int(first), int(last or first)+1)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Runs a Hack program.')
+    arg_parser.add_argument('path', help="'.hack', '.hackbin', or test script '.tst' file")
+    arg_parser.add_argument('--cycles', type=int, default=1000000, help='number of instructions to execute')
+    arg_parser.add_argument('--set', nargs='*', default=[], metavar='ADDR=VALUE', help='initial RAM values')
+    arg_parser.add_argument('--dump', nargs='*', default=[], metavar='ADDR[-ADDR]', help='RAM cells to print')
+    arg_parser.add_argument('--blocks', action='store_true', help='translate the program into basic blocks')
+    args = arg_parser.parse_args()
+    cpu_class = BlockCPU if args.blocks else HackCPU
+
+    if args.path.endswith('.tst'):
+        for row in run_test_script(args.path, cpu_class):
+            print(' '.join('{}={}'.format(name, value) for name, value in row))
+    else:
+        cpu = cpu_class(load_program(args.path))
+        for assignment in args.set:
+            address, value = assignment.split('=')
+            cpu.poke(int(address), int(value))
+
+        start = time.perf_counter()
+        cycles = cpu.run(args.cycles)
+        seconds = time.perf_counter()-start
+
+        for cells in args.dump:
+            for address in _address_range(cells):
+                print('RAM[{}] = {}'.format(address, cpu.peek(address)))
+        print('{} instructions in {:.3f} s ({:.2f} M instructions/s), PC = {}'.format(
+            cycles, seconds, cycles/seconds/1e6 if seconds else float('inf'), cpu.pc))
@@ -0,0 +1,204 @@
+import os.path
+import sys
+from array import array
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'HackAssembler'))
+from CodeGenerator import CodeGenerator
+
+# ========================= Instruction decoding
+
+RAM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+
+# semantics of the comp mnemonics with the A register as the operand; the
+# mnemonics using M are derived by replacing A by M, and {x} by the value of M
+_COMP_EXPRESSIONS = {
+    "0":   "0",
+    "1":   "1",
+    "-1":  "0xFFFF",
+    "D":   "d",
+    "A":   "{x}",
+    "!D":  "d^0xFFFF",
+    "!A":  "{x}^0xFFFF",
+    "-D":  "(-d)&0xFFFF",
+    "-A":  "(-{x})&0xFFFF",
+    "D+1": "(d+1)&0xFFFF",
+    "A+1": "({x}+1)&0xFFFF",
+    "D-1": "(d-1)&0xFFFF",
+    "A-1": "({x}-1)&0xFFFF",
+    "D+A": "(d+{x})&0xFFFF",
+    "D-A": "(d-{x})&0xFFFF",
+    "A-D": "({x}-d)&0xFFFF",
+    "D&A": "d&{x}",
+    "D|A": "d|{x}",
+}
+
+# jump conditions on the 16-bit result v; v >= 0x8000 means negative
+_JUMP_CONDITIONS = {
+    "JGT": "0 < v < 0x8000",
+    "JEQ": "v == 0",
+    "JGE": "v < 0x8000",
+    "JLT": "v >= 0x8000",
+    "JNE": "v != 0",
+    "JLE": "v == 0 or v >= 0x8000",
+    "JMP": "True",
+}
+
+
+def _decoding_tables():
+    """
+    Inverts the encoding tables of the assembler's CodeGenerator.
+    output:
+        (comp, dest, jump) -dictionaries mapping the bit fields to the mnemonics
+    """
+    generator = CodeGenerator()
+    comp = {int(bits, 2): mnemonic for mnemonic, bits in generator.comp_table.items()}
+    dest = {int(bits, 2): mnemonic for mnemonic, bits in generator.dest_table.items()}
+    jump = {int(bits, 2): mnemonic for mnemonic, bits in generator.jump_table.items()}
+    return comp, dest, jump
+
+COMP_MNEMONICS, DEST_MNEMONICS, JUMP_MNEMONICS = _decoding_tables()
+
+
+def disassemble(word):
+    """
+    Returns the mnemonics of a ROM word, e.g. '@17' or 'AM=M+1' or 'D;JGT'.
+    """
+    if word < 0x8000:
+        return '@'+str(word)
+    comp = COMP_MNEMONICS.get((word >> 6) & 0x7F)
+    if comp is None or (word & 0xE000) != 0xE000:
+        raise ValueError('Invalid instruction {0:016b}.'.format(word))
+    dest = DEST_MNEMONICS[(word >> 3) & 0x7]
+    jump = JUMP_MNEMONICS[word & 0x7]
+    return (dest+'=' if dest else '')+comp+(';'+jump if jump else '')
+
+
+def c_instruction_source(word, indent='    '):
+    """
+    Generates Python statements executing the C-instruction on the locals
+    a, d, ram; if the instruction jumps, the result of the computation is left in v.
+    output:
+        (list of statements, jump condition or None)
+    """
+    comp = COMP_MNEMONICS.get((word >> 6) & 0x7F)
+    if comp is None or (word & 0xE000) != 0xE000:
+        raise ValueError('Invalid instruction {0:016b}.'.format(word))
+    dest = DEST_MNEMONICS[(word >> 3) & 0x7] or ''
+    jump = JUMP_MNEMONICS[word & 0x7]
+
+    if 'M' in comp:
+        expression = _COMP_EXPRESSIONS[comp.replace('M', 'A')].format(x='ram[a]')
+    else:
+        expression = _COMP_EXPRESSIONS[comp].format(x='a')
+    targets = [{'M': 'ram[a]', 'D': 'd', 'A': 'a'}[register] for register in dest]
+    if jump is None and len(targets) == 1:
+        return [indent+targets[0]+' = '+expression], None
+    lines = ['v = '+expression]
+    if 'M' in dest:
+        lines.append('ram[a] = v')      # uses the A register before its update
+    if 'D' in dest:
+        lines.append('d = v')
+    if 'A' in dest:
+        lines.append('a = v')
+    return [indent+line for line in lines], (_JUMP_CONDITIONS[jump] if jump else None)
+
+
+_c_functions = {}
+
+def decode_c(word):
+    """
+    Compiles the C-instruction into a function (a, d, pc, ram) -> (a, d, pc).
+    The functions are shared by all the equal words.
+    """
+    function = _c_functions.get(word)
+    if function is None:
+        lines, condition = c_instruction_source(word)
+        source = 'def c_{0:016b}(a, d, pc, ram):\n'.format(word)
+        if condition is None:
+            source += '\n'.join(lines)+'\n    return a, d, pc+1\n'
+        else:
+            # the jump target is the A register before its update
+            source += '    target = a\n'+'\n'.join(lines)+'\n'
+            source += '    return a, d, (target if {} else pc+1)\n'.format(condition)
+        namespace = {}
+        exec(source, namespace)
+        function = _c_functions[word] = namespace['c_{0:016b}'.format(word)]
+    return function
+
+# ========================= HackCPU CLASS
+
+class HackCPU(object):
+    """
+    Emulator of the Hack computer. Every ROM word is decoded once when the
+    program is loaded: an A-instruction into its int value, a C-instruction
+    into a small function shared by all the equal words.
+    """
+    def __init__(self, rom):
+        """
+        input:
+            rom         -sequence of the ROM words (ints)
+        """
+        self.rom = array('H', rom)
+        self._decoded = [word if word < 0x8000 else decode_c(word) for word in self.rom]
+        self.ram = array('H', bytes(2*RAM_SIZE))
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+
+    def reset(self):
+        """
+        Resets the registers and the cycle counter; the RAM is kept as by the Hack reset button.
+        """
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+
+    def peek(self, address):
+        """
+        Returns RAM[address] as a signed 16-bit value.
+        """
+        value = self.ram[address]
+        return value-0x10000 if value & 0x8000 else value
+
+    def poke(self, address, value):
+        """
+        Sets RAM[address]; the value may be signed.
+        """
+        self.ram[address] = value & 0xFFFF
+
+    def set_key(self, key_code):
+        """
+        Sets the currently pressed key (0 for none).
+        """
+        self.ram[KBD] = key_code
+
+    def run(self, max_cycles):
+        """
+        Executes at most max_cycles instructions; stops earlier if the PC leaves the ROM.
+        output:
+            number of executed instructions
+        """
+        rom = self._decoded
+        ram = self.ram
+        a, d, pc = self.a, self.d, self.pc
+        n_rom = len(rom)
+        cycles = 0
+        try:
+            while cycles < max_cycles and pc < n_rom:
+                instruction = rom[pc]
+                if instruction.__class__ is int:
+                    a = instruction
+                    pc += 1
+                else:
+                    a, d, pc = instruction(a, d, pc, ram)
+                cycles += 1
+        except IndexError:
+            raise IndexError('Address {} outside of the RAM at ROM[{}].'.format(a, pc))
+        finally:
+            self.a, self.d, self.pc = a, d, pc
+            self.cycles += cycles
+        return cycles
@@ -0,0 +1,201 @@
+import os.path
+from sys import argv
+
+from Parser import Parser, Instruction
+
+# ========================= AsmOptimiser CLASS
+
+def to_asm(instruction):
+    """
+    Renders an Instruction as a line of Hack Assembly (without the new line character).
+    """
+    if instruction.type == 'A':
+        return '@'+instruction.adrs
+    elif instruction.type == 'JS':
+        return '('+instruction.key+')'
+    code = instruction.comp
+    if instruction.dest:
+        code = instruction.dest+'='+code
+    if instruction.jump:
+        code += ';'+instruction.jump
+    return code
+
+
+def _signature(instruction):
+    """
+    Returns a tuple identifying the instruction, used for matching patterns.
+    """
+    if instruction.type == 'A':
+        return ('A', instruction.adrs)
+    elif instruction.type == 'JS':
+        return ('JS', instruction.key)
+    return ('C', instruction.dest, instruction.comp, instruction.jump)
+
+
+def _c(dest, comp, jump=None):
+    return Instruction('C', None, None, dest, comp, jump)
+
+# push D (_D_to_stack of the VM translator) immediately followed by pop to D (_stack_to_D)
+PUSH_POP = [('A', 'SP'), ('C', 'AM', 'M+1', None), ('C', 'A', 'A-1', None), ('C', 'M', 'D', None),
+            ('A', 'SP'), ('C', 'AM', 'M-1', None), ('C', 'D', 'M', None)]
+
+D_WINDOW = 8        # how far dead_d looks for the next write to D
+
+
+class AsmOptimiser(object):
+    """
+    Peephole optimiser of Hack Assembly. Works on a sliding window of parsed
+    instructions and repeats its passes until nothing changes. The patterns:
+      push_pop      -push of D followed by pop to D leaves D and the stack as
+                     they were; the sequence is dropped, or replaced by
+                     '@SP, A=M' if the next instruction may use A
+      repeated_load -'@X' when A is known to hold X already
+      dead_load     -'@X' immediately followed by another A-instruction
+      dead_d        -'D=...' (no jump) whose value is overwritten before it is read
+    A rewrite never spans a jump symbol, and the known value of A is forgotten
+    at every jump symbol, so the rewritten code is equivalent whichever way a
+    jump symbol is reached. The word at and above the stack pointer is dead by
+    the VM stack discipline, push_pop does not write it.
+    Removing instructions moves the code, which is only safe if all the jump
+    targets are symbolic; programs loading a number right before a jump are
+    left untouched.
+    """
+    PATTERNS = ['push_pop', 'repeated_load', 'dead_load', 'dead_d']
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Resets the hit counts.
+        """
+        self.hits = {pattern: 0 for pattern in self.PATTERNS}
+        self.skipped = False
+
+    def optimise(self, instructions, file_lines=None):
+        """
+        input:
+            instructions    -list of Instructions (including jump symbols)
+            file_lines      -file lines of the instructions, used for reporting errors
+        output:
+            (optimised list of Instructions, their file lines); an instruction
+            replacing a sequence gets the file line of its first instruction
+        """
+        file_lines = list(file_lines) if file_lines is not None else [None]*len(instructions)
+        if self._has_numeric_jumps(instructions):
+            self.skipped = True
+            return list(instructions), file_lines
+        while True:
+            hits = sum(self.hits.values())
+            instructions, file_lines = self._pass(instructions, file_lines)
+            if sum(self.hits.values()) == hits:
+                return instructions, file_lines
+
+    def _has_numeric_jumps(self, instructions):
+        """
+        Checks for jumps to numeric addresses, i.e. '@123' followed by a jump instruction.
+        """
+        for previous, instruction in zip(instructions, instructions[1:]):
+            if instruction.type == 'C' and instruction.jump and previous.type == 'A' and previous.adrs.isdigit():
+                return True
+        return False
+
+    def _d_is_dead(self, instructions, start):
+        """
+        Checks whether the value of D is overwritten before it is read,
+        looking at most D_WINDOW instructions ahead from start.
+        """
+        for instruction in instructions[start:start+D_WINDOW]:
+            if instruction.type == 'JS':
+                return False
+            elif instruction.type == 'A':
+                continue
+            elif 'D' in instruction.comp or instruction.jump:
+                return False        # D is read, or may be live at the jump target
+            elif instruction.dest and 'D' in instruction.dest:
+                return True
+        return False
+
+    def _pass(self, instructions, file_lines):
+        """
+        Runs one pass of all the patterns over the instructions.
+        output:
+            (list of Instructions, their file lines)
+        """
+        output, output_lines = [], []
+        known_a = None      # the symbol/number A is known to hold
+        n = len(instructions)
+        i = 0
+        while i < n:
+            instruction = instructions[i]
+
+            if [_signature(ins) for ins in instructions[i:i+len(PUSH_POP)]] == PUSH_POP:
+                self.hits['push_pop'] += 1
+                i += len(PUSH_POP)
+                following = instructions[i] if i < n else None
+                if following is None or following.type != 'A':
+                    output.append(Instruction('A', None, 'SP', None, None, None))
+                    output.append(_c('A', 'M'))
+                    output_lines += [file_lines[i-len(PUSH_POP)]]*2
+                    known_a = None
+                continue
+
+            if instruction.type == 'A':
+                if instruction.adrs == known_a:
+                    self.hits['repeated_load'] += 1
+                    i += 1
+                    continue
+                if i+1 < n and instructions[i+1].type == 'A':
+                    self.hits['dead_load'] += 1
+                    i += 1
+                    continue
+                known_a = instruction.adrs
+            elif instruction.type == 'JS':
+                known_a = None
+            else:
+                if instruction.dest == 'D' and not instruction.jump and self._d_is_dead(instructions, i+1):
+                    self.hits['dead_d'] += 1
+                    i += 1
+                    continue
+                if instruction.dest and 'A' in instruction.dest:
+                    known_a = None
+            output.append(instruction)
+            output_lines.append(file_lines[i])
+            i += 1
+        return output, output_lines
+
+
+def parse_file(path):
+    """
+    Parses an '.asm' file.
+    output:
+        list of Instructions (including jump symbols)
+    """
+    parser = Parser()
+    src_file = open(path, 'r')
+    instructions = [parsed for parsed in map(parser.parse, src_file) if parsed]
+    src_file.close()
+    return instructions
+
+
+if __name__ == "__main__":
+    # usage: AsmOptimiser.py file.asm [output.asm]
+    path = argv[1]
+    if not os.path.isfile(path) or not path.endswith('.asm'):
+        raise ValueError("Provided argument is not an '.asm' file.")
+    dst_path = argv[2] if len(argv) > 2 else path[:-len('.asm')]+'.opt.asm'
+
+    instructions = parse_file(path)
+    optimiser = AsmOptimiser()
+    optimised, _ = optimiser.optimise(instructions)
+
+    dst_file = open(dst_path, 'w')
+    dst_file.write(''.join(to_asm(instruction)+'\n' for instruction in optimised))
+    dst_file.close()
+
+    if optimiser.skipped:
+        print('Jumps to numeric addresses found, the program was not optimised.')
+    count = lambda instructions: sum(1 for instruction in instructions if instruction.type != 'JS')
+    print('{} -> {} instructions'.format(count(instructions), count(optimised)))
+    for pattern in optimiser.PATTERNS:
+        print('  {0:<14} {1}'.format(pattern, optimiser.hits[pattern]))
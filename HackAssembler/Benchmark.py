@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+
+from Parser import Parser
+from CodeGenerator import CodeGenerator
+from HackAssembler import VERSION, assemble, assemble_streaming, parse_source, resolve_symbols, encode_commands, write_code
+from BulkAssembler import assemble_bulk, np
+
+# ========================= Assembler benchmark
+#
+# Generates synthetic Hack programs, times the phases of the assembler
+# separately, and stores the results as JSON. Results of two runs (e.g. of two
+# versions of the assembler) can be compared with --compare.
+
+ROM_SIZE = 32768
+
+C_INSTRUCTIONS = [
+    'D=A', 'D=M', 'M=D', 'A=M', 'AM=M+1', 'AM=M-1', 'A=A-1', 'M=D+M', 'M=M-D',
+    'D=D+A', 'D=M-D', 'M=-M', 'M=!M', 'D=D|M', 'D=D&M', 'M=0', 'M=M+1', 'MD=M-1',
+]
+JUMPS = ['0;JMP', 'D;JEQ', 'D;JNE', 'D;JGT', 'D;JLT', 'D;JGE', 'D;JLE']
+
+
+def generate_program(n_instructions, label_density=0.02, variable_density=0.1, seed=0):
+    """
+    Generates a synthetic Hack program.
+    input:
+        n_instructions   -number of the instructions (may exceed the ROM size)
+        label_density    -number of jump symbols per instruction; also the
+                          fraction of the A-instructions referring to a jump symbol
+        variable_density -fraction of the A-instructions referring to a variable
+        seed             -seed of the random generator
+    output:
+        list of lines (including comments and empty lines)
+    """
+    rnd = random.Random(seed)
+    n_labels = max(1, int(n_instructions*label_density))
+    n_variables = max(1, int(n_instructions*variable_density/10))
+    label_positions = set(rnd.sample(range(n_instructions), min(n_labels, n_instructions)))
+
+    lines = ['// synthetic program: {} instructions, label density {}, variable density {}'
+             .format(n_instructions, label_density, variable_density)]
+    label = 0
+    cmd_line = 0
+    while cmd_line < n_instructions:
+        if cmd_line in label_positions:
+            lines.append('(LABEL_{})'.format(label))
+            label += 1
+        r = rnd.random()
+        if r < label_density and cmd_line+1 < n_instructions:
+            lines.append('@LABEL_{}'.format(rnd.randrange(n_labels)))
+            lines.append(rnd.choice(JUMPS))
+            cmd_line += 2
+            continue
+        elif r < label_density+variable_density:
+            lines.append('@var_{}'.format(rnd.randrange(n_variables)))
+        elif r < 0.5:
+            lines.append('@{}'.format(rnd.randrange(ROM_SIZE)))
+        else:
+            lines.append(rnd.choice(C_INSTRUCTIONS))
+        if rnd.random() < 0.05:
+            lines[-1] += '   // comment'
+        if rnd.random() < 0.05:
+            lines.append('')
+        cmd_line += 1
+    # labels which did not get a position (e.g. at the very end)
+    while label < n_labels:
+        lines.append('(LABEL_{})'.format(label))
+        label += 1
+    return [line+'\n' for line in lines]
+
+
+def time_phases(src_path, dst_path):
+    """
+    Assembles the file with the phase functions of assemble, timing each of them.
+    output:
+        dictionary phase: seconds
+    """
+    times = {}
+    parser = Parser()
+    generator = CodeGenerator()
+
+    start = time.perf_counter()
+    parsed_lines, file_lines, jump_symbs = parse_source(src_path, parser)
+    times['parse'] = time.perf_counter()-start
+
+    start = time.perf_counter()
+    resolve_symbols(jump_symbs, generator)
+    times['resolve'] = time.perf_counter()-start
+
+    start = time.perf_counter()
+    code = encode_commands(parsed_lines, file_lines, generator)
+    times['encode'] = time.perf_counter()-start
+
+    start = time.perf_counter()
+    write_code(dst_path, code)
+    times['write'] = time.perf_counter()-start
+
+    times['total'] = sum(times.values())
+    return times
+
+
+def time_backends(src_path, dst_path):
+    """
+    Times the assembler backends end to end.
+    output:
+        dictionary backend: seconds; None if the backend refuses the program
+        (e.g. the addresses over 15 bits of a program larger than the ROM)
+    """
+    backends = {'default': assemble, 'stream': assemble_streaming}
+    if np is not None:
+        backends['bulk'] = assemble_bulk
+    times = {}
+    for name, backend in backends.items():
+        start = time.perf_counter()
+        try:
+            backend(src_path, dst_path)
+        except ValueError:
+            times[name] = None
+            continue
+        times[name] = time.perf_counter()-start
+    return times
+
+
+def run_benchmark(sizes, label_density, variable_density, repeat=3, seed=0):
+    """
+    Runs the benchmark; every measurement is the best of repeat runs.
+    output:
+        dictionary with the environment and the results
+    """
+    work_dir = tempfile.mkdtemp(prefix='hack_benchmark_')
+    runs = []
+    try:
+        for size in sizes:
+            src_path = os.path.join(work_dir, 'Synthetic{}.asm'.format(size))
+            dst_path = os.path.join(work_dir, 'Synthetic{}.hack'.format(size))
+            src_file = open(src_path, 'w')
+            src_file.writelines(generate_program(size, label_density, variable_density, seed))
+            src_file.close()
+
+            phases, backends = {}, {}
+            for _ in range(repeat):
+                for phase, seconds in time_phases(src_path, dst_path).items():
+                    phases[phase] = min(seconds, phases.get(phase, seconds))
+                for backend, seconds in time_backends(src_path, dst_path).items():
+                    backends[backend] = None if seconds is None else min(seconds, backends.get(backend) or seconds)
+            runs.append({
+                'instructions': size,
+                'label_density': label_density,
+                'variable_density': variable_density,
+                'phases': phases,
+                'backends': backends,
+                'instructions_per_second': size/phases['total'] if phases['total'] else None,
+            })
+    finally:
+        shutil.rmtree(work_dir)
+
+    return {
+        'assembler_version': VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': repeat,
+        'seed': seed,
+        'runs': runs,
+    }
+
+
+def print_results(results, baseline=None):
+    """
+    Prints the results; if a baseline is given, prints the ratio of the times
+    (current/baseline) for the runs of the same size.
+    """
+    baseline_runs = {}
+    if baseline is not None:
+        baseline_runs = {run['instructions']: run for run in baseline['runs']}
+        print('compared with assembler version {} ({})'.format(baseline['assembler_version'], baseline['timestamp']))
+    for run in results['runs']:
+        print('{} instructions:'.format(run['instructions']))
+        old = baseline_runs.get(run['instructions'])
+        for group in ['phases', 'backends']:
+            for name, seconds in run[group].items():
+                if seconds is None:
+                    print('  {0:<10}       n/a'.format(name))
+                    continue
+                line = '  {0:<10} {1:9.4f} s'.format(name, seconds)
+                if old is not None and old[group].get(name):
+                    line += '  x{0:.2f}'.format(seconds/old[group][name])
+                print(line)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Benchmarks the Hack assembler on synthetic programs.')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, ROM_SIZE, 4*ROM_SIZE],
+                            help='numbers of instructions of the generated programs')
+    arg_parser.add_argument('--label-density', type=float, default=0.02)
+    arg_parser.add_argument('--variable-density', type=float, default=0.1)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--output', help='JSON file to store the results in')
+    arg_parser.add_argument('--compare', help='JSON file with results to compare with')
+    arg_parser.add_argument('--emit', help="only write the program of the first size to this '.asm' file")
+    args = arg_parser.parse_args()
+
+    if args.emit:
+        dst_file = open(args.emit, 'w')
+        dst_file.writelines(generate_program(args.sizes[0], args.label_density, args.variable_density, args.seed))
+        dst_file.close()
+    else:
+        results = run_benchmark(args.sizes, args.label_density, args.variable_density, args.repeat, args.seed)
+        baseline = None
+        if args.compare:
+            compare_file = open(args.compare, 'r')
+            baseline = json.load(compare_file)
+            compare_file.close()
+        print_results(results, baseline)
+        if args.output:
+            output_file = open(args.output, 'w')
+            json.dump(results, output_file, indent=2)
+            output_file.close()
@@ -0,0 +1,175 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from CodeGenerator import CodeGenerator
+from HackBinary import pack_header
+
+# ========================= Bulk (vectorised) assembler backend
+
+def _int_table(table):
+    """
+    Converts a table of binary strings into a table of ints.
+    """
+    return {key: int(value, 2) for key, value in table.items()}
+
+
+def _factorise(values):
+    """
+    Finds the unique values.
+    input:
+        values      -list of hashable values
+    output:
+        (uniq, inverse) -list of the unique values in the order of their first
+                         appearance, and int array such that uniq[inverse[i]] == values[i]
+    """
+    index = {}
+    inverse = np.fromiter((index.setdefault(value, len(index)) for value in values),
+                          dtype=np.int64, count=len(values))
+    return list(index), inverse
+
+
+def _encode_c(string, comp_table, dest_table, jump_table):
+    """
+    Encodes a single C-instruction 'dest=comp;jump'.
+    output:
+        the word, or a string naming the invalid part of the command
+    """
+    rest, semicolon, jump = string.partition(';')
+    dest, equals, comp = rest.partition('=')
+    if not equals:
+        dest, comp = None, rest
+    if not semicolon:
+        jump = None
+    if   comp not in comp_table: return 'comp'
+    elif dest not in dest_table: return 'dest'
+    elif jump not in jump_table: return 'jump'
+    return 0xE000 | (comp_table[comp] << 6) | (dest_table[dest] << 3) | jump_table[jump]
+
+
+def encode_bulk(lines):
+    """
+    Assembles all the lines at once. Every distinct symbol and every distinct
+    C-instruction is resolved only once, the words are then gathered and
+    combined as integer arrays.
+    input:
+        lines       -list of lines of the '.asm' file
+    output:
+        uint16 array of the ROM words
+    """
+    if np is None:
+        raise ImportError("The bulk assembler backend requires NumPy.")
+
+    generator = CodeGenerator()
+    comp_table = _int_table(generator.comp_table)
+    dest_table = _int_table(generator.dest_table)
+    jump_table = _int_table(generator.jump_table)
+    symb_table = _int_table(generator.symb_table)
+
+    # remove spaces, comments, and empty lines; keep the file lines for the error messages
+    strings = [line.replace(' ', '').partition('//')[0] for line in lines]
+    file_lines = [file_line for file_line, string in enumerate(strings) if string]
+    cmds = [strings[file_line] for file_line in file_lines]
+    if not cmds:
+        return np.zeros(0, dtype=np.uint16)
+
+    # classify the lines and compute the command line of every line
+    first = np.frombuffer(''.join([cmd[0] for cmd in cmds]).encode('utf-32-le'), dtype='<u4')
+    is_label = first == ord('(')
+    is_a = first == ord('@')
+    is_c = ~(is_label | is_a)
+    is_cmd = ~is_label
+    cmd_line = np.cumsum(is_cmd) - is_cmd   # for a jump symbol it is the next command line
+    words = np.zeros(int(is_cmd.sum()), dtype=np.uint16)
+
+    # jump symbols
+    for idx in np.flatnonzero(is_label).tolist():
+        string = cmds[idx]
+        end = string.find(')')
+        if end == -1:
+            raise SyntaxError("Missing ')' in the Jump symbol on the line {}.".format(file_lines[idx]))
+        key = string[1:end]
+        if key in symb_table:
+            raise ValueError("Jump symbol {0} already in the table. File line: {1}.".format(key, file_lines[idx]))
+        symb_table[key] = int(cmd_line[idx])
+
+    # A-instructions; new variables get addresses in the order of their first use
+    a_idx = np.flatnonzero(is_a)
+    if len(a_idx):
+        uniq, inverse = _factorise([cmds[idx][1:] for idx in a_idx.tolist()])
+        addresses = np.zeros(len(uniq), dtype=np.int64)
+        next_symbol_address = generator.next_symbol_address
+        for u, key in enumerate(uniq):
+            if key.isdigit():
+                addresses[u] = int(key)
+            elif key in symb_table:
+                addresses[u] = symb_table[key]
+            else:
+                addresses[u] = next_symbol_address
+                next_symbol_address += 1
+        if addresses.max() > 0x7FFF:
+            first = int(np.argmax(addresses[inverse] > 0x7FFF))
+            key, file_line = uniq[inverse[first]], file_lines[a_idx[first]]
+            if key.isdigit():
+                raise ValueError("Address does not fit into 15 bits. File line: {}.".format(file_line))
+            raise ValueError("Address of the symbol {} does not fit into 15 bits. Address: {}. File line: {}."
+                             .format(key, int(addresses[inverse[first]]), file_line))
+        words[cmd_line[a_idx]] = addresses[inverse]
+
+    # C-instructions: dest=comp;jump
+    c_idx = np.flatnonzero(is_c)
+    if len(c_idx):
+        uniq, inverse = _factorise([cmds[idx] for idx in c_idx.tolist()])
+        codes = np.zeros(len(uniq), dtype=np.int64)
+        for u, string in enumerate(uniq):
+            code = _encode_c(string, comp_table, dest_table, jump_table)
+            if isinstance(code, str):
+                # the unique values are in the order of appearance, i.e. this is the first invalid line
+                bad = c_idx[np.argmax(inverse == u)]
+                raise SyntaxError('Invalid {} part of the command. File line: {}.'.format(code, file_lines[bad]))
+            codes[u] = code
+        words[cmd_line[c_idx]] = codes[inverse]
+
+    return words
+
+
+def words_to_text(words):
+    """
+    Renders the ROM words as the lines of a '.hack' file.
+    output:
+        bytes
+    """
+    shifts = np.arange(15, -1, -1, dtype=np.uint16)
+    text = np.full((len(words), 17), ord('\n'), dtype=np.uint8)
+    text[:, :16] = ((words[:, None] >> shifts) & 1) + ord('0')
+    return text.tobytes()
+
+
+def words_to_binary(words):
+    """
+    Renders the ROM words as a '.hackbin' file.
+    output:
+        bytes
+    """
+    return pack_header(len(words)) + words.astype('<u2').tobytes()
+
+
+def assemble_bulk(src_path, dst_path, binary=False):
+    """
+    Assembles the file with the vectorised backend.
+    input:
+        src_path    -path to the '.asm' file
+        dst_path    -path to the '.hack' file, or to the '.hackbin' file if binary
+        binary      -write packed binary words instead of text
+    output:
+        number of the ROM words
+    """
+    src_file = open(src_path, 'r')
+    words = encode_bulk(src_file.read().split('\n'))
+    src_file.close()
+
+    dst_file = open(dst_path, 'wb')
+    dst_file.write(words_to_binary(words) if binary else words_to_text(words))
+    dst_file.close()
+    return len(words)
@@ -0,0 +1,133 @@
+import os
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from Parser import Parser
+from CodeGenerator import CodeGenerator
+from HackBinary import pack_header
+
+# ========================= Chunk-parallel assembler
+#
+# Phase 1 parses the chunks of lines in parallel; every chunk reports its parsed
+# commands, its jump symbols relative to the chunk, its number of commands, and
+# the symbols in the order of their first use.
+# The jump symbols are then fixed up with the prefix sum of the numbers of
+# commands, and the variables get addresses in the order of their first use
+# over the whole file, exactly as in the serial assembler.
+# Phase 2 encodes the chunks in parallel with the complete symbol table.
+
+def _parse_chunk(lines, first_file_line):
+    """
+    Parses a chunk of lines.
+    input:
+        lines           -list of lines of the chunk
+        first_file_line -file line of the first line of the chunk
+    output:
+        (commands, file lines of the commands, jump symbols, number of commands,
+         symbols in the order of their first use)
+    """
+    parser = Parser()
+    parser.prev_file_line = first_file_line-1
+
+    commands, file_lines, jump_symbs, used_symbs = [], array('I'), [], {}
+    for line in lines:
+        parsed_line = parser.parse(line)
+        if not parsed_line:
+            continue
+        elif parsed_line.type == 'JS':
+            jump_symbs.append((parsed_line.key, parsed_line.adrs, parser.prev_file_line))
+        else:
+            commands.append(parsed_line)
+            file_lines.append(parser.prev_file_line)
+            if parsed_line.type == 'A' and not parsed_line.adrs.isdigit():
+                used_symbs.setdefault(parsed_line.adrs, None)
+    return commands, file_lines, jump_symbs, len(commands), list(used_symbs)
+
+
+def _encode_chunk(commands, file_lines, symb_table, binary):
+    """
+    Encodes the parsed commands of a chunk.
+    input:
+        commands        -parsed commands of the chunk
+        file_lines      -file lines of the commands
+        symb_table      -complete symbol table, i.e. including all the variables
+        binary          -return packed words instead of text
+    output:
+        bytes
+    """
+    generator = CodeGenerator()
+    generator.symb_table = symb_table
+    output_lines = [generator.generate_code(parsed_line, file_line)
+                    for parsed_line, file_line in zip(commands, file_lines)]
+    if binary:
+        words = array('H', [int(output_line, 2) for output_line in output_lines])
+        if sys.byteorder != 'little':
+            words.byteswap()
+        return words.tobytes()
+    if not output_lines:
+        return b''
+    return ('\n'.join(output_lines)+'\n').encode()
+
+
+def _split(lines, n_chunks):
+    """
+    Splits the lines into at most n_chunks chunks of consecutive lines.
+    output:
+        list of (chunk lines, file line of the first line)
+    """
+    size = max(1, -(-len(lines)//n_chunks))
+    return [(lines[start:start+size], start) for start in range(0, len(lines), size)]
+
+
+def assemble_chunked(src_path, dst_path, binary=False, jobs=None, executor=None):
+    """
+    Assembles a single file in parallel chunks; the output is identical to the
+    output of the serial assembler.
+    input:
+        src_path    -path to the '.asm' file
+        dst_path    -path to the '.hack' file, or to the '.hackbin' file if binary
+        binary      -write packed binary words instead of text
+        jobs        -number of the worker processes (and chunks), None for the number of CPUs
+        executor    -executor to use, a new process pool is created if None
+    output:
+        number of the ROM words
+    """
+    src_file = open(src_path, 'r')
+    lines = src_file.readlines()
+    src_file.close()
+
+    jobs = jobs or os.cpu_count() or 1
+    chunks = _split(lines, jobs)
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+
+    try:
+        # phase 1: parse
+        parsed = list(executor.map(_parse_chunk, [c[0] for c in chunks], [c[1] for c in chunks]))
+
+        # fix up the jump symbols and allocate the variables
+        generator = CodeGenerator()
+        cmd_offset = 0
+        for _, _, jump_symbs, n_cmds, _ in parsed:
+            for key, adrs, file_line in jump_symbs:
+                generator.add_jump_symb(key=key, value=cmd_offset+adrs, file_line=file_line)
+            cmd_offset += n_cmds
+        for _, _, _, _, used_symbs in parsed:
+            for key in used_symbs:
+                generator.add_adrs_symb(key)
+
+        # phase 2: encode
+        encoded = executor.map(_encode_chunk, [p[0] for p in parsed], [p[1] for p in parsed],
+                               [generator.symb_table]*len(parsed), [binary]*len(parsed))
+        dst_file = open(dst_path, 'wb')
+        if binary:
+            dst_file.write(pack_header(cmd_offset))
+        for output in encoded:
+            dst_file.write(output)
+        dst_file.close()
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return cmd_offset
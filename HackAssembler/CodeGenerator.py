@@ -87,10 +87,15 @@ class CodeGenerator(object):
         "SCREEN": '{0:015b}'.format(16384),
         "KBD":    '{0:015b}'.format(24576),
         }
+        self._predefined_symbs = dict(self.symb_table)
 
 
     def reset(self):
+        """
+        Resets the symbol table to the predefined symbols.
+        """
         self.next_symbol_address = 16
+        self.symb_table = dict(self._predefined_symbs)
 
 
     def add_jump_symb(self, key, value, file_line=None):
@@ -104,24 +109,32 @@ class CodeGenerator(object):
             self.symb_table[key] = '{0:015b}'.format(self.next_symbol_address)
             self.next_symbol_address += 1
 
-    def generate_code(self, parsed_input):
+    def generate_code(self, parsed_input, file_line=None):
         """
-        input:                [ 0     1    2     3     4     5        6    ]
-            parsed_input    - [type, key, adrs, dest, comp, jump, file_line]
+        input:
+            parsed_input    - Instruction of type 'A' or 'C'
+            file_line       - file line of the instruction (used for reporting errors)
         """
-        if parsed_input[0] == 'A':
-            if parsed_input[2].isdigit():
-                return "0"+'{0:015b}'.format(int(parsed_input[2]))
+        if parsed_input.type == 'A':
+            if parsed_input.adrs.isdigit():
+                address = int(parsed_input.adrs)
+                if address > 0x7fff:
+                    raise ValueError("Address does not fit into 15 bits. File line: {}.".format(file_line))
+                return "0"+'{0:015b}'.format(address)
             else:
-                self.add_adrs_symb(parsed_input[2], parsed_input[6])
-                return "0"+self.symb_table[parsed_input[2]]
+                self.add_adrs_symb(parsed_input.adrs, file_line)
+                address = self.symb_table[parsed_input.adrs]
+                if len(address) != 15:
+                    raise ValueError("Address of the symbol {} does not fit into 15 bits. Address: {}. File line: {}."
+                                     .format(parsed_input.adrs, int(address, 2), file_line))
+                return "0"+address
 
-        elif parsed_input[0] == 'C':
-            if parsed_input[4] not in self.comp_table:
-                raise SyntaxError('Invalid comp part of the command. File line: {}.'.format(parsed_input[6]))
-            elif parsed_input[3] not in self.dest_table:
-                raise SyntaxError('Invalid dest part of the command. File line: {}.'.format(parsed_input[6]))
-            elif parsed_input[5] not in self.jump_table:
-                raise SyntaxError('Invalid jump part of the command. File line: {}.'.format(parsed_input[6]))
+        elif parsed_input.type == 'C':
+            if parsed_input.comp not in self.comp_table:
+                raise SyntaxError('Invalid comp part of the command. File line: {}.'.format(file_line))
+            elif parsed_input.dest not in self.dest_table:
+                raise SyntaxError('Invalid dest part of the command. File line: {}.'.format(file_line))
+            elif parsed_input.jump not in self.jump_table:
+                raise SyntaxError('Invalid jump part of the command. File line: {}.'.format(file_line))
             else:
-                return "111"+self.comp_table[parsed_input[4]] +self.dest_table[parsed_input[3]] +self.jump_table[parsed_input[5]]
+                return "111"+self.comp_table[parsed_input.comp] +self.dest_table[parsed_input.dest] +self.jump_table[parsed_input.jump]
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import tempfile
+
+# ========================= ContentCache CLASS
+
+DEFAULT_CACHE_DIR = os.environ.get('HACK_CACHE_DIR',
+                                   os.path.join(os.path.expanduser('~'), '.cache', 'nand2tetris'))
+DEFAULT_MAX_BYTES = 64*1024*1024
+
+
+class ContentCache(object):
+    """
+    Persistent on-disk cache mapping a key (a hash of the content that
+    determines the output) to the output bytes. Every entry is one file; the
+    least recently used entries are evicted once the total size exceeds the limit.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        input:
+            cache_dir   -directory of the cache, created if missing
+            max_bytes   -upper bound of the total size of the entries
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None           # estimated total size of the entries, None until scanned
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        """
+        Computes the key from the parts (str or bytes) determining the output.
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode()
+            digest.update(len(part).to_bytes(8, 'little'))     # separates the parts
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """
+        Returns the cached bytes, or None if the key is not in the cache.
+        """
+        path = self._path(key)
+        try:
+            entry = open(path, 'rb')
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        data = entry.read()
+        entry.close()
+        try:
+            os.utime(path)          # marks the entry as recently used
+        except FileNotFoundError:
+            pass                    # evicted by another process meanwhile
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """
+        Stores the bytes under the key and evicts the least recently used entries if needed.
+        """
+        if len(data) > self.max_bytes:
+            return
+        handle, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp')
+        with os.fdopen(handle, 'wb') as entry:
+            entry.write(data)
+        os.replace(tmp_path, self._path(key))       # atomic, other processes never see a partial entry
+        # the directory is scanned only when the estimate (never too low for
+        # this process) may exceed the limit, not on every put
+        if self._size is None or self._size+len(data) > self.max_bytes:
+            self._size = self._evict()
+        else:
+            self._size += len(data)
+
+    def _evict(self):
+        """
+        Removes the least recently used entries until the total size is within the limit.
+        output:
+            total size of the remaining entries
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith('.tmp'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+    def clear(self):
+        """
+        Removes all the entries.
+        """
+        for entry in os.scandir(self.cache_dir):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        self._size = None
+
+    def stats(self):
+        """
+        Returns the dictionary of hits, misses and evictions of this instance.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -1,45 +1,389 @@
+import argparse
+import glob
 import os.path
-from sys import argv
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 
 from Parser import Parser
 from CodeGenerator import CodeGenerator
+from HackBinary import HEADER_SIZE, WORD, pack_header, unpack_header, write_hackbin
+from BulkAssembler import assemble_bulk
+from ChunkAssembler import assemble_chunked
+from ContentCache import ContentCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from AsmOptimiser import AsmOptimiser
 
-# ========================= Parser CLASS
+VERSION = '1.2'     # part of the cache keys: 1.1 cached the corrupt words of addresses over 15 bits
 
-if __name__ == "__main__":
-
-    path = argv[1]
-    if not os.path.isfile(path):
-        raise ValueError("Provided argument is not a file.")
-    if not path.endswith('.asm'):
-        raise ValueError("The file has to end with '.asm' extension.")
-
-    path, src_file = os.path.split(path)
-    f_name = src_file.split('.')[0]
-    dst_file = f_name+'.hack'
-
-    src_file = open(os.path.join(path, src_file), 'r')
-    dst_file = open(os.path.join(path, dst_file), 'w+')
-
-    parser = Parser()
-    generator = CodeGenerator()
+# ========================= Assembler functions
 
+def parse_source(src_path, parser):
+    """
+    First pass of assemble: parses the file.
+    input:
+        src_path    -path to the '.asm' file
+        parser      -Parser, reset by the caller
+    output:
+        (parsed commands, their file lines, list of (jump symbol, its file line))
+    """
+    src_file = open(src_path, 'r')
     parsed_lines = []
+    file_lines = array('I')     # file lines of the parsed lines, used for reporting errors
+    jump_symbs = []
     src_line = src_file.readline()
 
     while src_line:
         parsed_line = parser.parse(src_line)
-        if parsed_line[0]:
-            if parsed_line[0] == 'JS':
-                generator.add_jump_symb(key=parsed_line[1], value=parsed_line[2], file_line=parsed_line[6])
+        if parsed_line:
+            if parsed_line.type == 'JS':
+                jump_symbs.append((parsed_line, parser.prev_file_line))
             else:
                 parsed_lines.append(parsed_line)
+                file_lines.append(parser.prev_file_line)
         src_line = src_file.readline()
+    src_file.close()
+    return parsed_lines, file_lines, jump_symbs
+
 
+def resolve_symbols(jump_symbs, generator):
+    """
+    Adds the jump symbols to the symbol table; the variables get their
+    addresses when they are encoded.
+    """
+    for parsed_line, file_line in jump_symbs:
+        generator.add_jump_symb(key=parsed_line.key, value=parsed_line.adrs, file_line=file_line)
 
-    for parsed_line in parsed_lines:
-        output_line = generator.generate_code(parsed_line)
+
+def encode_commands(parsed_lines, file_lines, generator, binary=False):
+    """
+    Second pass of assemble: generates the code of the parsed commands.
+    output:
+        array of the ROM words if binary, list of the code lines otherwise
+    """
+    if binary:
+        words = array('H')
+        for parsed_line, file_line in zip(parsed_lines, file_lines):
+            words.append(int(generator.generate_code(parsed_line, file_line), 2))
+        return words
+    return [generator.generate_code(parsed_line, file_line)
+            for parsed_line, file_line in zip(parsed_lines, file_lines)]
+
+
+def write_code(dst_path, code, binary=False):
+    """
+    Writes the output of encode_commands to the '.hack' or the '.hackbin' file.
+    """
+    if binary:
+        write_hackbin(dst_path, code)
+        return
+    dst_file = open(dst_path, 'w+')
+    for output_line in code:
         dst_file.write(output_line+'\n')
+    dst_file.close()
+
+
+def assemble(src_path, dst_path, binary=False, parser=None, generator=None):
+    """
+    Assembles the file in two passes: the first pass collects the jump symbols
+    and the parsed commands, the second one generates the code.
+    input:
+        src_path    -path to the '.asm' file
+        dst_path    -path to the '.hack' file, or to the '.hackbin' file if binary
+        binary      -write packed binary words instead of text
+        parser      -Parser to reuse, a new one is created if None
+        generator   -CodeGenerator to reuse, a new one is created if None
+    output:
+        number of the ROM words
+    """
+    parser = parser if parser is not None else Parser()
+    generator = generator if generator is not None else CodeGenerator()
+    parser.reset()
+    generator.reset()
+
+    parsed_lines, file_lines, jump_symbs = parse_source(src_path, parser)
+    resolve_symbols(jump_symbs, generator)
+    code = encode_commands(parsed_lines, file_lines, generator, binary)
+    write_code(dst_path, code, binary)
+    return len(code)
+
+
+def assemble_optimised(src_path, dst_path, binary=False, parser=None, generator=None, optimiser=None):
+    """
+    Assembles the file after running the peephole optimiser on its parsed commands.
+    input:
+        src_path    -path to the '.asm' file
+        dst_path    -path to the '.hack' file, or to the '.hackbin' file if binary
+        binary      -write packed binary words instead of text
+        parser      -Parser to reuse, a new one is created if None
+        generator   -CodeGenerator to reuse, a new one is created if None
+        optimiser   -AsmOptimiser collecting the hit counts, a new one is created if None
+    output:
+        number of the ROM words
+    """
+    src_file = open(src_path, 'r')
+
+    parser = parser if parser is not None else Parser()
+    generator = generator if generator is not None else CodeGenerator()
+    optimiser = optimiser if optimiser is not None else AsmOptimiser()
+    parser.reset()
+    generator.reset()
+
+    parsed_lines = []
+    file_lines = array('I')     # file lines of the parsed lines (jump symbols included), used for reporting errors
+    for src_line in src_file:
+        parsed_line = parser.parse(src_line)
+        if parsed_line:
+            parsed_lines.append(parsed_line)
+            file_lines.append(parser.prev_file_line)
+    src_file.close()
+    parsed_lines, file_lines = optimiser.optimise(parsed_lines, file_lines)
+
+    # the commands moved, so the jump symbols get the new addresses
+    commands, command_lines = [], []
+    for parsed_line, file_line in zip(parsed_lines, file_lines):
+        if parsed_line.type == 'JS':
+            generator.add_jump_symb(key=parsed_line.key, value=len(commands), file_line=file_line)
+        else:
+            commands.append(parsed_line)
+            command_lines.append(file_line)
+
+    code = encode_commands(commands, command_lines, generator, binary)
+    write_code(dst_path, code, binary)
+    return len(code)
+
+
+WORD_LINE_SIZE = 17     # 16 bits and the new line character
+
+def assemble_streaming(src_path, dst_path, binary=False, parser=None, generator=None):
+    """
+    Assembles the file in a single pass. The code is written as soon as a line
+    is parsed; an A-instruction referring to a symbol which is not known yet is
+    written as a placeholder and remembered in the fixup table. The placeholders
+    are patched when the jump symbol is found, the symbols left in the fixup
+    table at the end are variables and get their addresses then.
+    Every output word has the same size, so a placeholder is patched by seeking
+    to its command line.
+    input:
+        src_path    -path to the '.asm' file
+        dst_path    -path to the '.hack' file, or to the '.hackbin' file if binary
+        binary      -write packed binary words instead of text
+        parser      -Parser to reuse, a new one is created if None
+        generator   -CodeGenerator to reuse, a new one is created if None
+    output:
+        number of the ROM words
+    """
+    src_file = open(src_path, 'r')
+    dst_file = open(dst_path, 'wb+')
+
+    parser = parser if parser is not None else Parser()
+    generator = generator if generator is not None else CodeGenerator()
+    parser.reset()
+    generator.reset()
+
+    if binary:
+        offset, word_size = HEADER_SIZE, WORD.size
+        encode = lambda output_line: WORD.pack(int(output_line, 2))
+        dst_file.write(pack_header(0))      # the number of words is patched at the end
+    else:
+        offset, word_size = 0, WORD_LINE_SIZE
+        encode = lambda output_line: (output_line+'\n').encode()
 
+    fixups = {}                 # symbol: [command lines]; insertion order = order of the first use
+    cmd_line = 0
+    placeholder = encode('0'*(WORD_LINE_SIZE-1))
+
+    def patch(key, cmd_lines):
+        output_line = '0'+generator.symb_table[key]
+        if len(output_line) != WORD_LINE_SIZE-1:
+            raise ValueError("Address of the symbol {} does not fit into 15 bits.".format(key))
+        output_word = encode(output_line)
+        for line in cmd_lines:
+            dst_file.seek(offset+line*word_size)
+            dst_file.write(output_word)
+        dst_file.seek(0, os.SEEK_END)
+
+    src_line = src_file.readline()
+    while src_line:
+        parsed_line = parser.parse(src_line)
+        if not parsed_line:
+            pass
+        elif parsed_line.type == 'JS':
+            generator.add_jump_symb(key=parsed_line.key, value=parsed_line.adrs, file_line=parser.prev_file_line)
+            if parsed_line.key in fixups:
+                patch(parsed_line.key, fixups.pop(parsed_line.key))
+        elif parsed_line.type == 'A' and not parsed_line.adrs.isdigit() and parsed_line.adrs not in generator.symb_table:
+            fixups.setdefault(parsed_line.adrs, []).append(cmd_line)
+            dst_file.write(placeholder)
+            cmd_line += 1
+        else:
+            dst_file.write(encode(generator.generate_code(parsed_line, parser.prev_file_line)))
+            cmd_line += 1
+        src_line = src_file.readline()
+
+    # the remaining symbols were never defined as jump symbols, i.e. they are variables
+    for key, cmd_lines in fixups.items():
+        generator.add_adrs_symb(key)
+        patch(key, cmd_lines)
+
+    if binary:
+        dst_file.seek(0)
+        dst_file.write(pack_header(cmd_line))
     dst_file.close()
     src_file.close()
+    return cmd_line
+
+# ========================= Multi-file assembly
+
+_worker_parser = None
+_worker_generator = None
+
+def _init_worker():
+    """
+    Creates the Parser and CodeGenerator pair used by all the files assembled in a worker process.
+    """
+    global _worker_parser, _worker_generator
+    _worker_parser = Parser()
+    _worker_generator = CodeGenerator()
+
+
+def assemble_file(src_path, mode='default', binary=False, executor=None, cache=None):
+    """
+    Assembles a single '.asm' file next to the source file.
+    input:
+        src_path    -path to the '.asm' file
+        mode        -one of ['default', 'stream', 'bulk', 'chunked', 'optimise']
+        binary      -write packed binary words instead of text
+        executor    -process pool used by the 'chunked' mode
+        cache       -ContentCache of the outputs, None to bypass the cache
+    output:
+        (src_path, number of the ROM words, seconds, whether the output came from the cache,
+         hit counts of the AsmOptimiser patterns; None unless the file was optimised)
+    """
+    if _worker_parser is None:
+        _init_worker()
+    dst_path = src_path[:-len('.asm')]+('.hackbin' if binary else '.hack')
+    start = time.perf_counter()
+
+    if cache is not None:
+        # all the modes except 'optimise' produce the same output and refuse the same
+        # programs (addresses over 15 bits), only the format matters
+        output_kind = ('hackbin' if binary else 'hack')+('-optimised' if mode == 'optimise' else '')
+        src_file = open(src_path, 'rb')
+        key = cache.key(src_file.read(), VERSION, output_kind)
+        src_file.close()
+        output = cache.get(key)
+        if output is not None:
+            dst_file = open(dst_path, 'wb')
+            dst_file.write(output)
+            dst_file.close()
+            n_words = unpack_header(output) if binary else output.count(b'\n')
+            return src_path, n_words, time.perf_counter()-start, True, None
+
+    hits = None
+    if   mode == 'bulk':
+        n_words = assemble_bulk(src_path, dst_path, binary)
+    elif mode == 'chunked':
+        n_words = assemble_chunked(src_path, dst_path, binary, executor=executor)
+    elif mode == 'optimise':
+        optimiser = AsmOptimiser()
+        n_words = assemble_optimised(src_path, dst_path, binary, _worker_parser, _worker_generator, optimiser)
+        hits = dict(optimiser.hits)
+    elif mode == 'stream':
+        n_words = assemble_streaming(src_path, dst_path, binary, _worker_parser, _worker_generator)
+    else:
+        n_words = assemble(src_path, dst_path, binary, _worker_parser, _worker_generator)
+
+    if cache is not None:
+        dst_file = open(dst_path, 'rb')
+        cache.put(key, dst_file.read())
+        dst_file.close()
+    return src_path, n_words, time.perf_counter()-start, False, hits
+
+
+def find_asm_files(paths):
+    """
+    Expands the paths to the list of '.asm' files.
+    input:
+        paths       -list of '.asm' files, directories, or glob patterns
+    output:
+        sorted list of the '.asm' files without duplicates
+    """
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            matches = [os.path.join(path, file) for file in os.listdir(path)]
+        elif os.path.isfile(path):
+            if not path.endswith('.asm'):
+                raise ValueError("The file has to end with '.asm' extension.")
+            matches = [path]
+        else:
+            matches = glob.glob(path)
+            if not matches:
+                raise ValueError("Provided argument {} is neither a file, a directory, nor a matching pattern.".format(path))
+        files.update(match for match in matches if match.endswith('.asm') and os.path.isfile(match))
+    if not files:
+        raise ValueError("No files having '.asm' extension found.")
+    return sorted(files)
+
+
+def assemble_files(src_paths, mode='default', binary=False, jobs=None, cache=None):
+    """
+    Assembles the files in a process pool.
+    input:
+        src_paths   -list of the '.asm' files
+        mode        -one of ['default', 'stream', 'bulk', 'chunked', 'optimise']
+        binary      -write packed binary words instead of text
+        jobs        -number of the worker processes, None for the number of CPUs
+        cache       -ContentCache of the outputs, None to bypass the cache
+    output:
+        list of assemble_file results in the order of src_paths
+    """
+    if mode == 'chunked':
+        # the files one after another, the chunks of each file in parallel
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return [assemble_file(src_path, mode, binary, executor, cache) for src_path in src_paths]
+    if jobs == 1 or len(src_paths) == 1:
+        return [assemble_file(src_path, mode, binary, None, cache) for src_path in src_paths]
+    n = len(src_paths)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as executor:
+        return list(executor.map(assemble_file, src_paths, [mode]*n, [binary]*n, [None]*n, [cache]*n))
+
+
+def print_summary(results, wall_time):
+    """
+    Prints the per-file timing, the hit counts of the optimised files and the total.
+    """
+    width = max(len(result[0]) for result in results)
+    for src_path, n_words, seconds, cached, hits in results:
+        print('{0:<{1}}  {2:>7} words  {3:8.3f} s{4}'.format(src_path, width, n_words, seconds, '  (cached)' if cached else ''))
+        if hits is not None:
+            print('  Peephole: '+', '.join('{} {}'.format(hits[pattern], pattern) for pattern in AsmOptimiser.PATTERNS))
+    print('{0} files ({1} cached), {2} words, {3:.3f} s assembling, {4:.3f} s wall time'.format(
+        len(results), sum(r[3] for r in results), sum(r[1] for r in results), sum(r[2] for r in results), wall_time))
+
+# ========================= main
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Assembles Hack '.asm' files.")
+    arg_parser.add_argument('paths', nargs='+', help="'.asm' files, directories, or glob patterns")
+    modes = arg_parser.add_mutually_exclusive_group()
+    modes.add_argument('--stream', action='store_true', help='single-pass streaming assembler')
+    modes.add_argument('--bulk', action='store_true', help='vectorised assembler (requires NumPy)')
+    modes.add_argument('--chunked', action='store_true', help='assemble chunks of each file in parallel')
+    modes.add_argument('--optimise', action='store_true', help='run the peephole optimiser before assembling')
+    arg_parser.add_argument('--bin', action='store_true', help="write packed '.hackbin' files")
+    arg_parser.add_argument('--jobs', type=int, default=None, help='number of worker processes')
+    arg_parser.add_argument('--no-cache', action='store_true', help='bypass the cache of the assembled files')
+    arg_parser.add_argument('--cache-dir', default=os.path.join(DEFAULT_CACHE_DIR, 'HackAssembler'))
+    arg_parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_BYTES//(1024*1024), help='cache size in MB')
+    args = arg_parser.parse_args()
+
+    mode = 'bulk' if args.bulk else 'stream' if args.stream else 'chunked' if args.chunked else \
+           'optimise' if args.optimise else 'default'
+    src_paths = find_asm_files(args.paths)
+    cache = None if args.no_cache else ContentCache(args.cache_dir, args.cache_size*1024*1024)
+
+    start = time.perf_counter()
+    results = assemble_files(src_paths, mode, args.bin, args.jobs, cache)
+    if len(results) > 1 or mode == 'optimise':
+        print_summary(results, time.perf_counter()-start)
@@ -0,0 +1,115 @@
+import mmap
+import os.path
+import struct
+import sys
+from array import array
+from sys import argv
+
+# ========================= Packed binary ROM format
+#
+# A '.hackbin' file consists of a 12 byte header followed by the ROM words:
+#   magic       4 bytes     b'HACK'
+#   version     uint16      format version
+#   reserved    uint16      0
+#   n_words     uint32      number of ROM words
+#   words       n_words x uint16
+# All the numbers are little-endian.
+
+MAGIC = b'HACK'
+VERSION = 1
+HEADER = struct.Struct('<4sHHI')
+HEADER_SIZE = HEADER.size
+WORD = struct.Struct('<H')
+
+
+def pack_header(n_words):
+    """
+    Returns the header of a '.hackbin' file containing n_words words.
+    """
+    return HEADER.pack(MAGIC, VERSION, 0, n_words)
+
+
+def unpack_header(data):
+    """
+    Checks the header and returns the number of words in the file.
+    input:
+        data        -bytes-like object starting with the header
+    """
+    if len(data) < HEADER_SIZE:
+        raise ValueError("The file is too short to contain a '.hackbin' header.")
+    magic, version, _, n_words = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("The file is not a '.hackbin' file.")
+    if version != VERSION:
+        raise ValueError("Unsupported '.hackbin' version {}.".format(version))
+    if len(data) < HEADER_SIZE + 2*n_words:
+        raise ValueError("The file is truncated, expected {} words.".format(n_words))
+    return n_words
+
+
+def write_hackbin(path, words):
+    """
+    Writes the words into a '.hackbin' file.
+    input:
+        path        -path to the '.hackbin' file
+        words       -iterable of ints in the interval [0, 0xFFFF]
+    """
+    words = array('H', words)
+    if sys.byteorder != 'little':
+        words.byteswap()
+    dst_file = open(path, 'wb')
+    dst_file.write(pack_header(len(words)))
+    dst_file.write(words.tobytes())
+    dst_file.close()
+
+
+def load_hackbin(path):
+    """
+    Maps a '.hackbin' file into memory.
+    input:
+        path        -path to the '.hackbin' file
+    output:
+        memoryview of the ROM words (format 'H'); on little-endian machines it
+        is a zero-copy view of the mapped file, otherwise an array copy
+    """
+    src_file = open(path, 'rb')
+    buffer = mmap.mmap(src_file.fileno(), 0, access=mmap.ACCESS_READ)
+    src_file.close()            # the mapping stays valid after closing the file
+    n_words = unpack_header(buffer)
+    view = memoryview(buffer)[HEADER_SIZE:HEADER_SIZE+2*n_words]
+    if sys.byteorder == 'little':
+        return view.cast('H')
+    words = array('H', view.tobytes())
+    words.byteswap()
+    return memoryview(words)
+
+
+def load_hackbin_numpy(path):
+    """
+    Maps a '.hackbin' file into memory as a read-only NumPy array of uint16
+    (zero-copy on little-endian machines). Requires NumPy.
+    """
+    import numpy as np
+    return np.frombuffer(load_hackbin(path), dtype=np.uint16)
+
+
+def read_hack(path):
+    """
+    Reads a textual '.hack' file.
+    output:
+        array('H') of the ROM words
+    """
+    src_file = open(path, 'r')
+    words = array('H', (int(line, 2) for line in src_file if line.strip()))
+    src_file.close()
+    return words
+
+
+if __name__ == "__main__":
+    # converts a textual '.hack' file into a '.hackbin' file
+    path = argv[1]
+    if not os.path.isfile(path):
+        raise ValueError("Provided argument is not a file.")
+    if not path.endswith('.hack'):
+        raise ValueError("The file has to end with '.hack' extension.")
+    write_hackbin(path[:-len('.hack')]+'.hackbin', read_hack(path))
@@ -1,5 +1,39 @@
+# ========================= Instruction CLASS
+
+class Instruction(object):
+    """
+    Parsed line of Hack Assembly. C-instructions and A-instructions with a
+    number are shared by the lines with the same text and must not be
+    modified; the file line of the parsed line is kept by the Parser in
+    prev_file_line.
+      - type    of command:
+                        'JS' for jump symbol, i.e. (LOOP)
+                        'A'  for A-instruction (@XXX)
+                        'C'  for C-instruction (dest = comp; jump)
+      - key     key value           (for jump instruction, i.e. (LOOP))
+      - adrs    address/jump line   (str if A instruction, int if jump symbol)
+      - dest    destination         (if C instruction)
+      - comp    commputation        (if C instruction)
+      - jump    jump directive      (if C instruction)
+    """
+    __slots__ = ('type', 'key', 'adrs', 'dest', 'comp', 'jump')
+
+    def __init__(self, type, key, adrs, dest, comp, jump):
+        self.type = type
+        self.key = key
+        self.adrs = adrs
+        self.dest = dest
+        self.comp = comp
+        self.jump = jump
+
+    def __repr__(self):
+        return 'Instruction({}, {}, {}, {}, {}, {})'.format(
+            self.type, self.key, self.adrs, self.dest, self.comp, self.jump)
+
 # ========================= Parser CLASS
 
+MAX_SHARED_INSTRUCTIONS = 4096  # distinct lines shared by a Parser; C-instructions are far fewer
+
 class Parser(object):
     """
     Parser for Hack Assembler
@@ -7,27 +41,15 @@ class Parser(object):
     def __init__(self):
         self.prev_cmd_line = -1
         self.prev_file_line = -1
+        self._instructions = {}     # purified line: Instruction (lines without symbols only)
 
     def reset(self):
         """
-        Resets the command line to 0.
+        Resets the command line to 0 and clears the shared instructions.
         """
         self.prev_cmd_line = -1
         self.prev_file_line = -1
-
-
-    def _purify(self, line_str):
-        """
-        This function removes all spaces and comments.
-        """
-        string = line_str.replace(" ", "").strip('\n')
-        comment_idx = string.find('//')
-        if comment_idx == -1:
-            return string
-        elif comment_idx == 0:
-            return None
-        else:
-            return string[0:comment_idx]
+        self._instructions.clear()
 
 
     def parse(self, line_str):
@@ -35,50 +57,43 @@ class Parser(object):
         args:
           - line    strings to be parsed
         ret:
-          - type    of command:
-                            None for comment, white space
-                            'JS' for jump symbol, i.e. (LOOP)
-                            'A'  for A-instruction (@XXX)
-                            'C'  for C-instruction (dest = comp; jump)
-          - key     key value           (for jump instruction, i.e. (LOOP))
-          - adrs    address/jump line   (if A instruction or jump symbol)
-          - dest    destination         (if C instruction)
-          - comp    commputation        (if C instruction)
-          - jump    jump directive      (if C instruction)
-          - fline   file line           (used for reporting errors)
+          - None for comment, white space
+          - Instruction otherwise; its file line is in prev_file_line
         """
-        string = self._purify(line_str)
+        # remove all spaces and comments
+        string = line_str.replace(" ", "").strip('\n').partition('//')[0]
         self.prev_file_line +=1
-        if not string: # if string is empty or None
-            return [None, None, None, None, None, None, self.prev_file_line]
-        elif string[0] == '(':
+        if not string: # if string is empty
+            return None
+
+        instruction = self._instructions.get(string)
+        if instruction is not None:
+            self.prev_cmd_line += 1
+            return instruction
+
+        first = string[0]
+        if first == '(':
             idx = string.find(')')
             if idx == -1:
                 raise SyntaxError("Missing ')' in the Jump symbol on the line {}.".format(self.prev_file_line))
-            key = string[1:idx]
-            type = 'JS'
-            adrs = str(self.prev_cmd_line + 1)
-            return [type, key, adrs, None, None, None, self.prev_file_line]
-        elif string[0]=='@':
-            type = 'A'
-            adrs = string[1:]
-            self.prev_cmd_line += 1
-            return [type, None, adrs, None, None, None, self.prev_file_line]
+            return Instruction('JS', string[1:idx], self.prev_cmd_line + 1, None, None, None)
+        elif first == '@':
+            instruction = Instruction('A', None, string[1:], None, None, None)
+            if not instruction.adrs.isdigit():
+                # symbols are not shared: a file can have as many of them as lines
+                self.prev_cmd_line += 1
+                return instruction
         else:
-            jmp_idx = string.find(';')
-            if jmp_idx == -1:
-                jmp_idx = len(string)
+            comp, semicolon, jump = string.partition(';')
+            if not semicolon:
                 jump = None
+            dest, equals, rest = comp.partition('=')
+            if equals:
+                comp = rest
             else:
-                jump = string[jmp_idx+1:]
-
-            eq_idx = string.find('=')
-            if eq_idx == -1:
                 dest = None
-                comp = string[0:jmp_idx]
-            else:
-                dest = string[0:eq_idx]
-                comp = string[eq_idx+1:jmp_idx]
-            type = 'C'
-            self.prev_cmd_line += 1
-            return [type, None, None, dest, comp, jump, self.prev_file_line]
+            instruction = Instruction('C', None, None, dest, comp, jump)
+        if len(self._instructions) < MAX_SHARED_INSTRUCTIONS:
+            self._instructions[string] = instruction
+        self.prev_cmd_line += 1
+        return instruction
@@ -0,0 +1,68 @@
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from HackAssembler import assemble, assemble_streaming
+from BulkAssembler import assemble_bulk, np
+from ChunkAssembler import assemble_chunked
+from Benchmark import generate_program
+
+# ========================= Assembler backends checks
+#
+# The streaming, bulk and chunked backends must write the same '.hack' and
+# '.hackbin' files as the default two-pass assembler, and refuse the same
+# programs.
+
+def chunked(src_path, dst_path, binary=False):
+    return assemble_chunked(src_path, dst_path, binary, jobs=3)
+
+BACKENDS = {'stream': assemble_streaming, 'chunked': chunked}
+if np is not None:
+    BACKENDS['bulk'] = assemble_bulk
+
+
+class BackendsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='hack_backends_')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def write_program(self, name, lines):
+        src_path = os.path.join(self.work_dir, name+'.asm')
+        src_file = open(src_path, 'w')
+        src_file.writelines(lines)
+        src_file.close()
+        return src_path
+
+    def read_output(self, path):
+        dst_file = open(path, 'rb')
+        output = dst_file.read()
+        dst_file.close()
+        return output
+
+    def test_same_output(self):
+        src_path = self.write_program('Synthetic', generate_program(5000, seed=1))
+        for binary, extension in [(False, '.hack'), (True, '.hackbin')]:
+            expected_path = os.path.join(self.work_dir, 'Expected'+extension)
+            n_words = assemble(src_path, expected_path, binary)
+            expected = self.read_output(expected_path)
+            for name, backend in BACKENDS.items():
+                dst_path = os.path.join(self.work_dir, name+extension)
+                self.assertEqual(backend(src_path, dst_path, binary), n_words, (name, binary))
+                self.assertEqual(self.read_output(dst_path), expected, (name, binary))
+
+    def test_addresses_over_15_bits(self):
+        programs = [self.write_program('Large', generate_program(40000, seed=1)),
+                    self.write_program('Number', ['@40000\n', 'D=A\n'])]
+        for src_path in programs:
+            for binary in (False, True):
+                for name, backend in [('default', assemble)]+list(BACKENDS.items()):
+                    with self.assertRaises(ValueError, msg=(src_path, name, binary)):
+                        backend(src_path, os.path.join(self.work_dir, 'Refused'), binary)
+
+
+if __name__ == "__main__":
+    unittest.main()
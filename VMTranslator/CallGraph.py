@@ -0,0 +1,68 @@
+from fnmatch import fnmatchcase
+
+from Parser import C_FUNCTION, C_CALL
+
+# ========================= CallGraph CLASS
+
+class CallGraph(object):
+    """
+    Call graph of the functions of a whole VM program, used for dropping the
+    functions not reachable from the roots (e.g. the unused OS routines).
+    """
+    def __init__(self):
+        self.calls = {}         # function name -> set of the called function names
+        self.sizes = {}         # function name -> number of its commands
+
+    def add_file(self, parsed_lines):
+        """
+        Adds the functions of a file.
+        input:
+            parsed_lines    -iterable of the Commands of one file
+        output:
+            list of the names of the functions of the file
+        """
+        fct_names = []
+        fct_name = None
+        for parsed in parsed_lines:
+            if parsed.cmd_type == C_FUNCTION:
+                fct_name = parsed.arg1
+                fct_names.append(fct_name)
+                self.calls.setdefault(fct_name, set())
+                self.sizes[fct_name] = 0
+            elif parsed.cmd_type == C_CALL and fct_name is not None:
+                self.calls[fct_name].add(parsed.arg1)
+            if fct_name is not None:
+                self.sizes[fct_name] += 1
+        return fct_names
+
+    def reachable(self, roots):
+        """
+        input:
+            roots       -list of the function names or shell-style patterns (e.g. 'Memory.*')
+        output:
+            set of the function names reachable from the roots through calls
+        """
+        stack = [name for name in self.calls if any(fnmatchcase(name, root) for root in roots)]
+        reached = set(stack)
+        while stack:
+            for callee in self.calls.get(stack.pop(), ()):
+                if callee not in reached:
+                    reached.add(callee)
+                    stack.append(callee)
+        return reached
+
+    def prune(self, parsed_lines, keep):
+        """
+        Removes the functions which are not kept from a file.
+        input:
+            parsed_lines    -iterable of the Commands of one file
+            keep            -set of the function names to keep
+        output:
+            generator of the Commands of the kept functions (and the commands before the first function)
+        """
+        kept = True
+        for parsed in parsed_lines:
+            if parsed.cmd_type == C_FUNCTION:
+                kept = parsed.arg1 in keep
+            if kept:
+                yield parsed
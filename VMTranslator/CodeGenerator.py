@@ -1,19 +1,66 @@
+from collections import deque
+from itertools import islice
+
+from Parser import (CommandType, C_ARITHMETIC, C_PUSH, C_POP, C_LABEL, C_GOTO, C_IFGOTO, C_FUNCTION,
+                    C_RETURN, C_CALL, C_MOVE, C_EQ_ZERO, C_IFNOT, C_INC)
+
 # ========================= CodeGenerator CLASS
 
+HOT_LOOP_SIZE = 40      # loops of at most this many commands keep the inline comparisons
+MAX_A_STEPS = 8         # largest index of a cached pop addressed by incrementing A
+MAX_SP_OFFSET = 2       # largest distance of the tracked stack pointer from SP in the memory
+# commands starting a new basic block or using SP in the memory
+BLOCK_BOUNDARIES = frozenset([C_LABEL, C_GOTO, C_FUNCTION, C_CALL, C_RETURN])
+
 class CodeGenerator(object):
     """
     CodeGenerator generates code from parsed input.
     """
-    def __init__(self):
+    def __init__(self, trampolines=False, shared_comparisons=False, cache_tos=False, track_sp=False):
         """
         Initialises CodeGenerator.
         input:
-            file_name   -file name without any folder structure;
-                         used for generating static variables
+            trampolines -call and return through the shared '$$CALL' and '$$RETURN'
+                         routines instead of inlining them; see generate_routines
+            shared_comparisons
+                        -eq, gt and lt through the shared '$$EQ', '$$GT' and '$$LT'
+                         routines, except in the hot loops; see mark_hot_loops
+            cache_tos   -keep the top of the stack in the D register between the
+                         commands; see _generate_cached
+            track_sp    -address the stack relatively to SP at the block entry and
+                         update SP in the memory at the block exit; see _flush_sp
         """
         self._counter = 0
+        self._namespace = ''        # prefix of the counter in the labels, see start_file
         self._file_name = ''
         self._fct_name = ''
+        self._trampolines = trampolines
+        self._used_routines = set()
+        self._shared_comparisons = shared_comparisons
+        self._hot_lines = set()
+        self.n_inline_comparisons = 0
+        self.n_shared_comparisons = 0
+        self._cache_tos = cache_tos
+        self._tos_in_D = False
+        self._track_sp = track_sp
+        self._tracking = False      # whether the stack primitives use _sp_offset now
+        self._sp_offset = 0         # the stack pointer minus SP in the memory
+
+        # generators of the commands indexed by CommandType
+        self._generators = [None]*len(CommandType)
+        self._generators[C_PUSH] = lambda c: self._push(c.arg1, c.arg2, c.file_line)
+        self._generators[C_POP] = lambda c: self._pop(c.arg1, c.arg2, c.file_line)
+        self._generators[C_ARITHMETIC] = lambda c: self._arithmetic(c.arg1, c.file_line in self._hot_lines)
+        self._generators[C_LABEL] = lambda c: self._label(c.arg1)
+        self._generators[C_GOTO] = lambda c: self._goto(c.arg1)
+        self._generators[C_IFGOTO] = lambda c: self._ifgoto(c.arg1)
+        self._generators[C_FUNCTION] = lambda c: self._function(c.arg1, c.arg2)
+        self._generators[C_CALL] = lambda c: self._call(c.arg1, c.arg2)
+        self._generators[C_RETURN] = lambda c: self._return()
+        self._generators[C_MOVE] = lambda c: self._move(c.arg1, c.arg2, c.arg3, c.arg4, c.file_line)
+        self._generators[C_EQ_ZERO] = lambda c: self._eq_zero()
+        self._generators[C_IFNOT] = lambda c: self._ifnot(c.arg1)
+        self._generators[C_INC] = lambda c: self._inc()
 
     def reset(self, file_name, fct_name):
         """
@@ -37,42 +84,270 @@ class CodeGenerator(object):
         """
         self._file_name = file_name
 
+    def start_file(self, file_name):
+        """
+        Starts a file translated independently of the other files, e.g. in another
+        process: the labels made by the jump counter get the file name as their
+        namespace, so the counter restarts for every file.
+        input:
+            file_name   -file name without any folder structure;
+                         used for generating static variables and labels
+        """
+        self.reset(file_name, '')
+        self._namespace = file_name+'.'
+
+    def end_file(self):
+        """
+        Ends a file: the top of the stack cached in D and the tracked stack
+        pointer are stored, so that the next file starts from the memory.
+        output:
+            code in Hack Assembly
+        """
+        self._tracking = self._track_sp
+        code  = self._spill()
+        code += self._flush_sp()
+        self._tracking = False
+        return code
+
+    def routine_usage(self):
+        """
+        output:
+            (set of the used shared routines, number of the shared comparisons,
+             number of the inline comparisons) of the code generated so far
+        """
+        return set(self._used_routines), self.n_shared_comparisons, self.n_inline_comparisons
+
+    def add_routine_usage(self, usage):
+        """
+        Adds the routine_usage of another CodeGenerator, e.g. of a worker process,
+        so that generate_routines and comparison_report cover its code too.
+        """
+        used_routines, n_shared, n_inline = usage
+        self._used_routines.update(used_routines)
+        self.n_shared_comparisons += n_shared
+        self.n_inline_comparisons += n_inline
+
     def generate_code(self, parsed):
         """
         Generates code for parsed line.
         input:
-            parsed is a dictionary of parsed key-value pairs
-            keys:            values:
-                cmd_type         'C_ARITHMETIC', 'C_PUSH', 'C_POP', 'C_LABEL', 'C_GOTO', 'C_IFGOTO', 'C_FUNCTION', 'C_RETURN', 'C_CALL', None
-                arg1             'constant', 'temp', 'pointer', 'static', 'local', 'argument', 'this', 'that'
-                arg2             str(int)
-                file_line        int
-        output:
-            code in Hack Assembly
-        """
-        if   parsed['cmd_type'] == 'C_PUSH':
-            output_code = self._push(segment=parsed['arg1'], i=parsed['arg2'], line=parsed['file_line'])
-        elif parsed['cmd_type'] == 'C_POP':
-            output_code = self._pop(segment=parsed['arg1'], i=parsed['arg2'], line=parsed['file_line'])
-        elif parsed['cmd_type'] == 'C_ARITHMETIC':
-            output_code = self._arithmetic(operation=parsed['arg1'])
-        elif parsed['cmd_type'] == 'C_LABEL':
-            output_code = self._label(label=parsed['arg1'])
-        elif parsed['cmd_type'] == 'C_GOTO':
-            output_code = self._goto(label=parsed['arg1'])
-        elif parsed['cmd_type'] == 'C_IFGOTO':
-            output_code = self._ifgoto(label=parsed['arg1'])
-        elif parsed['cmd_type'] == 'C_FUNCTION':
-            output_code = self._function(fctname=parsed['arg1'], nVars=parsed['arg2'])
-        elif parsed['cmd_type'] == 'C_CALL':
-            output_code = self._call(fctname=parsed['arg1'], nArgs=parsed['arg2'])
-        elif parsed['cmd_type'] == 'C_RETURN':
-            output_code = self._return()
-        return output_code
+            parsed      -Command of the Parser, or a fused command of VMOptimiser
+        output:
+            code in Hack Assembly
+        """
+        if not (self._cache_tos or self._track_sp):
+            return self._generators[parsed.cmd_type](parsed)
+
+        spill_code = ''
+        self._tracking = self._track_sp
+        if self._cache_tos:
+            output_code = self._generate_cached(parsed)
+            if output_code is not None:
+                return output_code
+            spill_code = self._spill()
+        if self._track_sp and parsed.cmd_type in BLOCK_BOUNDARIES:
+            spill_code += self._flush_sp()
+            self._tracking = False
+        return spill_code+self._generators[parsed.cmd_type](parsed)
+
+
+    def generate_routines(self):
+        """
+        Generates the shared routines used by the code generated so far; has to be
+        placed after all the VM files. The top of the stack cached in D is stored
+        first, and the routines are preceded by an endless loop, so that a program
+        running off its end stops there with its stack in the memory.
+        output:
+            code in Hack Assembly
+        """
+        code  = self.end_file()     # the routines work with SP in the memory
+        routines = ''
+        if 'call' in self._used_routines:
+            routines += self._call_routine()
+        if 'return' in self._used_routines:
+            routines += self._return_routine()
+        for operation, EGL in [('eq', 'JEQ'), ('gt', 'JGT'), ('lt', 'JLT')]:
+            if operation in self._used_routines:
+                routines += self._compare_routine(operation, EGL)
+        if self.n_shared_comparisons:
+            routines += self._compare_true_routine()
+        if routines:
+            code += '($$END)'+'\n'
+            code += '@$$END'+'\n'
+            code += '0;JMP'+'\n'
+        return code+routines
+
+    def mark_hot_loops(self, parsed_lines):
+        """
+        Finds the comparisons in the hot loops of a file: the loops made by a jump
+        (also a fused 'not; if-goto') back to a label at most HOT_LOOP_SIZE
+        commands before, without any call in between. These comparisons are generated inline even if shared_comparisons.
+        The commands are passed on HOT_LOOP_SIZE commands late, i.e. once no later
+        jump can make a loop of them.
+        input:
+            parsed_lines    -iterable of the Commands of one file
+        output:
+            generator of the same Commands
+        """
+        labels = {}             # label -> index of the label command in the current function
+        window = deque()        # the last commands, window[-1] has the index idx
+        self._hot_lines = set()
+        for idx, parsed in enumerate(parsed_lines):
+            window.append(parsed)
+            if parsed.cmd_type == C_FUNCTION:
+                labels = {}
+            elif parsed.cmd_type == C_LABEL:
+                labels[parsed.arg1] = idx
+            elif parsed.cmd_type in (C_GOTO, C_IFGOTO, C_IFNOT) and parsed.arg1 in labels:
+                size = idx-labels[parsed.arg1]
+                loop = list(islice(window, len(window)-1-size, len(window)-1)) if size <= HOT_LOOP_SIZE else []
+                if loop and all(cmd.cmd_type != C_CALL for cmd in loop):
+                    self._hot_lines.update(cmd.file_line for cmd in loop
+                                           if cmd.cmd_type == C_ARITHMETIC and cmd.arg1 in ['eq', 'gt', 'lt'])
+            if len(window) > HOT_LOOP_SIZE:
+                yield window.popleft()
+        yield from window
+
+    def comparison_report(self):
+        """
+        Reports the ROM size saved by the shared comparisons.
+        output:
+            (number of the shared comparisons, number of the inline comparisons, saved ROM words)
+        """
+        count = lambda code: sum(1 for line in code.split('\n') if line and line[0] != '(')
+        counter = self._counter
+        inline_size = count(self._eq())
+        self._counter = counter         # the sample above must not shift the labels
+        call_size = count('@X\nD=A\n@$$EQ\n0; JMP\n')
+        routines_size = sum(count(self._compare_routine(operation, 'JEQ'))
+                            for operation in ['eq', 'gt', 'lt'] if operation in self._used_routines)
+        if self.n_shared_comparisons:
+            routines_size += count(self._compare_true_routine())
+            if not self._used_routines & {'call', 'return'}:
+                routines_size += 2      # the loop stopping the program before the routines
+        saved = self.n_shared_comparisons*(inline_size-call_size)-routines_size
+        return self.n_shared_comparisons, self.n_inline_comparisons, saved
 
 
     # --------------- Helper functions
 
+    def _label_id(self):
+        """
+        output:
+            unique part of the labels made by the jump counter, e.g. 'Main.3' in 'TRUE__Main.3'
+        """
+        return self._namespace+str(self._counter)
+
+    # --------------- TOP OF THE STACK IN D
+    def _spill(self):
+        """
+        Generates code for storing the top of the stack held in the D register to the stack.
+        output:
+            code in Hack Assembly
+        """
+        if not self._tos_in_D:
+            return ''
+        self._tos_in_D = False
+        return self._D_to_stack()
+
+    def _generate_cached(self, parsed):
+        """
+        Generates code for the commands profiting from the top of the stack in D.
+        A push loads the value to D and leaves it there, the arithmetic commands
+        and pops take the top of the stack from D. All the other commands are
+        generated by generate_code after spilling D to the stack, so the stack is
+        in the memory at every label, jump, call, return and function entry.
+        input:
+            parsed      -Command, see generate_code
+        output:
+            code in Hack Assembly, or None if the command is not handled here
+        """
+        cmd_type = parsed.cmd_type
+        if cmd_type == C_PUSH:
+            code = self._spill()
+            if parsed.arg1 == 'constant' and parsed.arg2 in [0, 1]:
+                code += 'D='+str(parsed.arg2)+'\n'
+            else:
+                code += self._addr_to_D(parsed.arg1, parsed.arg2, parsed.file_line)
+            self._tos_in_D = True
+            return code
+
+        if not self._tos_in_D:
+            return None             # the top of the stack is in the memory, nothing to profit from
+
+        if cmd_type == C_POP:
+            return self._pop_D(parsed.arg1, parsed.arg2, parsed.file_line)
+        elif cmd_type == C_ARITHMETIC:
+            return self._arithmetic_D(parsed.arg1, hot=parsed.file_line in self._hot_lines)
+        elif cmd_type == C_IFGOTO:
+            self._tos_in_D = False
+            code  = self._flush_sp()
+            code += '@'+self._file_name+'.'+self._fct_name+'$'+parsed.arg1+'\n'
+            code += 'D; JNE'+'\n'
+            return code
+        elif cmd_type == C_IFNOT:
+            self._tos_in_D = False
+            code  = 'D=D+1'+'\n'        # !x == 0 exactly when x+1 == 0
+            code += self._flush_sp()
+            code += '@'+self._file_name+'.'+self._fct_name+'$'+parsed.arg1+'\n'
+            code += 'D; JNE'+'\n'
+            return code
+        elif cmd_type == C_INC:
+            return 'D=D+1'+'\n'
+        return None
+
+    def _pop_D(self, segment, i, line):
+        """
+        Generates code for popping the top of the stack held in D to the 'segment i'.
+        input:
+            segment     -is one of ['temp', 'pointer', 'static', 'local', 'argument', 'this', 'that']
+            i           -is int
+            line        -line number of the input file
+        output:
+            code in Hack Assembly, or None if the pop has to go through the stack
+        """
+        if segment in ['temp', 'pointer', 'static']:
+            self._tos_in_D = False
+            return self._D_to_addr(segment, i, line)
+        if i > MAX_A_STEPS:
+            return None
+        self._tos_in_D = False
+        VS = {'local':'LCL', 'argument':'ARG', 'this':'THIS', 'that':'THAT'}[segment]
+        code  = '@'+VS+'\n'         # A=VS,  M=*VS
+        code += 'A=M'+'\n'          # A=*VS
+        for _ in range(i):
+            code += 'A=A+1'+'\n'    # A=*VS+i
+        code += 'M=D'+'\n'
+        return code
+
+    def _arithmetic_D(self, operation, hot=False):
+        """
+        Generates code for arithmetic operations taking the top of the stack from D
+        and leaving the result in D.
+        input:
+            operation   -is one of ['add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not']
+            hot         -the command is in a hot loop
+        output:
+            code in Hack Assembly, or None if the operation has to go through the stack
+        """
+        if operation == 'neg':
+            return 'D=-D'+'\n'
+        elif operation == 'not':
+            return 'D=!D'+'\n'
+        elif operation in ['eq', 'gt', 'lt'] and self._shared_comparisons and not hot:
+            return None             # the shared routines work on the stack
+
+        code  = self._pop_to_M()     # M is the second operand, the first one is in D
+        if   operation == 'add': code += 'D=D+M'+'\n'
+        elif operation == 'sub': code += 'D=M-D'+'\n'
+        elif operation == 'and': code += 'D=D&M'+'\n'
+        elif operation == 'or':  code += 'D=D|M'+'\n'
+        else:
+            self.n_inline_comparisons += 1
+            code += 'D=M-D'+'\n'
+            code += self._D_is_EGL_0({'eq':'JEQ', 'gt':'JGT', 'lt':'JLT'}[operation])
+        return code
+
     # --------------- PUSH
 
     def _push(self, segment, i, line):
@@ -80,7 +355,7 @@ class CodeGenerator(object):
         Generate code for push command.
         input:
             segment     -is one of ['constant', 'temp', 'pointer', 'static', 'local', 'argument', 'this', 'that']
-            i           -is str(int)
+            i           -is int
             line        -line number of the input file
         output:
             code in Hack Assembly
@@ -94,31 +369,31 @@ class CodeGenerator(object):
         Generates code for copying value from the 'segment i' to the D register.
         input:
             segment     -is one of ['constant', 'temp', 'pointer', 'static', 'local', 'argument', 'this', 'that']
-            i           -is str(int)
+            i           -is int
             line        -line number of the input file
         output:
             code in Hack Assembly
         """
         if   segment == 'constant':
-            code  = '@'+i+'\n'      # A=i
+            code  = '@'+str(i)+'\n' # A=i
             code += 'D=A'+'\n'      # D=i
             return code
         elif segment == 'temp':
-            if int(i) < 0 or int(i) > 7:
+            if i < 0 or i > 7:
                 raise ValueError('File line {}: Reaching outside of temp part, i must be in the interval [0,7]'.format(line))
-            code  = '@'+str(int(i)+5)+'\n'  # A=i+5, M=*(i+5)
+            code  = '@'+str(i+5)+'\n'  # A=i+5, M=*(i+5)
             code += 'D=M'+'\n'              # D=*(i+5)
             return code
         elif segment == 'pointer':
-            if int(i) < 0 or int(i) > 1:
+            if i < 0 or i > 1:
                 raise ValueError('File line {}: for pointer i must be in the interval [0,1]'.format(line))
-            if   int(i) == 0: VS = 'THIS'
-            elif int(i) == 1: VS = 'THAT'
+            if   i == 0: VS = 'THIS'
+            elif i == 1: VS = 'THAT'
             code  = '@'+VS+'\n'     # A=VS,  M=*VS
             code += 'D=M'+'\n'      # D=*VS
             return code
         elif segment == 'static':
-            code  = '@'+self._file_name+'.'+i+'\n'
+            code  = '@'+self._file_name+'.'+str(i)+'\n'
             code += 'D=M'+'\n'
             return code
         elif segment == 'local':
@@ -130,12 +405,12 @@ class CodeGenerator(object):
         elif segment == 'that':
             VS = 'THAT'             # virtual segment
 
-        if int(i) == 0:
+        if i == 0:
             code  = '@'+VS+'\n'     # A=VS,  M=*VS
             code += 'A=M'+'\n'      # A=*VS, M=**VS
             code += 'D=M'+'\n'      # D=*(i+*VS)
         else:
-            code  = '@'+i+'\n'      # A=i
+            code  = '@'+str(i)+'\n' # A=i
             code += 'D=A'+'\n'      # D=i
             code += '@'+VS+'\n'     # A=VS,  M=*VS
             code += 'A=D+M'+'\n'    # A=i+*VS, M=*(i+*VS)
@@ -154,6 +429,12 @@ class CodeGenerator(object):
         output:
             code in Hack Assembly
         """
+        if self._tracking:
+            code = self._flush_sp() if self._sp_offset == MAX_SP_OFFSET else ''
+            code += self._slot_address(self._sp_offset)
+            code += 'M=D'+'\n'
+            self._sp_offset += 1
+            return code
         code  = '@SP'+'\n'          # A=SP,  M=*SP  (=RAM[SP])
         code += 'AM=M+1'+'\n'       # A=*SP_new (=*SP+1), *SP_new = *SP+1
         code += 'A=A-1'+'\n'        # A=*SP_new-1 (=*SP)
@@ -167,7 +448,7 @@ class CodeGenerator(object):
         Generate code for pop command.
         input:
             segment     -is one of ['temp', 'pointer', 'static']
-            i           -is str(int)
+            i           -is int
             line        -line number of the input file
         output:
             code in Hack Assembly
@@ -189,9 +470,63 @@ class CodeGenerator(object):
         output:
             code in Hack Assembly
         """
+        code  = self._pop_to_M()
+        code += 'D=M'+'\n'          # D=**SP
+        return code
+
+    def _pop_to_M(self):
+        """
+        Generate code for removing the value from the stack and pointing M to it.
+        output:
+            code in Hack Assembly
+        """
+        if self._tracking:
+            code = self._flush_sp() if self._sp_offset == -MAX_SP_OFFSET else ''
+            self._sp_offset -= 1
+            return code+self._slot_address(self._sp_offset)
         code  = '@SP'+'\n'          # A=SP,  M=*SP  (=RAM[SP])
         code += 'AM=M-1'+'\n'       # *SP--, A=*SP--, M=*(*SP--)
-        code += 'D=M'+'\n'          # D=**SP
+        return code
+
+    def _top_address(self):
+        """
+        Generate code for pointing M to the value on the top of the stack.
+        output:
+            code in Hack Assembly
+        """
+        if self._tracking:
+            return self._slot_address(self._sp_offset-1)
+        code  = '@SP'+'\n'          # M points to one past the top
+        code += 'A=M-1'+'\n'        # M points to the top
+        return code
+
+    def _slot_address(self, offset):
+        """
+        Generate code for pointing M to the stack slot at the offset from SP in the memory.
+        input:
+            offset      -int in the interval [-MAX_SP_OFFSET-1, MAX_SP_OFFSET]
+        output:
+            code in Hack Assembly
+        """
+        code = '@SP'+'\n'
+        if   offset == 0: code += 'A=M'+'\n'
+        elif offset > 0:  code += 'A=M+1'+'\n' + ('A=A+1'+'\n')*(offset-1)
+        else:             code += 'A=M-1'+'\n' + ('A=A-1'+'\n')*(-offset-1)
+        return code
+
+    def _flush_sp(self):
+        """
+        Generates code for updating SP in the memory by the tracked offset;
+        the D register is left intact. Has to be placed where all the paths
+        reaching it have the same offset, e.g. not between a jump and its label.
+        output:
+            code in Hack Assembly
+        """
+        if not self._tracking or self._sp_offset == 0:
+            return ''
+        code  = '@SP'+'\n'
+        code += ('M=M+1'+'\n' if self._sp_offset > 0 else 'M=M-1'+'\n')*abs(self._sp_offset)
+        self._sp_offset = 0
         return code
 
     def _D_to_R1X(self, x):
@@ -229,27 +564,27 @@ class CodeGenerator(object):
         Generates code for copying value from the D register to the 'segment i'.
         input:
             segment     -is one of ['temp', 'pointer', 'static']
-            i           -is str(int)
+            i           -is int
             line        -line number of the input file
         output:
             code in Hack Assembly
         """
         if   segment == 'temp':
-            if int(i) < 0 or int(i) > 7:
+            if i < 0 or i > 7:
                 raise ValueError('File line {}: Reaching outside of temp part, i must be in the interval [0,7]'.format(line))
-            code  = '@'+str(int(i)+5)+'\n'  # A=i+5, M=*(i+5)
+            code  = '@'+str(i+5)+'\n'  # A=i+5, M=*(i+5)
             code += 'M=D'+'\n'              # *(i+5)=D
             return code
         elif segment == 'pointer':
-            if int(i) < 0 or int(i) > 1:
+            if i < 0 or i > 1:
                 raise ValueError('File line {}: for pointer i must be in the interval [0,1]'.format(line))
-            if   int(i) == 0: VS = 'THIS'
-            elif int(i) == 1: VS = 'THAT'
+            if   i == 0: VS = 'THIS'
+            elif i == 1: VS = 'THAT'
             code  = '@'+VS+'\n'     # A=VS,  M=*VS
             code += 'M=D'+'\n'      # *VS=D
             return code
         elif segment == 'static':
-            code  = '@'+self._file_name+'.'+i+'\n'
+            code  = '@'+self._file_name+'.'+str(i)+'\n'
             code += 'M=D'+'\n'
             return code
 
@@ -258,7 +593,7 @@ class CodeGenerator(object):
         Generates code for copying value from the 'segment i' to one of R13, R14, R15 registers.
         input:
             segment     -is one of ['local', 'argument', 'this', 'that']
-            i           -is str(int)
+            i           -is int
             x           -3,4 or 5; specifies the R1X register
         output:
             code in Hack Assembly
@@ -272,12 +607,12 @@ class CodeGenerator(object):
         elif segment == 'that':
             VS = 'THAT'             # virtual segment
 
-        if int(i) == 0:
+        if i == 0:
             code  = '@'+VS+'\n'     # A=VS,  M=*VS
             code += 'D=M'+'\n'      # D=*VS
             code += self._D_to_R1X(x)
         else:
-            code  = '@'+i+'\n'      # A=i
+            code  = '@'+str(i)+'\n' # A=i
             code += 'D=A'+'\n'      # D=i
             code += '@'+VS+'\n'     # A=VS,  M=*VS
             code += 'D=D+M'+'\n'    # D=i+*VS
@@ -291,14 +626,21 @@ class CodeGenerator(object):
 
 
     # --------------- ARITHMETIC
-    def _arithmetic(self, operation):
+    def _arithmetic(self, operation, hot=False):
         """
         Generates code for arithmetic operations.
         input:
             operation   -is one of ['add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not']
+            hot         -the command is in a hot loop, comparisons are generated inline
         output:
             code in Hack Assembly
         """
+        if operation in ['eq', 'gt', 'lt']:
+            if self._shared_comparisons and not hot:
+                self.n_shared_comparisons += 1
+                return self._compare_call(operation)
+            self.n_inline_comparisons += 1
+
         if   operation == 'add': code = self._add()
         elif operation == 'sub': code = self._sub()
         elif operation == 'neg': code = self._neg()
@@ -344,8 +686,7 @@ class CodeGenerator(object):
         output:
             code in Hack Assembly
         """
-        code  = '@SP'+'\n'          # M points to one past the operand
-        code += 'A=M-1'+'\n'        # M points to the operand
+        code  = self._top_address()  # M points to the operand
         code += 'M=-M'+'\n'
         return code
 
@@ -357,14 +698,14 @@ class CodeGenerator(object):
         output:
             code in Hack Assembly
         """
-        code  = '@TRUE__'+str(self._counter)+'\n'
+        code  = '@TRUE__'+self._label_id()+'\n'
         code += 'D;'+EGL+'\n'
         code += 'D=0'+'\n'
-        code += '@D_TO_STACK__'+str(self._counter)+'\n'
+        code += '@D_TO_STACK__'+self._label_id()+'\n'
         code += '0;JMP'+'\n'
-        code += '(TRUE__'+str(self._counter)+')'+'\n'
+        code += '(TRUE__'+self._label_id()+')'+'\n'
         code += 'D=-1'+'\n'
-        code += '(D_TO_STACK__'+str(self._counter)+')'+'\n'
+        code += '(D_TO_STACK__'+self._label_id()+')'+'\n'
         self._counter += 1
         return code
 
@@ -381,8 +722,7 @@ class CodeGenerator(object):
         code += 'A=A-1'+'\n'        # M points to the second operand
         code += 'D=M-D'+'\n'
         code += self._D_is_EGL_0('JEQ')
-        code += '@SP'+'\n'          # M points to one past the place to paste the result
-        code += 'A=M-1'+'\n'        # adjust the place
+        code += self._top_address()  # M points to the place to paste the result
         code += 'M=D'+'\n'          # paste the result
         return code
 
@@ -399,8 +739,7 @@ class CodeGenerator(object):
         code += 'A=A-1'+'\n'        # M points to the second operand
         code += 'D=M-D'+'\n'
         code += self._D_is_EGL_0('JGT')
-        code += '@SP'+'\n'          # M points to one past the place to paste the result
-        code += 'A=M-1'+'\n'        # adjust the place
+        code += self._top_address()  # M points to the place to paste the result
         code += 'M=D'+'\n'          # paste the result
         return code
 
@@ -417,11 +756,67 @@ class CodeGenerator(object):
         code += 'A=A-1'+'\n'        # M points to the second operand
         code += 'D=M-D'+'\n'
         code += self._D_is_EGL_0('JLT')
-        code += '@SP'+'\n'          # M points to one past the place to paste the result
-        code += 'A=M-1'+'\n'        # adjust the place
+        code += self._top_address()  # M points to the place to paste the result
         code += 'M=D'+'\n'          # paste the result
         return code
 
+    def _compare_call(self, operation):
+        """
+        Generates code for calling the shared comparison routine;
+        the return address is passed in the D register.
+        input:
+            operation   -is one of ['eq', 'gt', 'lt']
+        output:
+            code in Hack Assembly
+        """
+        self._used_routines.add(operation)
+        code  = self._flush_sp()    # the routine works with SP in the memory
+        code += '@COMPARED__'+self._label_id()+'\n'
+        code += 'D=A'+'\n'          # D = return address
+        code += '@$$'+operation.upper()+'\n'
+        code += '0; JMP'+'\n'
+        code += '(COMPARED__'+self._label_id()+')'+'\n'
+        self._counter += 1
+        return code
+
+    def _compare_routine(self, operation, EGL):
+        """
+        Generates the shared comparison routine: compares two values from the stack,
+        puts the result back on the stack, and jumps to the address from the D register.
+        input:
+            operation   -is one of ['eq', 'gt', 'lt']
+            EGL         -one of ['JEQ', 'JGT', 'JLT'], matching the operation
+        output:
+            code in Hack Assembly
+        """
+        code  = '($$'+operation.upper()+')'+'\n'
+        code += self._D_to_R1X(5)   # the return address to R15
+        code += self._stack_to_D()  # put the first operand to D and perform *SP--
+        code += 'A=A-1'+'\n'        # M points to the second operand
+        code += 'D=M-D'+'\n'
+        code += 'M=0'+'\n'          # false unless the jump below
+        code += '@$$COMPARE_TRUE'+'\n'
+        code += 'D;'+EGL+'\n'
+        code += '@R15'+'\n'
+        code += 'A=M'+'\n'
+        code += '0; JMP'+'\n'       # return
+        return code
+
+    def _compare_true_routine(self):
+        """
+        Generates the common end of the shared comparison routines for the true result.
+        output:
+            code in Hack Assembly
+        """
+        code  = '($$COMPARE_TRUE)'+'\n'
+        code += '@SP'+'\n'
+        code += 'A=M-1'+'\n'
+        code += 'M=-1'+'\n'
+        code += '@R15'+'\n'
+        code += 'A=M'+'\n'
+        code += '0; JMP'+'\n'       # return
+        return code
+
     def _and(self):
         """
         Generates code for:
@@ -456,8 +851,7 @@ class CodeGenerator(object):
         output:
             code in Hack Assembly
         """
-        code  = '@SP'+'\n'          # M points to one past the operand
-        code += 'A=M-1'+'\n'        # M points to the operand
+        code  = self._top_address()  # M points to the operand
         code += 'M=!M'+'\n'
         return code
 
@@ -495,10 +889,91 @@ class CodeGenerator(object):
             code in Hack Assembly
         """
         code  = self._stack_to_D()
+        code += self._flush_sp()
+        code += '@'+self._file_name+'.'+self._fct_name+'$'+label+'\n'
+        code += 'D; JNE'+'\n'
+        return code
+
+    # --------------- FUSED COMMANDS
+    def _move(self, src_segment, src_i, dst_segment, dst_i, line):
+        """
+        Generates code for 'push src_segment src_i' followed by 'pop dst_segment dst_i'
+        without going through the stack.
+        input:
+            src_segment -is one of ['constant', 'temp', 'pointer', 'static', 'local', 'argument', 'this', 'that']
+            src_i       -is int
+            dst_segment -is one of ['temp', 'pointer', 'static', 'local', 'argument', 'this', 'that']
+            dst_i       -is int
+            line        -line number of the input file
+        output:
+            code in Hack Assembly
+        """
+        if dst_segment in ['temp', 'pointer', 'static']:
+            if src_segment == 'constant' and src_i in [0, 1]:
+                code  = self._D_to_addr(dst_segment, dst_i, line)[:-len('M=D\n')]
+                code += 'M='+str(src_i)+'\n'     # the constant directly, D is not used
+                return code
+            code  = self._addr_to_D(src_segment, src_i, line)
+            code += self._D_to_addr(dst_segment, dst_i, line)
+        elif dst_i == 0:
+            VS = {'local':'LCL', 'argument':'ARG', 'this':'THIS', 'that':'THAT'}[dst_segment]
+            code  = self._addr_to_D(src_segment, src_i, line)
+            code += '@'+VS+'\n'     # A=VS,  M=*VS
+            code += 'A=M'+'\n'      # A=*VS, M=**VS
+            code += 'M=D'+'\n'
+        else:
+            code  = self._addr_to_R1X(dst_segment, dst_i, x=3)
+            code += self._addr_to_D(src_segment, src_i, line)
+            code += '@R13'+'\n'     # because x=3 above
+            code += 'A=M'+'\n'
+            code += 'M=D'+'\n'
+        return code
+
+    def _eq_zero(self):
+        """
+        Generates code for 'push constant 0' followed by 'eq':
+        replaces the value on the stack by true (-1) if it is 0, by false (0) otherwise.
+        output:
+            code in Hack Assembly
+        """
+        code  = self._top_address()  # M points to the operand
+        code += 'D=M'+'\n'
+        code += 'M=-1'+'\n'         # true unless the jump below is skipped
+        code += '@ZERO__'+self._label_id()+'\n'
+        code += 'D; JEQ'+'\n'
+        code += self._top_address()
+        code += 'M=0'+'\n'
+        code += '(ZERO__'+self._label_id()+')'+'\n'
+        self._counter += 1
+        return code
+
+    def _ifnot(self, label):
+        """
+        Generates code for 'not' followed by 'if-goto label': jumps unless
+        the value from the stack is true (-1), i.e. unless its negation is 0.
+        input:
+            label       - label name
+        output:
+            code in Hack Assembly
+        """
+        code  = self._stack_to_D()
+        code += 'D=D+1'+'\n'        # !x == 0 exactly when x+1 == 0
+        code += self._flush_sp()
         code += '@'+self._file_name+'.'+self._fct_name+'$'+label+'\n'
         code += 'D; JNE'+'\n'
         return code
 
+    def _inc(self):
+        """
+        Generates code for 'push constant 1' followed by 'add'.
+        output:
+            code in Hack Assembly
+        """
+        code  = self._top_address()  # M points to the operand
+        code += 'M=M+1'+'\n'
+        return code
+
+
     # --------------- FUNCTION
     def _function(self, fctname, nVars):
         """
@@ -511,13 +986,13 @@ class CodeGenerator(object):
         """
         self._fct_name = fctname
         code  = '('+fctname+')'+'\n'
-        if int(nVars) != 0:
+        if nVars != 0:
             code += '@SP'+'\n'
             code += 'A=M'+'\n'
-            for _ in range(int(nVars)):
+            for _ in range(nVars):
                 code += 'M=0'+'\n'
                 code += 'A=A+1'+'\n'
-            code += '@'+nVars+'\n'
+            code += '@'+str(nVars)+'\n'
             code += 'D=A'+'\n'
             code += '@SP'+'\n'
             code += 'M=D+M'+'\n'
@@ -534,7 +1009,9 @@ class CodeGenerator(object):
         return:
             code in Hack Assembly
         """
-        code  = '@'+fctname+'$ret'+'.'+str(self._counter)+'\n'
+        if self._trampolines:
+            return self._call_trampoline(fctname, nArgs)
+        code  = '@'+fctname+'$ret'+'.'+self._label_id()+'\n'
         code += 'D=A'+'\n'
         code += self._D_to_stack()  # push return address
         code += '@LCL'+'\n'
@@ -551,7 +1028,7 @@ class CodeGenerator(object):
         code += self._D_to_stack()  # push THAT
         code += '@5'+'\n'
         code += 'D=A'+'\n'
-        code += '@'+nArgs+'\n'
+        code += '@'+str(nArgs)+'\n'
         code += 'D=D+A'+'\n'        # D = 5+nArgs
         code += '@SP'+'\n'
         code += 'D=M-D'+'\n'        # D = SP-(5+nArgs)
@@ -563,11 +1040,78 @@ class CodeGenerator(object):
         code += 'M=D'+'\n'          # LCL = SP
         code += '@'+fctname+'\n'
         code += '0; JMP'+'\n'       # GOTO function
-        code += '('+fctname+'$ret'+'.'+str(self._counter)+')'+'\n'
+        code += '('+fctname+'$ret'+'.'+self._label_id()+')'+'\n'
         self._counter += 1
         return code
 
 
+    def _call_trampoline(self, fctname, nArgs):
+        """
+        Generates code for function call through the shared '$$CALL' routine:
+        R13 = function address, R14 = nArgs, R15 = return address.
+        input:
+            fctname     - function name
+            nArgs       - number of function's arguments
+        return:
+            code in Hack Assembly
+        """
+        self._used_routines.add('call')
+        code  = '@'+fctname+'\n'
+        code += 'D=A'+'\n'
+        code += self._D_to_R1X(3)   # function address to R13
+        code += '@'+str(nArgs)+'\n'
+        code += 'D=A'+'\n'
+        code += self._D_to_R1X(4)   # nArgs to R14
+        code += '@'+fctname+'$ret'+'.'+self._label_id()+'\n'
+        code += 'D=A'+'\n'
+        code += self._D_to_R1X(5)   # return address to R15
+        code += '@$$CALL'+'\n'
+        code += '0; JMP'+'\n'
+        code += '('+fctname+'$ret'+'.'+self._label_id()+')'+'\n'
+        self._counter += 1
+        return code
+
+    def _call_routine(self):
+        """
+        Generates the shared '$$CALL' routine: saves the frame of the caller,
+        repositions ARG and LCL, and jumps to the function in R13.
+        return:
+            code in Hack Assembly
+        """
+        code  = '($$CALL)'+'\n'
+        code += '@R15'+'\n'
+        code += 'D=M'+'\n'
+        code += self._D_to_stack()  # push return address
+        code += '@LCL'+'\n'
+        code += 'D=M'+'\n'
+        code += self._D_to_stack()  # push LCL
+        code += '@ARG'+'\n'
+        code += 'D=M'+'\n'
+        code += self._D_to_stack()  # push ARG
+        code += '@THIS'+'\n'
+        code += 'D=M'+'\n'
+        code += self._D_to_stack()  # push THIS
+        code += '@THAT'+'\n'
+        code += 'D=M'+'\n'
+        code += self._D_to_stack()  # push THAT
+        code += '@R14'+'\n'
+        code += 'D=M'+'\n'
+        code += '@5'+'\n'
+        code += 'D=D+A'+'\n'        # D = 5+nArgs
+        code += '@SP'+'\n'
+        code += 'D=M-D'+'\n'        # D = SP-(5+nArgs)
+        code += '@ARG'+'\n'
+        code += 'M=D'+'\n'          # ARG = SP-(5+nArgs)
+        code += '@SP'+'\n'
+        code += 'D=M'+'\n'
+        code += '@LCL'+'\n'
+        code += 'M=D'+'\n'          # LCL = SP
+        code += '@R13'+'\n'
+        code += 'A=M'+'\n'
+        code += '0; JMP'+'\n'       # GOTO function
+        return code
+
+
     # --------------- RETURN
     def _return(self):
         """
@@ -575,6 +1119,27 @@ class CodeGenerator(object):
         return:
             code in Hack Assembly
         """
+        if self._trampolines:
+            self._used_routines.add('return')
+            code  = '@$$RETURN'+'\n'
+            code += '0; JMP'+'\n'
+            return code
+        return self._return_frame()
+
+    def _return_routine(self):
+        """
+        Generates the shared '$$RETURN' routine.
+        return:
+            code in Hack Assembly
+        """
+        return '($$RETURN)'+'\n' + self._return_frame()
+
+    def _return_frame(self):
+        """
+        Generates code restoring the frame of the caller and jumping to the return address.
+        return:
+            code in Hack Assembly
+        """
         code  = '@LCL'+'\n'
         code += 'A=M'+'\n'
         code += 'D=A'+'\n'
@@ -0,0 +1,235 @@
+import argparse
+import os.path
+
+from Parser import Parser, Command, C_ARITHMETIC, C_PUSH, C_POP, C_LABEL, C_GOTO, C_IFGOTO, C_FUNCTION, C_RETURN, C_CALL
+
+# ========================= ConstantFolder CLASS
+
+def _signed(value):
+    return value-0x10000 if value & 0x8000 else value
+
+# the 16-bit results of the operations on the 16-bit operands; the comparisons
+# use the sign of the wrapped difference, exactly as the generated code does
+_BINARY = {
+    'add': lambda x, y: (x+y) & 0xFFFF,
+    'sub': lambda x, y: (x-y) & 0xFFFF,
+    'and': lambda x, y: x & y,
+    'or':  lambda x, y: x | y,
+    'eq':  lambda x, y: 0xFFFF if x == y else 0,
+    'gt':  lambda x, y: 0xFFFF if _signed((x-y) & 0xFFFF) > 0 else 0,
+    'lt':  lambda x, y: 0xFFFF if _signed((x-y) & 0xFFFF) < 0 else 0,
+    'multiply': lambda x, y: (x*y) & 0xFFFF,
+}
+_UNARY = {
+    'neg': lambda x: (-x) & 0xFFFF,
+    'not': lambda x: x ^ 0xFFFF,
+}
+# operations having a neutral right operand: (operation, operand) -> whether also a neutral left operand
+_NEUTRAL = {
+    ('add', 0): True,
+    ('sub', 0): False,
+    ('or', 0): True,
+    ('and', 0xFFFF): True,
+    ('multiply', 1): True,
+}
+
+
+_KEYWORDS = {C_PUSH:'push', C_POP:'pop', C_LABEL:'label',
+             C_GOTO:'goto', C_IFGOTO:'if-goto', C_FUNCTION:'function',
+             C_CALL:'call'}
+
+
+def to_vm(parsed):
+    """
+    Renders a Command of the Parser as a VM command.
+    """
+    if parsed.cmd_type == C_ARITHMETIC:
+        return parsed.arg1
+    elif parsed.cmd_type == C_RETURN:
+        return 'return'
+    keyword = _KEYWORDS[parsed.cmd_type]
+    if parsed.arg2 is None:
+        return keyword+' '+parsed.arg1
+    return keyword+' '+parsed.arg1+' '+str(parsed.arg2)
+
+
+class ConstantFolder(object):
+    """
+    VM-to-VM pass folding the constant subexpressions with the 16-bit wraparound
+    and removing the neutral operations: x+0, x-0, x|0, x&-1, x*1 (and 0+x, 0|x,
+    -1&x, 1*x if x is a single push), double not and double neg.
+    The multiplication is 'call Math.multiply 2' of the Jack OS, which wraps around.
+    The pass works on the end of the already folded commands, so a label between
+    the commands stops any folding across it. The commands before such a barrier
+    are final and are passed on at once.
+    """
+    PATTERNS = ['constant', 'neutral', 'double']
+    # commands never removed nor matched by a rule (except 'call Math.multiply 2')
+    BARRIERS = frozenset([C_POP, C_LABEL, C_GOTO, C_IFGOTO, C_FUNCTION, C_RETURN, C_CALL])
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Resets the hit counts.
+        """
+        self.hits = {pattern: 0 for pattern in self.PATTERNS}
+
+    def fold(self, parsed_lines):
+        """
+        input:
+            parsed_lines    -iterable of the Commands of the Parser
+        output:
+            generator of the folded Commands
+        """
+        output = []
+        for parsed in parsed_lines:
+            output.append(parsed)
+            while output and self._reduce(output):
+                pass
+            if parsed.cmd_type in self.BARRIERS and output[-1] is parsed:
+                yield from output
+                output = []
+        yield from output
+
+    def _constant(self, commands, end):
+        """
+        Finds a constant pushed by the commands ending before the index end:
+        'push constant c', or 'push constant c' followed by 'neg' or 'not'.
+        output:
+            (16-bit value, index of the first command), or None
+        """
+        if end < 1:
+            return None
+        last = commands[end-1]
+        if last.cmd_type == C_PUSH and last.arg1 == 'constant':
+            return last.arg2, end-1
+        if end >= 2 and last.cmd_type == C_ARITHMETIC and last.arg1 in _UNARY:
+            first = commands[end-2]
+            if first.cmd_type == C_PUSH and first.arg1 == 'constant':
+                return _UNARY[last.arg1](first.arg2), end-2
+        return None
+
+    def _push_value(self, value, file_line):
+        """
+        Generates the commands pushing the 16-bit value.
+        """
+        push = lambda c: Command(C_PUSH, 'constant', c, file_line)
+        operation = lambda op: Command(C_ARITHMETIC, op, None, file_line)
+        if value < 0x8000:
+            return [push(value)]
+        elif value == 0x8000:
+            return [push(0x7FFF), operation('not')]
+        return [push(0x10000-value), operation('neg')]
+
+    def _reduce(self, commands):
+        """
+        Applies one rule on the end of the commands.
+        output:
+            True if the commands were changed
+        """
+        last = commands[-1]
+        if last.cmd_type == C_ARITHMETIC:
+            operation = last.arg1
+        elif last.cmd_type == C_CALL and last.arg1 == 'Math.multiply' and last.arg2 == 2:
+            operation = 'multiply'
+        else:
+            return False
+        end = len(commands)-1
+
+        if operation in _UNARY:
+            previous = commands[end-1] if end else None
+            if previous and previous.cmd_type == C_ARITHMETIC and previous.arg1 == operation:
+                del commands[end-1:]
+                self.hits['double'] += 1
+                return True
+            operand = self._constant(commands, end)
+            if operand is None:
+                return False
+            folded = self._push_value(_UNARY[operation](operand[0]), last.file_line)
+            return self._replace(commands, operand[1], folded)
+
+        y = self._constant(commands, end)
+        if y is None:
+            return self._reduce_neutral_left(commands, operation)
+        x = self._constant(commands, y[1])
+        if x is not None:
+            folded = self._push_value(_BINARY[operation](x[0], y[0]), last.file_line)
+            return self._replace(commands, x[1], folded)
+        if (operation, y[0]) in _NEUTRAL:
+            del commands[y[1]:]
+            self.hits['neutral'] += 1
+            return True
+        return False
+
+    def _reduce_neutral_left(self, commands, operation):
+        """
+        Removes a neutral left operand followed by a single push, e.g. 'push constant 0, push local 1, add'.
+        output:
+            True if the commands were changed
+        """
+        end = len(commands)-1
+        if end >= 1 and commands[end-1].cmd_type == C_PUSH:
+            x = self._constant(commands, end-1)
+            if x is not None and _NEUTRAL.get((operation, x[0])):
+                commands[x[1]:] = [commands[end-1]]
+                self.hits['neutral'] += 1
+                return True
+        return False
+
+    def _replace(self, commands, start, folded):
+        """
+        Replaces the commands from the index start by the folded ones, unless they are the same.
+        output:
+            True if the commands were changed
+        """
+        current = commands[start:]
+        if len(current) == len(folded) and all(to_vm(a) == to_vm(b) for a, b in zip(current, folded)):
+            return False
+        commands[start:] = folded
+        self.hits['constant'] += 1
+        return True
+
+
+def fold_file(src_path, dst_path, folder):
+    """
+    Folds a '.vm' file into another one.
+    output:
+        (number of the commands before, number of the commands after)
+    """
+    parser = Parser()
+    src_file = open(src_path, 'r')
+    parsed_lines = [parsed for parsed in map(parser.parse, src_file) if parsed]
+    src_file.close()
+    folded = list(folder.fold(parsed_lines))
+    dst_file = open(dst_path, 'w')
+    dst_file.write(''.join(to_vm(parsed)+'\n' for parsed in folded))
+    dst_file.close()
+    return len(parsed_lines), len(folded)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Folds the constant expressions of '.vm' files.")
+    arg_parser.add_argument('src', help="'.vm' file, or directory of '.vm' files")
+    arg_parser.add_argument('dst', help="output '.vm' file, or output directory")
+    args = arg_parser.parse_args()
+
+    if os.path.isdir(args.src):
+        os.makedirs(args.dst, exist_ok=True)
+        pairs = [(os.path.join(args.src, file), os.path.join(args.dst, file))
+                 for file in sorted(os.listdir(args.src)) if file.endswith('.vm')]
+    elif args.src.endswith('.vm'):
+        pairs = [(args.src, args.dst)]
+    else:
+        raise ValueError("Provided argument is neither a '.vm' file nor a directory.")
+
+    folder = ConstantFolder()
+    before = after = 0
+    for src_path, dst_path in pairs:
+        n_before, n_after = fold_file(src_path, dst_path, folder)
+        before += n_before
+        after += n_after
+    print('{} -> {} commands'.format(before, after))
+    for pattern in folder.PATTERNS:
+        print('  {0:<9} {1}'.format(pattern, folder.hits[pattern]))
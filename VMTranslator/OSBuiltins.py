@@ -0,0 +1,444 @@
+from array import array
+
+# ========================= Native OS functions
+#
+# Python versions of the functions of 12/*.jack, working on the RAM image of the
+# VMInterpreter. A builtin is called as builtin(ram, statics, *args): statics maps
+# a class name to the address of its static 0, the arguments are 16-bit words.
+# It returns the 16-bit return value (0 for the void functions), or None when
+# the arguments lead to Sys.error: the Jack implementation runs then, so the
+# error is reported the same way. A builtin leaves the RAM as its Jack
+# implementation does, except the cells above SP and the temp segment.
+#
+# The static variables are found by their index in the classes of 12/*.jack.
+# The comparisons are those of the VM: the sign of the wrapped difference.
+
+SCREEN_WORDS = 8192
+
+_BLANK = array('H', bytes(2*SCREEN_WORDS))
+
+def _signed(word):
+    return word-0x10000 if word & 0x8000 else word
+
+def _lt(a, b):
+    return (a-b) & 0x8000 != 0
+
+def _gt(a, b):
+    return 0 < (a-b) & 0xFFFF < 0x8000
+
+# --------------- Math
+
+def _abs(ram, statics, x):
+    return -x & 0xFFFF if x & 0x8000 else x
+
+def _multiply(ram, statics, x, y):
+    return (x*y) & 0xFFFF
+
+def _divide_positive(x, y):
+    """
+    Math.dividePositive.
+    """
+    if _lt(x, y) or y & 0x8000:
+        return 0
+    q = _divide_positive(x, (y+y) & 0xFFFF)
+    if _lt((x-2*q*y) & 0xFFFF, y):
+        return (q+q) & 0xFFFF
+    return (q+q+1) & 0xFFFF
+
+def _divide_words(x, y):
+    """
+    Math.divide, y != 0.
+    """
+    result = _divide_positive(_abs(None, None, x), _abs(None, None, y))
+    return result if (x & 0x8000) == (y & 0x8000) else -result & 0xFFFF
+
+def _divide(ram, statics, x, y):
+    if y == 0:
+        return None
+    return _divide_words(x, y)
+
+def _mod(ram, statics, x, y):
+    if y == 0:
+        return None
+    return (x-_divide_words(x, y)*y) & 0xFFFF
+
+def _sqrt_word(ram, statics, x):
+    """
+    Math.sqrt, with the powers of two of the Math bitArray.
+    """
+    bits = ram[statics['Math']]
+    y = 0
+    for i in range(7, -1, -1):
+        candidate = (y+ram[bits+i]) & 0xFFFF
+        square = (candidate*candidate) & 0xFFFF
+        if not _gt(square, x) and _gt(square, 0):
+            y = candidate
+    return y
+
+def _max(ram, statics, a, b):
+    return a if _gt(a, b) else b
+
+def _min(ram, statics, a, b):
+    return a if _lt(a, b) else b
+
+# --------------- Memory: static heapBase, heapSize, idxL, idxN, idxAloc, memory, freeList
+
+_HEAP_SIZE, _IDX_L, _IDX_N, _IDX_ALOC, _MEMORY, _FREE_LIST = 1, 2, 3, 4, 5, 6
+
+def _peek(ram, statics, address):
+    return ram[(ram[statics['Memory']+_MEMORY]+address) & 0xFFFF]
+
+def _poke(ram, statics, address, value):
+    ram[(ram[statics['Memory']+_MEMORY]+address) & 0xFFFF] = value
+    return 0
+
+def _alloc(ram, statics, size):
+    """
+    Memory.alloc with Memory.bestFit; None before any change when no block fits.
+    """
+    m = statics['Memory']
+    idx_l, idx_n = ram[m+_IDX_L], ram[m+_IDX_N]
+    free_list = ram[m+_FREE_LIST]
+    if free_list == 0:
+        return None
+    if ram[(free_list+idx_n) & 0xFFFF] == 0:
+        best = free_list
+        ram[m+_FREE_LIST] = 0
+    else:
+        best_size = ram[m+_HEAP_SIZE]
+        fit = (size+1) & 0xFFFF
+        cur = free_list
+        cur_size = ram[(cur+idx_l) & 0xFFFF]
+        prev = best = prev_best = 0
+        while not (best_size == fit or cur == 0):
+            if _gt(cur_size, size) and _lt(cur_size, best_size):
+                prev_best, best, best_size = prev, cur, cur_size
+            prev = cur
+            cur = ram[(cur+idx_n) & 0xFFFF]
+            cur_size = ram[(cur+idx_l) & 0xFFFF]
+        if best == 0:
+            return None
+        if prev_best == 0:
+            ram[m+_FREE_LIST] = ram[(best+idx_n) & 0xFFFF]
+        else:
+            ram[(prev_best+idx_n) & 0xFFFF] = ram[(best+idx_n) & 0xFFFF]
+
+    block_size = ram[(best+idx_l) & 0xFFFF]
+    if _gt(block_size, (size+2) & 0xFFFF):
+        block_size = (block_size-(size+1)) & 0xFFFF
+        ram[(best+idx_l) & 0xFFFF] = block_size
+        address = (best+block_size+1) & 0xFFFF
+        ram[(address+ram[m+_IDX_ALOC]) & 0xFFFF] = (size+1) & 0xFFFF
+        ram[(best+idx_n) & 0xFFFF] = ram[m+_FREE_LIST]
+        ram[m+_FREE_LIST] = best
+        return address
+    return (best+1) & 0xFFFF
+
+def _de_alloc(ram, statics, block):
+    m = statics['Memory']
+    block = (block-1) & 0xFFFF
+    ram[(block+ram[m+_IDX_N]) & 0xFFFF] = ram[m+_FREE_LIST]
+    ram[m+_FREE_LIST] = block
+    return 0
+
+# --------------- Screen: static bitArray, screen, color
+
+_SCREEN, _COLOR = 1, 2
+
+def _off_screen(x, y):
+    return not (0 <= x <= 511 and 0 <= y <= 255)
+
+def _update_location(ram, s, address, mask):
+    address = (ram[s+_SCREEN]+address) & 0xFFFF
+    if ram[s+_COLOR]:
+        ram[address] |= mask
+    else:
+        ram[address] &= mask ^ 0xFFFF
+
+def _draw_pixel_at(ram, s, x, y):
+    x_div_16 = x//16
+    _update_location(ram, s, y*32+x_div_16, ram[ram[s]+x-x_div_16*16])
+
+def _draw_hline_at(ram, s, x1, x2, y):
+    """
+    Screen.drawHline after the checks.
+    """
+    if x1 > x2:
+        x1, x2 = x2, x1
+    bits = ram[s]
+    x1_div_16 = x1//16
+    x1_mod_16 = x1-x1_div_16*16
+    address = y*32+x1_div_16
+    mask = 0
+    while not x2 < x1:
+        while not x2 < x1 and x1_mod_16 < 16:
+            mask = (mask+ram[bits+x1_mod_16]) & 0xFFFF
+            x1_mod_16 += 1
+            x1 += 1
+        _update_location(ram, s, address, mask)
+        x1_mod_16 = 0
+        mask = 0
+        address += 1
+
+def _draw_vline_at(ram, s, x, y1, y2):
+    """
+    Screen.drawVline after the checks.
+    """
+    if y1 > y2:
+        y1, y2 = y2, y1
+    x_div_16 = x//16
+    mask = ram[ram[s]+x-x_div_16*16]
+    address = y1*32+x_div_16
+    while not y2 < y1:
+        _update_location(ram, s, address, mask)
+        y1 += 1
+        address += 32
+
+def _clear_screen(ram, statics):
+    base = ram[statics['Screen']+_SCREEN]
+    if base+SCREEN_WORDS > len(ram):
+        return None
+    ram[base:base+SCREEN_WORDS] = _BLANK
+    return 0
+
+def _set_color(ram, statics, b):
+    ram[statics['Screen']+_COLOR] = b
+    return 0
+
+def _draw_pixel(ram, statics, x, y):
+    x, y = _signed(x), _signed(y)
+    if _off_screen(x, y):
+        return None
+    _draw_pixel_at(ram, statics['Screen'], x, y)
+    return 0
+
+def _draw_hline(ram, statics, x1, x2, y):
+    x1, x2, y = _signed(x1), _signed(x2), _signed(y)
+    if _off_screen(x1, y) or _off_screen(x2, y):
+        return None
+    _draw_hline_at(ram, statics['Screen'], x1, x2, y)
+    return 0
+
+def _draw_vline(ram, statics, x, y1, y2):
+    x, y1, y2 = _signed(x), _signed(y1), _signed(y2)
+    if _off_screen(x, y1) or _off_screen(x, y2):
+        return None
+    _draw_vline_at(ram, statics['Screen'], x, y1, y2)
+    return 0
+
+def _draw_line(ram, statics, x1, y1, x2, y2):
+    x1, y1, x2, y2 = _signed(x1), _signed(y1), _signed(x2), _signed(y2)
+    if _off_screen(x1, y1) or _off_screen(x2, y2):
+        return None
+    s = statics['Screen']
+    if y1 == y2:
+        _draw_hline_at(ram, s, x1, x2, y1)
+        return 0
+    if x1 == x2:
+        _draw_vline_at(ram, s, x1, y1, y2)
+        return 0
+    if x1 > x2:
+        x1, x2, y1, y2 = x2, x1, y2, y1
+    dx, dy = x2-x1, y2-y1
+    a = b = diff = 0
+    if y1 < y2:
+        while not a > dx and not b > dy:
+            _draw_pixel_at(ram, s, x1+a, y1+b)
+            if diff < 0:
+                a += 1
+                diff += dy
+            else:
+                b += 1
+                diff -= dx
+    else:
+        while not a > dx and not b < dy:
+            _draw_pixel_at(ram, s, x1+a, y1+b)
+            if diff > 0:
+                a += 1
+                diff += dy
+            else:
+                b -= 1
+                diff += dx
+    return 0
+
+def _draw_rectangle(ram, statics, x1, y1, x2, y2):
+    x1, y1, x2, y2 = _signed(x1), _signed(y1), _signed(x2), _signed(y2)
+    if _off_screen(x1, y1) or _off_screen(x2, y2) or x1 > x2 or y1 > y2:
+        return None
+    s = statics['Screen']
+    bits = ram[s]
+    x1_div_16 = x1//16
+    x1_mod_16 = x1-x1_div_16*16
+    address_0 = y1*32+x1_div_16
+    mask = 0
+    while not x2 < x1:
+        while not x2 < x1 and x1_mod_16 < 16:
+            mask = (mask+ram[bits+x1_mod_16]) & 0xFFFF
+            x1_mod_16 += 1
+            x1 += 1
+        for address in range(address_0, address_0+32*(y2-y1+1), 32):
+            _update_location(ram, s, address, mask)
+        x1_mod_16 = 0
+        mask = 0
+        address_0 += 1
+    return 0
+
+def _draw_circle(ram, statics, x, y, r):
+    """
+    Screen.drawCircle; the lines are checked before the first one is drawn.
+    """
+    x, y, r = _signed(x), _signed(y), _signed(r)
+    if _off_screen(x, y) or _gt(r & 0xFFFF, 181):
+        return None
+    r2 = (r*r) & 0xFFFF
+    lines = []
+    dx = dy = 0
+    while not dy > dx:
+        dx = _sqrt_word(ram, statics, (r2-dy*dy) & 0xFFFF)
+        lines.append((x-dx, x+dx, y+dy))
+        lines.append((x-dx, x+dx, y-dy))
+        lines.append((x-dy, x+dy, y+dx))
+        lines.append((x-dy, x+dy, y-dx))
+        dy += 1
+    for x1, x2, line_y in lines:
+        if _off_screen(x1, line_y) or _off_screen(x2, line_y):
+            return None
+    for x1, x2, line_y in lines:
+        _draw_hline_at(ram, statics['Screen'], x1, x2, line_y)
+    return 0
+
+# --------------- Output: static cursorX, cursorY, screen, charMaps, charMasks
+
+_CURSOR_Y, _OUTPUT_SCREEN, _CHAR_MAPS, _CHAR_MASKS = 1, 2, 3, 4
+
+def _new_line(ram, o):
+    if _lt(ram[o+_CURSOR_Y], 22):
+        ram[o] = 0
+        ram[o+_CURSOR_Y] = (ram[o+_CURSOR_Y]+1) & 0xFFFF
+    else:
+        ram[o] = 0
+        ram[o+_CURSOR_Y] = 0
+
+def _print_char(ram, statics, c):
+    o = statics['Output']
+    if _lt(c, 32) or _gt(c, 126):
+        c = 0
+    char_map = ram[(ram[o+_CHAR_MAPS]+c) & 0xFFFF]
+    cursor_x = ram[o]
+    address = (ram[o+_CURSOR_Y]*32*11+_divide_words(cursor_x, 2)) & 0xFFFF
+    mask = cursor_x & 1
+    screen = ram[o+_OUTPUT_SCREEN]
+    for i in range(11):
+        bitmap = ram[(char_map+i) & 0xFFFF]
+        if mask == 1:
+            bitmap = (bitmap*256) & 0xFFFF
+        cell = (screen+address) & 0xFFFF
+        ram[cell] = (ram[cell] & ram[(ram[o+_CHAR_MASKS]+mask) & 0xFFFF]) | bitmap
+        address = (address+32) & 0xFFFF
+    if cursor_x == 63:
+        _new_line(ram, o)
+    else:
+        ram[o] = (cursor_x+1) & 0xFFFF
+    return 0
+
+def _print_string(ram, statics, s):
+    """
+    Output.printString, with the fields str and sLen of 12/String.jack.
+    """
+    i = 0
+    while _lt(i, ram[(s+1) & 0xFFFF]):
+        _print_char(ram, statics, ram[(ram[s]+i) & 0xFFFF])
+        i += 1
+    return 0
+
+def _move_cursor(ram, statics, i, j):
+    o = statics['Output']
+    ram[o] = j
+    ram[o+_CURSOR_Y] = i
+    return 0
+
+def _println(ram, statics):
+    _new_line(ram, statics['Output'])
+    return 0
+
+def _back_space(ram, statics):
+    o = statics['Output']
+    if ram[o] == 0:
+        if ram[o+_CURSOR_Y] != 0:
+            ram[o] = 63
+            ram[o+_CURSOR_Y] = (ram[o+_CURSOR_Y]-1) & 0xFFFF
+    else:
+        ram[o] = (ram[o]-1) & 0xFFFF
+    cursor_x = ram[o]
+    address = (ram[o+_CURSOR_Y]*32*11+_divide_words(cursor_x, 2)) & 0xFFFF
+    mask = cursor_x & 1
+    screen = ram[o+_OUTPUT_SCREEN]
+    for i in range(11):
+        cell = (screen+address) & 0xFFFF
+        ram[cell] &= ram[(ram[o+_CHAR_MASKS]+mask) & 0xFFFF]
+        address = (address+32) & 0xFFFF
+    return 0
+
+# --------------- Sys
+
+def _wait(ram, statics, duration):
+    if duration & 0x8000:
+        return None
+    return 0
+
+# ========================= Builtin selection
+
+BUILTINS = {
+    'Math.abs': _abs,
+    'Math.multiply': _multiply,
+    'Math.divide': _divide,
+    'Math.mod': _mod,
+    'Math.sqrt': _sqrt_word,
+    'Math.max': _max,
+    'Math.min': _min,
+    'Memory.peek': _peek,
+    'Memory.poke': _poke,
+    'Memory.alloc': _alloc,
+    'Memory.deAlloc': _de_alloc,
+    'Screen.clearScreen': _clear_screen,
+    'Screen.setColor': _set_color,
+    'Screen.drawPixel': _draw_pixel,
+    'Screen.drawHline': _draw_hline,
+    'Screen.drawVline': _draw_vline,
+    'Screen.drawLine': _draw_line,
+    'Screen.drawRectangle': _draw_rectangle,
+    'Screen.drawCircle': _draw_circle,
+    'Output.moveCursor': _move_cursor,
+    'Output.printChar': _print_char,
+    'Output.printString': _print_string,
+    'Output.println': _println,
+    'Output.backSpace': _back_space,
+    'Sys.wait': _wait,
+}
+
+
+def n_arguments(builtin):
+    """
+    Returns the number of the VM arguments of a builtin.
+    """
+    return builtin.__code__.co_argcount-2
+
+
+def select_builtins(names):
+    """
+    input:
+        names       -function names, like 'Math.multiply', or class names for all
+                     the builtins of the class; empty for all the builtins
+    output:
+        dictionary function name -> builtin
+    """
+    if not names:
+        return dict(BUILTINS)
+    selected = {}
+    for name in names:
+        matches = {fct_name: builtin for fct_name, builtin in BUILTINS.items()
+                   if fct_name == name or fct_name.split('.')[0] == name}
+        if not matches:
+            raise ValueError("No builtin for {}.".format(name))
+        selected.update(matches)
+    return selected
@@ -1,3 +1,74 @@
+from enum import IntEnum
+from sys import intern
+
+# ========================= Command records
+
+class CommandType(IntEnum):
+    """
+    Types of the VM commands; the last four are the fused commands of VMOptimiser.
+    """
+    C_ARITHMETIC = 0
+    C_PUSH = 1
+    C_POP = 2
+    C_LABEL = 3
+    C_GOTO = 4
+    C_IFGOTO = 5
+    C_FUNCTION = 6
+    C_RETURN = 7
+    C_CALL = 8
+    C_MOVE = 9
+    C_EQ_ZERO = 10
+    C_IFNOT = 11
+    C_INC = 12
+
+
+class Command(object):
+    """
+    Parsed VM command.
+        cmd_type    -CommandType
+        arg1        -interned str: the operation of C_ARITHMETIC, the segment,
+                     the label or the function name; None for C_RETURN
+        arg2        -int: the index, nVars or nArgs; None for the other commands
+        file_line   -int
+        arg3, arg4  -destination segment and index of C_MOVE, None otherwise
+    """
+    __slots__ = ('cmd_type', 'arg1', 'arg2', 'file_line', 'arg3', 'arg4')
+
+    def __init__(self, cmd_type, arg1, arg2, file_line, arg3=None, arg4=None):
+        self.cmd_type = cmd_type
+        self.arg1 = arg1
+        self.arg2 = arg2
+        self.file_line = file_line
+        self.arg3 = arg3
+        self.arg4 = arg4
+
+    def __repr__(self):
+        return 'Command({}, {!r}, {!r}, {})'.format(self.cmd_type.name, self.arg1, self.arg2, self.file_line)
+
+
+# module-level aliases: a lookup on the enum class is slow in the hot loops
+(C_ARITHMETIC, C_PUSH, C_POP, C_LABEL, C_GOTO, C_IFGOTO, C_FUNCTION, C_RETURN, C_CALL,
+ C_MOVE, C_EQ_ZERO, C_IFNOT, C_INC) = CommandType
+
+ARITHMETIC = ['add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not']
+PUSH_SEGMENTS = ['constant', 'temp', 'pointer', 'static', 'local', 'argument', 'this', 'that']
+POP_SEGMENTS = ['temp', 'pointer', 'static', 'local', 'argument', 'this', 'that']
+
+MAX_KNOWN_LINES = 1 << 16  # the lines remembered by the Parser, so that its memory stays bounded
+
+# first word -> (command type, number of words, valid segments or None)
+_COMMANDS = {
+    'push':     (C_PUSH, 3, frozenset(PUSH_SEGMENTS)),
+    'pop':      (C_POP, 3, frozenset(POP_SEGMENTS)),
+    'label':    (C_LABEL, 2, None),
+    'goto':     (C_GOTO, 2, None),
+    'if-goto':  (C_IFGOTO, 2, None),
+    'function': (C_FUNCTION, 3, None),
+    'call':     (C_CALL, 3, None),
+    'return':   (C_RETURN, 1, None),
+}
+_COMMANDS.update({operation: (C_ARITHMETIC, 1, None) for operation in ARITHMETIC})
+
 # ========================= Parser CLASS
 
 class Parser(object):
@@ -7,6 +78,7 @@ class Parser(object):
     def __init__(self):
         self._cmd_line = 0
         self._file_line = 0
+        self._known = {}        # line -> (cmd_type, arg1, arg2) of the lines already parsed, () if empty
 
 
     def reset(self):
@@ -22,174 +94,59 @@ class Parser(object):
         args:
           - line_str: string to be parsed
         ret:
-          - dict: containing cmd_type, arg1, arg2, and file_line
+          - Command, or None for an empty line or a comment
 
-        value for:
-          - cmd_type key is one of the following:
+        Command.cmd_type is one of the CommandType:
             C_PUSH, C_POP, C_ARITHMETIC,
             C_LABEL, C_GOTO, C_IFGOTO,
-            C_FUNCTION, C_RETURN, C_CALL, None
+            C_FUNCTION, C_RETURN, C_CALL
 
-          - arg1 key (is str and) returns the first argument of the command.
+        Command.arg1 (is an interned str and) is the first argument of the command.
             If cmd_type == C_ARITHMETIC, then arg1 is the command itself (add, etc.)
             If cmd_type == C_RETURN, then the value = None
 
-          - arg2 key (is str(int) and) returns the second argument of the command.
-            If cmd_type == C_PUSH, C_POP, C_FUNCTION or C_CALL; then the value = None
+        Command.arg2 (is an int and) is the second argument of the command.
+            If cmd_type is not C_PUSH, C_POP, C_FUNCTION or C_CALL; then the value = None
 
-          - file_line key is an int
+        A line seen before is not checked again; only its Command is created.
         """
-        string = self._purify(line_str)
-        self._file_line +=1
-        if not string: # if string is empty or None
+        self._file_line += 1
+        known = self._known.get(line_str)
+        if known is None:
+            if len(self._known) >= MAX_KNOWN_LINES:
+                self._known.clear()
+            known = self._known[line_str] = self._split(line_str)
+        if not known:
             return None
-
-        words = string.split()
-        if self._is_push(words):
-            self._cmd_line += 1
-            return {'cmd_type':'C_PUSH', 'arg1':words[1], 'arg2':words[2], 'file_line': self._file_line}
-        elif self._is_pop(words):
-            self._cmd_line += 1
-            return {'cmd_type':'C_POP', 'arg1':words[1], 'arg2':words[2], 'file_line': self._file_line}
-        elif self._is_arithmetic(words):
-            self._cmd_line += 1
-            return {'cmd_type':'C_ARITHMETIC', 'arg1':words[0], 'arg2':None, 'file_line': self._file_line}
-        elif self._is_label(words):
-            self._cmd_line += 1
-            return {'cmd_type':'C_LABEL', 'arg1':words[1], 'arg2':None, 'file_line': self._file_line}
-        elif self._is_goto(words):
-            self._cmd_line += 1
-            return {'cmd_type':'C_GOTO', 'arg1':words[1], 'arg2':None, 'file_line': self._file_line}
-        elif self._is_ifgoto(words):
-            self._cmd_line += 1
-            return {'cmd_type':'C_IFGOTO', 'arg1':words[1], 'arg2':None, 'file_line': self._file_line}
-        elif self._is_function(words):
-            self._cmd_line += 1
-            return {'cmd_type':'C_FUNCTION', 'arg1':words[1], 'arg2':words[2], 'file_line': self._file_line}
-        elif self._is_call(words):
-            self._cmd_line += 1
-            return {'cmd_type':'C_CALL', 'arg1':words[1], 'arg2':words[2], 'file_line': self._file_line}
-        elif self._is_return(words):
-            self._cmd_line += 1
-            return {'cmd_type':'C_RETURN', 'arg1':None, 'arg2':None, 'file_line': self._file_line}
+        self._cmd_line += 1
+        return Command(known[0], known[1], known[2], self._file_line)
 
 
     # --------------- Helper functions
 
-    def _purify(self, line_str):
-        """
-        This function removes end of line character, comments,
-        and emty space at the beginning and end of command.
-        """
-        string = line_str.strip('\n')
-        string = string.strip()
-        comment_idx = string.find('//')
-        if comment_idx == -1:
-            return string.strip()
-        elif comment_idx == 0:
-            return None
-        else:
-            return string[0:comment_idx].strip()
-
-    def _is_arithmetic(self, words):
-        """
-        Checks for arithmetic commands.
-        """
-        if words[0] in ['add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not']:
-            if len(words) != 1:
-                raise SyntaxError("File line {}: Invalid number of arguments for C_ARITHMETIC command.".format(self._file_line))
-            return True
-        else:
-            return False
-
-    def _is_push(self, words):
-        """
-        Checks for push commands.
-        """
-        if words[0] == 'push':
-            if len(words) != 3:
-                raise SyntaxError("File line {}: Invalid number of arguments for C_PUSH command.".format(self._file_line))
-            if words[1] not in ['constant', 'temp', 'pointer', 'static', 'local', 'argument', 'this', 'that']:
-                raise SyntaxError("File line {}: Invalid second argument.".format(self._file_line))
-            return True
-        else:
-            return False
-
-    def _is_pop(self, words):
-        """
-        Checks for pop commands.
-        """
-        if words[0] == 'pop':
-            if len(words) != 3:
-                raise SyntaxError("File line {}: Invalid number of arguments for C_POP command.".format(self._file_line))
-            if words[1] not in ['temp', 'pointer', 'static', 'local', 'argument', 'this', 'that']:
-                raise SyntaxError("File line {}: Invalid second argument.".format(self._file_line))
-            return True
-        else:
-            return False
-
-    def _is_label(self, words):
-        """
-        Check for label commands.
-        """
-        if words[0] == 'label':
-            if len(words) != 2:
-                raise SyntaxError("File line {}: Invalid number of arguments for C_LABEL command.".format(self._file_line))
-            return True
-        else:
-            return False
-
-    def _is_goto(self, words):
-        """
-        Check for goto commands.
-        """
-        if words[0] == 'goto':
-            if len(words) != 2:
-                raise SyntaxError("File line {}: Invalid number of arguments for C_GOTO command.".format(self._file_line))
-            return True
-        else:
-            return False
-
-    def _is_ifgoto(self, words):
-        """
-        Check for if-goto commands.
-        """
-        if words[0] == 'if-goto':
-            if len(words) != 2:
-                raise SyntaxError("File line {}: Invalid number of arguments for C_IFGOTO command.".format(self._file_line))
-            return True
-        else:
-            return False
-
-    def _is_function(self, words):
-        """
-        Check for function commands.
-        """
-        if words[0] == 'function':
-            if len(words) != 3:
-                raise SyntaxError("File line {}: Invalid number of arguments for C_FUNCTION command.".format(self._file_line))
-            return True
-        else:
-            return False
-
-    def _is_call(self, words):
-        """
-        Check for call commands.
-        """
-        if words[0] == 'call':
-            if len(words) != 3:
-                raise SyntaxError("File line {}: Invalid number of arguments for C_CALL command.".format(self._file_line))
-            return True
-        else:
-            return False
-
-    def _is_return(self, words):
-        """
-        Check for return commands.
-        """
-        if words[0] == 'return':
-            if len(words) != 1:
-                raise SyntaxError("File line {}: Invalid number of arguments for C_RETURN command.".format(self._file_line))
-            return True
-        else:
-            return False
+    def _split(self, line_str):
+        """
+        Checks a line and splits it into the fields of its Command.
+        output:
+            (cmd_type, arg1, arg2), or () for an empty line or a comment
+        """
+        words = line_str.partition('//')[0].split()
+        if not words:
+            return ()
+
+        entry = _COMMANDS.get(words[0])
+        if entry is None:
+            raise SyntaxError("File line {}: Unknown command '{}'.".format(self._file_line, words[0]))
+        cmd_type, n_words, segments = entry
+        if len(words) != n_words:
+            raise SyntaxError("File line {}: Invalid number of arguments for {} command.".format(self._file_line, cmd_type.name))
+
+        if n_words == 1:
+            return cmd_type, intern(words[0]) if cmd_type == C_ARITHMETIC else None, None
+        if segments is not None and words[1] not in segments:
+            raise SyntaxError("File line {}: Invalid second argument.".format(self._file_line))
+        if n_words == 2:
+            return cmd_type, intern(words[1]), None
+        if not words[2].isdigit():
+            raise SyntaxError("File line {}: Invalid third argument.".format(self._file_line))
+        return cmd_type, intern(words[1]), int(words[2])
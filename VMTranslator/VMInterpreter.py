@@ -0,0 +1,675 @@
+import argparse
+import os.path
+import time
+from array import array
+
+from OSBuiltins import n_arguments, select_builtins
+from Parser import Parser, C_ARITHMETIC, C_PUSH, C_POP, C_LABEL, C_GOTO, C_IFGOTO, C_FUNCTION, C_CALL
+
+# ========================= Hack RAM layout
+
+RAM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+SP, LCL, ARG, THIS, THAT = 0, 1, 2, 3, 4
+TEMP = 5
+STATIC = 16
+STACK = 256
+HEAP = 2048
+
+ZEROS = array('H', bytes(2*RAM_SIZE))     # source of the local variables of the functions
+
+POINTERS = {'local': LCL, 'argument': ARG, 'this': THIS, 'that': THAT}
+
+# ========================= Command handlers
+#
+# A compiled command is (handler, x, y); handler(x, y, pc, ram) executes it and
+# returns the index of the next command. The values in the RAM are unsigned
+# 16-bit words, like in the HackCPU.
+
+def _push_constant(x, y, pc, ram):
+    sp = ram[0]
+    ram[sp] = x
+    ram[0] = sp+1
+    return pc+1
+
+def _push_fixed(x, y, pc, ram):             # temp, pointer and static: x is the address
+    sp = ram[0]
+    ram[sp] = ram[x]
+    ram[0] = sp+1
+    return pc+1
+
+def _push_segment(x, y, pc, ram):           # local, argument, this and that: x is the pointer, y the index
+    sp = ram[0]
+    ram[sp] = ram[ram[x]+y]
+    ram[0] = sp+1
+    return pc+1
+
+def _pop_fixed(x, y, pc, ram):
+    sp = ram[0]-1
+    ram[0] = sp
+    ram[x] = ram[sp]
+    return pc+1
+
+def _pop_segment(x, y, pc, ram):
+    sp = ram[0]-1
+    ram[0] = sp
+    ram[ram[x]+y] = ram[sp]
+    return pc+1
+
+def _add(x, y, pc, ram):
+    sp = ram[0]-1
+    ram[0] = sp
+    ram[sp-1] = (ram[sp-1]+ram[sp]) & 0xFFFF
+    return pc+1
+
+def _sub(x, y, pc, ram):
+    sp = ram[0]-1
+    ram[0] = sp
+    ram[sp-1] = (ram[sp-1]-ram[sp]) & 0xFFFF
+    return pc+1
+
+def _and(x, y, pc, ram):
+    sp = ram[0]-1
+    ram[0] = sp
+    ram[sp-1] &= ram[sp]
+    return pc+1
+
+def _or(x, y, pc, ram):
+    sp = ram[0]-1
+    ram[0] = sp
+    ram[sp-1] |= ram[sp]
+    return pc+1
+
+def _neg(x, y, pc, ram):
+    sp = ram[0]-1
+    ram[sp] = -ram[sp] & 0xFFFF
+    return pc+1
+
+def _not(x, y, pc, ram):
+    sp = ram[0]-1
+    ram[sp] ^= 0xFFFF
+    return pc+1
+
+# the comparisons use the sign of the wrapped difference, as the translated code does
+
+def _eq(x, y, pc, ram):
+    sp = ram[0]-1
+    ram[0] = sp
+    ram[sp-1] = 0xFFFF if ram[sp-1] == ram[sp] else 0
+    return pc+1
+
+def _gt(x, y, pc, ram):
+    sp = ram[0]-1
+    ram[0] = sp
+    difference = (ram[sp-1]-ram[sp]) & 0xFFFF
+    ram[sp-1] = 0xFFFF if 0 < difference < 0x8000 else 0
+    return pc+1
+
+def _lt(x, y, pc, ram):
+    sp = ram[0]-1
+    ram[0] = sp
+    ram[sp-1] = 0xFFFF if (ram[sp-1]-ram[sp]) & 0x8000 else 0
+    return pc+1
+
+def _goto(x, y, pc, ram):
+    return x
+
+def _ifgoto(x, y, pc, ram):
+    sp = ram[0]-1
+    ram[0] = sp
+    return x if ram[sp] else pc+1
+
+def _function(x, y, pc, ram):               # x is nVars, y the array of nVars zeros
+    sp = ram[0]
+    ram[sp:sp+x] = y
+    ram[0] = sp+x
+    return pc+1
+
+def _call(x, y, pc, ram):                   # x is the index of the function, y nArgs
+    sp = ram[0]
+    ram[sp] = pc+1
+    ram[sp+1] = ram[1]
+    ram[sp+2] = ram[2]
+    ram[sp+3] = ram[3]
+    ram[sp+4] = ram[4]
+    sp += 5
+    ram[2] = sp-5-y
+    ram[1] = sp
+    ram[0] = sp
+    return x
+
+def _call_unknown(x, y, pc, ram):           # x is the name of a function missing in the program
+    raise NameError(x)
+
+def _call_builtin(x, y, pc, ram):           # x is (builtin, statics, index of the function)
+    builtin, statics, target = x
+    sp = ram[0]-y
+    value = builtin(ram, statics, *ram[sp:sp+y])
+    if value is None:
+        return _call(target, y, pc, ram)    # the Jack implementation handles the error
+    ram[sp] = value
+    ram[0] = sp+1
+    return pc+1
+
+def _call_verified(x, y, pc, ram):          # x is (interpreter, function name, builtin, index of the function)
+    interpreter, fct_name, builtin, target = x
+    return interpreter._verify_builtin(fct_name, builtin, target, y, pc)
+
+def _return(x, y, pc, ram):
+    frame = ram[1]
+    arg = ram[2]
+    return_address = ram[frame-5]           # read first: ARG is the same cell without arguments
+    ram[arg] = ram[ram[0]-1]
+    ram[0] = arg+1
+    ram[4] = ram[frame-1]
+    ram[3] = ram[frame-2]
+    ram[2] = ram[frame-3]
+    ram[1] = ram[frame-4]
+    return return_address
+
+ARITHMETIC_HANDLERS = {'add': _add, 'sub': _sub, 'neg': _neg, 'eq': _eq, 'gt': _gt, 'lt': _lt,
+                       'and': _and, 'or': _or, 'not': _not}
+
+# ========================= VMInterpreter CLASS
+
+class VMInterpreter(object):
+    """
+    Interpreter of VM programs. The commands are compiled once: the labels and the
+    functions are resolved into command indices, the segments into addresses or
+    pointers, and every command gets its handler from a table. The stack and the
+    segments live in a RAM array with the Hack layout; a return address is the
+    index of the command after the call.
+    """
+    def __init__(self, src_paths, bootstrap=True, builtins=None, verify=False):
+        """
+        input:
+            src_paths   -list of the '.vm' files of the program
+            bootstrap   -start by 'call Sys.init 0' with SP = 256; otherwise start
+                         at the first command with the RAM set by the caller
+            builtins    -dictionary function name -> builtin of OSBuiltins replacing
+                         the calls of the function; a call of a builtin is one command
+            verify      -run every builtin on a copy of the RAM and its Jack
+                         implementation on the RAM, and raise ValueError if they differ
+        """
+        self.ram = array('H', bytes(2*RAM_SIZE))
+        self._code = []             # compiled commands
+        self._locations = []        # (file name, file line) of the compiled commands
+        self._compile(src_paths, builtins or {}, verify)
+        if bootstrap:
+            # the call is the last command, Sys.init returns past the end of the program
+            self.pc = len(self._code)
+            if 'Sys.init' not in self._functions:
+                raise ValueError("Function Sys.init is not defined.")
+            self._code.append((_call, self._functions['Sys.init'], 0))
+            self._locations.append(('bootstrap', 0))
+            self.ram[SP] = STACK
+        else:
+            self.pc = 0
+        self.steps = 0
+        if len(self._code) > 0xFFFF:
+            raise ValueError("The program has {} commands, the return addresses have 16 bits.".format(len(self._code)))
+
+    def _compile(self, src_paths, builtins, verify):
+        """
+        Compiles the commands of the files in two passes: the first one finds the
+        functions and the labels, the second one creates the compiled commands.
+        A builtin replaces only a function of the program with its number of arguments.
+        """
+        parser = Parser()
+        self._statics = {}          # file name -> address of its static 0
+        commands = []               # (Command, file name, function name, first static address)
+        self._functions = {}        # function name -> index of its function command
+        labels = {}                 # (function name, label) -> index of the next command
+        static_base = STATIC
+        for src_path in src_paths:
+            f_name = os.path.basename(src_path).split('.')[0]
+            src_file = open(src_path, 'r')
+            parser.reset()
+            fct_name = None
+            n_statics = 0
+            self._statics[f_name] = static_base
+            for parsed in map(parser.parse, src_file):
+                if not parsed:
+                    continue
+                if parsed.cmd_type == C_FUNCTION:
+                    fct_name = parsed.arg1
+                    if fct_name in self._functions:
+                        raise ValueError("File {} line {}: Function {} already defined.".format(
+                            f_name, parsed.file_line, fct_name))
+                    self._functions[fct_name] = len(commands)
+                elif parsed.cmd_type == C_LABEL:
+                    labels[(fct_name, parsed.arg1)] = len(commands)
+                    continue
+                elif parsed.arg1 == 'static':
+                    n_statics = max(n_statics, parsed.arg2+1)
+                commands.append((parsed, f_name, fct_name, static_base))
+            src_file.close()
+            static_base += n_statics
+        self._targets = set(labels.values()) | set(self._functions.values())
+
+        for parsed, f_name, fct_name, static_base in commands:
+            cmd_type = parsed.cmd_type
+            location = (f_name, parsed.file_line)
+            if cmd_type == C_PUSH or cmd_type == C_POP:
+                segment, index = parsed.arg1, parsed.arg2
+                if segment == 'constant':
+                    if index > 0x7FFF:
+                        raise ValueError("File {} line {}: Constant {} does not fit into 15 bits.".format(
+                            f_name, parsed.file_line, index))
+                    command = (_push_constant, index, None)
+                elif segment in POINTERS:
+                    handler = _push_segment if cmd_type == C_PUSH else _pop_segment
+                    command = (handler, POINTERS[segment], index)
+                else:
+                    address = {'temp': TEMP, 'pointer': THIS, 'static': static_base}[segment]+index
+                    handler = _push_fixed if cmd_type == C_PUSH else _pop_fixed
+                    command = (handler, address, None)
+            elif cmd_type == C_ARITHMETIC:
+                command = (ARITHMETIC_HANDLERS[parsed.arg1], None, None)
+            elif cmd_type == C_GOTO or cmd_type == C_IFGOTO:
+                if (fct_name, parsed.arg1) not in labels:
+                    raise ValueError("File {} line {}: Unknown label {}.".format(f_name, parsed.file_line, parsed.arg1))
+                command = (_goto if cmd_type == C_GOTO else _ifgoto, labels[(fct_name, parsed.arg1)], None)
+            elif cmd_type == C_FUNCTION:
+                command = (_function, parsed.arg2, array('H', bytes(2*parsed.arg2)))
+            elif cmd_type == C_CALL:
+                builtin = builtins.get(parsed.arg1)
+                if builtin is not None and n_arguments(builtin) != parsed.arg2:
+                    builtin = None
+                if parsed.arg1 not in self._functions:
+                    command = (_call_unknown, parsed.arg1, parsed.arg2)     # fails only if executed
+                elif builtin is None:
+                    command = (_call, self._functions[parsed.arg1], parsed.arg2)
+                elif verify:
+                    command = (_call_verified, (self, parsed.arg1, builtin, self._functions[parsed.arg1]), parsed.arg2)
+                else:
+                    command = (_call_builtin, (builtin, self._statics, self._functions[parsed.arg1]), parsed.arg2)
+            else:
+                command = (_return, None, None)
+            self._code.append(command)
+            self._locations.append(location)
+
+    def _verify_builtin(self, fct_name, builtin, target, n_args, pc):
+        """
+        Runs a builtin on a copy of the RAM, then the Jack implementation of the
+        function until it returns, and compares the RAM except the temp segment
+        and the cells above SP.
+        output:
+            index of the command after the call
+        """
+        ram = self.ram
+        native = array('H', ram)
+        sp = ram[0]-n_args
+        value = builtin(native, self._statics, *native[sp:sp+n_args])
+        if value is None:
+            return _call(target, n_args, pc, ram)
+        native[sp] = value
+        native[0] = sp+1
+
+        code = self._code
+        lcl = ram[1]
+        next_pc = _call(target, n_args, pc, ram)
+        while not (next_pc == pc+1 and ram[0] == sp+1 and ram[1] == lcl):
+            handler, x, y = code[next_pc]
+            next_pc = handler(x, y, next_pc, ram)
+
+        for first, last in ((0, TEMP), (STATIC, sp+1), (HEAP, RAM_SIZE)):
+            if ram[first:last] != native[first:last]:
+                address = next(address for address in range(first, last) if ram[address] != native[address])
+                raise ValueError("File {} line {}: Builtin {} sets RAM[{}] to {}, its Jack implementation to {}.".format(
+                    *self.location(pc), fct_name, address, native[address], ram[address]))
+        return next_pc
+
+    def peek(self, address):
+        """
+        Returns RAM[address] as a signed 16-bit value.
+        """
+        value = self.ram[address]
+        return value-0x10000 if value & 0x8000 else value
+
+    def poke(self, address, value):
+        """
+        Sets RAM[address]; the value may be signed.
+        """
+        self.ram[address] = value & 0xFFFF
+
+    def set_key(self, key_code):
+        """
+        Sets the currently pressed key (0 for none).
+        """
+        self.ram[KBD] = key_code
+
+    def halted(self):
+        """
+        Whether the execution ran past the last command, e.g. Sys.init returned.
+        """
+        return self.pc >= len(self._code)
+
+    def location(self, pc=None):
+        """
+        output:
+            (file name, file line) of the command at the index pc, of the current command if None
+        """
+        pc = self.pc if pc is None else pc
+        return self._locations[pc] if pc < len(self._locations) else ('end', 0)
+
+    def run(self, max_steps):
+        """
+        Executes at most max_steps commands; stops earlier past the end of the program.
+        output:
+            number of executed commands
+        """
+        code = self._code
+        ram = self.ram
+        pc = self.pc
+        n_code = len(code)
+        steps = 0
+        try:
+            while steps < max_steps and pc < n_code:
+                handler, x, y = code[pc]
+                pc = handler(x, y, pc, ram)
+                steps += 1
+        except (IndexError, OverflowError):
+            raise IndexError('File {} line {}: Address outside of the RAM.'.format(*self.location(pc)))
+        except NameError as error:
+            raise ValueError('File {} line {}: Unknown function {}.'.format(*self.location(pc), error))
+        finally:
+            self.pc = pc
+            self.steps += steps
+        return steps
+
+
+# ========================= BlockSource CLASS
+
+MAX_BLOCK_SIZE = 256
+
+_ARITHMETIC_SOURCES = {
+    _add: '(({a}+{b})&0xFFFF)',
+    _sub: '(({a}-{b})&0xFFFF)',
+    _and: '({a}&{b})',
+    _or:  '({a}|{b})',
+}
+_CONDITION_SOURCES = {
+    _eq:  '{a} == {b}',
+    _gt:  '0 < (({a}-{b})&0xFFFF) < 0x8000',
+    _lt:  '({a}-{b})&0x8000',
+}
+_UNARY_SOURCES = {
+    _neg: '((-{a})&0xFFFF)',
+    _not: '({a}^0xFFFF)',
+}
+
+
+class BlockSource(object):
+    """
+    Python source of a block of compiled commands. The values pushed in the block
+    stay in locals and expressions, a symbolic stack, and are written to the
+    stack cells only when the block leaves or calls; the cells are read when a
+    value pushed before the block is popped. depth is the offset of the stack
+    cells written so far from the SP at the start of the block.
+    """
+    def __init__(self, start):
+        self.lines = ['def block_{}(ram):'.format(start), '    sp = ram[0]']
+        self.stack = []
+        self.depth = 0
+        self._n_locals = 0
+        self._conditions = {}       # expression of a comparison or its negation -> Python condition
+        self.namespace = {'ZEROS': ZEROS}
+
+    def _offset(self, depth):
+        return 'sp' if depth == 0 else 'sp{:+d}'.format(depth)
+
+    def _local(self, expression):
+        name = 't{}'.format(self._n_locals)
+        self._n_locals += 1
+        self.lines.append('    {} = {}'.format(name, expression))
+        return name
+
+    def pop_value(self):
+        """
+        Returns the expression of the popped value.
+        """
+        if self.stack:
+            return self.stack.pop()
+        self.depth -= 1
+        return self._local('ram[{}]'.format(self._offset(self.depth)))
+
+    def _push_condition(self, condition):
+        expression = '(0xFFFF if {} else 0)'.format(condition)
+        self._conditions[expression] = condition
+        self.stack.append(expression)
+
+    def flush(self):
+        """
+        Writes the symbolic stack to the stack cells and sets SP.
+        """
+        for value in self.stack:
+            self.lines.append('    ram[{}] = {}'.format(self._offset(self.depth), value))
+            self.depth += 1
+        self.stack = []
+        if self.depth:
+            self.lines.append('    ram[0] = {}'.format(self._offset(self.depth)))
+
+    def add(self, handler, x, y, pc):
+        """
+        Appends the source of a compiled command.
+        output:
+            True if the command ends the block
+        """
+        lines = self.lines
+        if handler is _push_constant:
+            self.stack.append(str(x))
+        elif handler is _push_fixed:
+            self.stack.append(self._local('ram[{}]'.format(x)))
+        elif handler is _push_segment:
+            self.stack.append(self._local('ram[ram[{}]+{}]'.format(x, y)))
+        elif handler is _pop_fixed:
+            lines.append('    ram[{}] = {}'.format(x, self.pop_value()))
+        elif handler is _pop_segment:
+            lines.append('    ram[ram[{}]+{}] = {}'.format(x, y, self.pop_value()))
+        elif handler in _ARITHMETIC_SOURCES:
+            b = self.pop_value()
+            self.stack.append(_ARITHMETIC_SOURCES[handler].format(a=self.pop_value(), b=b))
+        elif handler in _CONDITION_SOURCES:
+            b = self.pop_value()
+            condition = _CONDITION_SOURCES[handler].format(a=self.pop_value(), b=b)
+            self._push_condition(condition)
+        elif handler is _not and self.stack and self.stack[-1] in self._conditions:
+            self._push_condition('not ({})'.format(self._conditions[self.stack.pop()]))
+        elif handler in _UNARY_SOURCES:
+            self.stack.append(_UNARY_SOURCES[handler].format(a=self.pop_value()))
+        elif handler is _function:                          # always first, the symbolic stack is empty
+            if x:
+                lines.append('    ram[{}:{}] = ZEROS[:{}]'.format(self._offset(self.depth), self._offset(self.depth+x), x))
+                self.depth += x
+        elif handler is _goto:
+            self.flush()
+            lines.append('    return {}'.format(x))
+            return True
+        elif handler is _ifgoto:
+            value = self.pop_value()
+            condition = self._conditions.get(value, value)
+            self.flush()
+            lines.append('    return {} if {} else {}'.format(x, condition, pc+1))
+            return True
+        elif handler is _call:
+            self.flush()
+            lines.append('    s = {}'.format(self._offset(self.depth)))
+            lines.append('    ram[s] = {}'.format(pc+1))
+            lines.append('    ram[s+1] = ram[1]')
+            lines.append('    ram[s+2] = ram[2]')
+            lines.append('    ram[s+3] = ram[3]')
+            lines.append('    ram[s+4] = ram[4]')
+            lines.append('    ram[2] = s-{}'.format(y))
+            lines.append('    ram[0] = ram[1] = s+5')
+            lines.append('    return {}'.format(x))
+            return True
+        elif handler is _return:                            # the rest of the stack is dropped
+            value = self.pop_value()
+            lines.append('    frame = ram[1]')
+            lines.append('    arg = ram[2]')
+            lines.append('    return_address = ram[frame-5]')
+            lines.append('    ram[arg] = {}'.format(value))
+            lines.append('    ram[0] = arg+1')
+            lines.append('    ram[4] = ram[frame-1]')
+            lines.append('    ram[3] = ram[frame-2]')
+            lines.append('    ram[2] = ram[frame-3]')
+            lines.append('    ram[1] = ram[frame-4]')
+            lines.append('    return return_address')
+            return True
+        else:                                               # the builtins run by their handler
+            self.flush()
+            self.namespace['handler_{}'.format(pc)] = handler
+            self.namespace['x_{}'.format(pc)] = x
+            lines.append('    return handler_{0}(x_{0}, {1}, {0}, ram)'.format(pc, y))
+            return True
+        return False
+
+# ========================= BlockVMInterpreter CLASS
+
+class BlockVMInterpreter(VMInterpreter):
+    """
+    VM interpreter compiling the program into basic blocks, like the BlockCPU.
+    A block starts at the command the execution reaches and ends with a goto,
+    an if-goto, a call or a return, before a label or a function, or after
+    MAX_BLOCK_SIZE commands. Every block is compiled into one Python function
+    and cached by its start index; a call of an unknown function is left to the
+    command handlers. The cells above SP may differ from the VMInterpreter, they
+    keep the values pushed and popped inside a block unwritten.
+    """
+    def __init__(self, src_paths, bootstrap=True, builtins=None, verify=False):
+        VMInterpreter.__init__(self, src_paths, bootstrap, builtins, verify)
+        self._blocks = [None]*len(self._code)
+
+    def _translate(self, start):
+        """
+        Compiles the block starting at the index start.
+        output:
+            (function (ram) -> pc, number of commands), or None if the command
+            at start is left to its handler
+        """
+        source = BlockSource(start)
+        pc = start
+        ended = False
+        while pc < len(self._code) and pc-start < MAX_BLOCK_SIZE:
+            handler, x, y = self._code[pc]
+            if handler is _call_unknown or (pc in self._targets and pc != start):
+                break
+            source.lines.append('    # {} {}'.format(*self._locations[pc]))
+            pc += 1
+            if source.add(handler, x, y, pc-1):
+                ended = True
+                break
+        if pc == start:
+            return None
+        if not ended:
+            source.flush()
+            source.lines.append('    return {}'.format(pc))
+        namespace = source.namespace
+        exec('\n'.join(source.lines)+'\n', namespace)
+        block = (namespace['block_{}'.format(start)], pc-start)
+        self._blocks[start] = block
+        return block
+
+    def run(self, max_steps):
+        """
+        Executes at most max_steps commands; stops earlier past the end of the program.
+        Whole blocks are executed while they fit into max_steps, the rest command by command.
+        output:
+            number of executed commands
+        """
+        blocks = self._blocks
+        ram = self.ram
+        pc = self.pc
+        n_code = len(blocks)
+        steps = 0
+        try:
+            while pc < n_code:
+                block = blocks[pc]
+                if block is None:
+                    block = self._translate(pc)
+                    if block is None:
+                        break
+                function, length = block
+                if steps+length > max_steps:
+                    break
+                pc = function(ram)
+                steps += length
+        except (IndexError, OverflowError):
+            raise IndexError('File {} line {}: Address outside of the RAM in the block starting here.'.format(
+                *self.location(pc)))
+        finally:
+            self.pc = pc
+            self.steps += steps
+        if pc < n_code and steps < max_steps:
+            steps += VMInterpreter.run(self, max_steps-steps)
+        return steps
+
+
+def find_vm_files(paths):
+    """
+    Expands the paths to the '.vm' files of a program; a file name found again
+    in a later path is skipped, so that e.g. an OS directory given last supplies
+    only the classes missing in the program.
+    input:
+        paths       -list of '.vm' files or directories
+    output:
+        list of the '.vm' files sorted by the file name
+    """
+    files = {}
+    for path in paths:
+        if os.path.isdir(path):
+            matches = [os.path.join(path, file) for file in sorted(os.listdir(path)) if file.endswith('.vm')]
+        elif path.endswith('.vm'):
+            matches = [path]
+        else:
+            raise ValueError("Provided argument {} is neither a '.vm' file nor a directory.".format(path))
+        for match in matches:
+            files.setdefault(os.path.basename(match), match)
+    if not files:
+        raise ValueError("No files having '.vm' extension found.")
+    return [files[name] for name in sorted(files)]
+
+
+def _address_range(string):
+    """
+    Parses 'ADDR' or 'FIRST-LAST'.
+    """
+    first, _, last = string.partition('-')
+    return range(int(first), int(last or first)+1)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Runs '.vm' programs.")
+    arg_parser.add_argument('paths', nargs='+',
+                            help="'.vm' files or directories; a class found again in a later path is skipped")
+    arg_parser.add_argument('--steps', type=int, default=1000000, help='number of VM commands to execute')
+    arg_parser.add_argument('--no-bootstrap', action='store_true',
+                            help="start at the first command instead of calling Sys.init")
+    arg_parser.add_argument('--set', nargs='*', default=[], metavar='ADDR=VALUE', help='initial RAM values')
+    arg_parser.add_argument('--dump', nargs='*', default=[], metavar='ADDR[-ADDR]', help='RAM cells to print')
+    arg_parser.add_argument('--blocks', action='store_true', help='compile the program into basic blocks')
+    arg_parser.add_argument('--builtins', nargs='*', default=None, metavar='FUNCTION',
+                            help='run these OS functions (or all those of a class, or all if none given) natively')
+    arg_parser.add_argument('--verify', action='store_true',
+                            help='check every builtin call against the Jack implementation')
+    args = arg_parser.parse_args()
+    interpreter_class = BlockVMInterpreter if args.blocks else VMInterpreter
+    builtins = select_builtins(args.builtins) if args.builtins is not None else None
+
+    interpreter = interpreter_class(find_vm_files(args.paths), bootstrap=not args.no_bootstrap,
+                                    builtins=builtins, verify=args.verify)
+    for assignment in args.set:
+        address, value = assignment.split('=')
+        interpreter.poke(int(address), int(value))
+
+    start = time.perf_counter()
+    steps = interpreter.run(args.steps)
+    seconds = time.perf_counter()-start
+
+    for cells in args.dump:
+        for address in _address_range(cells):
+            print('RAM[{}] = {}'.format(address, interpreter.peek(address)))
+    print('{} commands in {:.3f} s ({:.2f} M commands/s), at file {} line {}'.format(
+        steps, seconds, steps/seconds/1e6 if seconds else float('inf'), *interpreter.location()))
@@ -0,0 +1,66 @@
+from Parser import Command, C_ARITHMETIC, C_PUSH, C_POP, C_IFGOTO, C_MOVE, C_EQ_ZERO, C_IFNOT, C_INC
+
+# ========================= VMOptimiser CLASS
+
+class VMOptimiser(object):
+    """
+    Peephole optimiser of parsed VM commands. Fuses pairs of adjacent commands
+    into the commands of the CodeGenerator having their own Hack Assembly templates:
+      push X / pop Y            -> C_MOVE       (arg1, arg2: source; arg3, arg4: destination)
+      push constant 0 / eq      -> C_EQ_ZERO    (the top of the stack compared with 0)
+      not / if-goto L           -> C_IFNOT      (jumps to L unless the top of the stack is true (-1))
+      push constant 1 / add     -> C_INC        (increments the top of the stack)
+    A label is a command itself, so the fused commands never span a jump target.
+    """
+    PATTERNS = ['move', 'eq_zero', 'ifnot', 'inc']
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Resets the hit counts.
+        """
+        self.hits = {pattern: 0 for pattern in self.PATTERNS}
+
+    def optimise(self, parsed_lines):
+        """
+        input:
+            parsed_lines    -iterable of the Commands of the Parser
+        output:
+            generator of the Commands with the fused commands
+        """
+        first = None
+        for second in parsed_lines:
+            fused = self._fuse(first, second) if first else None
+            if fused:
+                yield fused
+                first = None
+            else:
+                if first:
+                    yield first
+                first = second
+        if first:
+            yield first
+
+    def _fuse(self, first, second):
+        """
+        Fuses the two commands.
+        output:
+            the fused parsed line, or None if the commands do not match any pattern
+        """
+        if first.cmd_type == C_PUSH:
+            if second.cmd_type == C_POP:
+                self.hits['move'] += 1
+                return Command(C_MOVE, first.arg1, first.arg2, second.file_line, second.arg1, second.arg2)
+            if first.arg1 == 'constant' and second.cmd_type == C_ARITHMETIC:
+                if first.arg2 == 0 and second.arg1 == 'eq':
+                    self.hits['eq_zero'] += 1
+                    return Command(C_EQ_ZERO, None, None, second.file_line)
+                if first.arg2 == 1 and second.arg1 == 'add':
+                    self.hits['inc'] += 1
+                    return Command(C_INC, None, None, second.file_line)
+        elif first.cmd_type == C_ARITHMETIC and first.arg1 == 'not' and second.cmd_type == C_IFGOTO:
+            self.hits['ifnot'] += 1
+            return Command(C_IFNOT, second.arg1, None, second.file_line)
+        return None
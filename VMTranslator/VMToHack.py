@@ -0,0 +1,148 @@
+import argparse
+import importlib.util
+import os.path
+from array import array
+
+from VMTranslator import WRITE_SIZE, add_arguments, translator_from_args
+
+# ========================= HackAssembler modules
+
+HACK_ASSEMBLER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'HackAssembler')
+
+def _load(name, file_name):
+    """
+    Loads a module of the HackAssembler under another name; its Parser and
+    CodeGenerator clash with the modules of the VMTranslator.
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HACK_ASSEMBLER_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+HackParser = _load('HackParser', 'Parser.py')
+HackCodeGenerator = _load('HackCodeGenerator', 'CodeGenerator.py')
+HackBinary = _load('HackBinary', 'HackBinary.py')
+
+# ========================= In-memory VM -> Hack pipeline
+
+MAX_KNOWN_CHUNKS = 1 << 12  # chunks and lines remembered by to_instructions, so that its memory stays bounded
+MAX_KNOWN_LINES = 1 << 12
+
+def to_instructions(chunks, parser, asm_file=None):
+    """
+    Converts the Hack Assembly chunks of the Translator to the Instructions of the
+    HackAssembler. The chunk of a VM command without jump symbols, e.g. of
+    'push local 0' or 'add', is converted once and its Instructions are shared
+    by all the equal chunks. The chunks with jump symbols are unique and parsed
+    line by line, every distinct line of an A- or C-instruction once.
+    input:
+        chunks      -iterable of the Hack Assembly chunks
+        parser      -Parser of the HackAssembler
+        asm_file    -file receiving the Hack Assembly too, None for no '.asm' file
+    output:
+        generator of the Instructions
+    """
+    known_chunks = {}           # chunk without jump symbols: list of its Instructions
+    known_lines = {}            # line of an A- or C-instruction: Instruction
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        if asm_file is not None:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= WRITE_SIZE:
+                asm_file.write(''.join(buffer))
+                buffer = []
+                size = 0
+        instructions = known_chunks.get(chunk)
+        if instructions is None:
+            instructions = []
+            for line in chunk.split('\n'):
+                instruction = known_lines.get(line)
+                if instruction is None:
+                    instruction = parser.parse(line)
+                    if instruction is None:
+                        continue
+                    if instruction.type != 'JS':
+                        if len(known_lines) >= MAX_KNOWN_LINES:
+                            known_lines.clear()
+                        known_lines[line] = instruction
+                instructions.append(instruction)
+            if '(' not in chunk:
+                if len(known_chunks) >= MAX_KNOWN_CHUNKS:
+                    known_chunks.clear()
+                known_chunks[chunk] = instructions
+        yield from instructions
+    if asm_file is not None:
+        asm_file.write(''.join(buffer))
+
+
+def assemble_instructions(instructions, generator):
+    """
+    Resolves the symbols of the Instructions and encodes them.
+    input:
+        instructions    -iterable of the Instructions of the whole program
+        generator       -CodeGenerator of the HackAssembler
+    output:
+        array('H') of the ROM words
+    """
+    generator.reset()
+    commands = []
+    for instruction in instructions:
+        if instruction.type == 'JS':
+            generator.add_jump_symb(key=instruction.key, value=len(commands), file_line=None)
+        else:
+            commands.append(instruction)
+
+    # an Instruction always has the same code once its symbol is known
+    words = array('H')
+    codes = {}
+    for command in commands:
+        word = codes.get(command)
+        if word is None:
+            word = codes[command] = int(generator.generate_code(command, file_line=None), 2)
+        words.append(word)
+    return words
+
+
+def translate_to_hack(translator, dst_path, binary=False, asm_path=None):
+    """
+    Translates the program of the Translator to the Hack machine code in memory,
+    without writing and reading the Hack Assembly text.
+    input:
+        translator  -Translator
+        dst_path    -path to the '.hack' file, or to the '.hackbin' file if binary
+        binary      -write packed binary words instead of text
+        asm_path    -path to the '.asm' file written for debugging, None for no '.asm' file
+    output:
+        number of the ROM words
+    """
+    asm_file = open(asm_path, 'w+') if asm_path is not None else None
+    instructions = to_instructions(translator.chunks(), HackParser.Parser(), asm_file)
+    words = assemble_instructions(instructions, HackCodeGenerator.CodeGenerator())
+    if asm_file is not None:
+        asm_file.close()
+
+    if binary:
+        HackBinary.write_hackbin(dst_path, words)
+    else:
+        dst_file = open(dst_path, 'w+')
+        dst_file.write(''.join(['{0:016b}\n'.format(word) for word in words]))
+        dst_file.close()
+    return len(words)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Translates '.vm' files to Hack machine code in one pass.")
+    add_arguments(arg_parser)
+    arg_parser.add_argument('--bin', action='store_true', help="write a packed '.hackbin' file")
+    arg_parser.add_argument('--asm', action='store_true', help="write the '.asm' file too, for debugging")
+    args = arg_parser.parse_args()
+
+    translator = translator_from_args(args)
+    base_path = os.path.join(translator.path, translator.name)
+    n_words = translate_to_hack(translator, base_path+('.hackbin' if args.bin else '.hack'), args.bin,
+                                base_path+'.asm' if args.asm else None)
+    for line in translator.report():
+        print(line)
+    print('{} ROM words'.format(n_words))
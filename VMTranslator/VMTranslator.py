@@ -1,60 +1,354 @@
+import argparse
+import json
 import os.path
-from sys import argv
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
 from Parser import Parser
 from CodeGenerator import CodeGenerator
+from VMOptimiser import VMOptimiser
+from ConstantFolder import ConstantFolder
+from CallGraph import CallGraph
 
-# ========================= VM_Translator
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'HackAssembler'))
+from ContentCache import ContentCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
 
-if __name__ == "__main__":
-    path = argv[1]
-    file_names = []
-
-    if   os.path.isfile(path):
-        path, src_file = os.path.split(path)
-        if not src_file.endswith('.vm'):
-            raise ValueError("The file has to end with '.vm' extension.")
-        f_name = src_file.split('.')[0]
-        file_names.append(f_name)
-        dst_file = f_name+'.asm'
-        bootstrap = False
-
-    elif os.path.isdir(path):
-        for file in os.listdir(path):
-            if file.endswith('.vm'):
-                f_name = file.split('.')[0]
-                file_names.append(f_name)
-        if len(file_names) == 0:
-            raise ValueError("No files having '.vm' extension in the given directory.")
-        if path[-1] == os.sep:          # in case path ends with an os separator (i.e. 'os.sep')
-            dst_file = os.path.basename(path[:-1])
-        else:
-            dst_file = os.path.basename(path)
-        dst_file += '.asm'
-        bootstrap = True
+VERSION = '1.1'         # part of the cache keys; to be changed with the generated code
+WRITE_SIZE = 1 << 16    # characters of Hack Assembly collected before a write
 
-    dst_file = open(os.path.join(path, dst_file), 'w+')
+# ========================= Pipeline
 
-    parser = Parser()
-    generator = CodeGenerator()
+def read_commands(src_path, parser):
+    """
+    Reads a '.vm' file lazily.
+    input:
+        src_path    -path to the '.vm' file
+        parser      -Parser, reset for the file
+    output:
+        generator of the Commands
+    """
+    parser.reset()
+    src_file = open(src_path, 'r')
+    for parsed_line in map(parser.parse, src_file):
+        if parsed_line:
+            yield parsed_line
+    src_file.close()
 
-    bootstrap_code = ''
-    if bootstrap:
-        parsed_line = parser.parse('call Sys.init 0')
-        bootstrap_code += '@256\n' + 'D=A\n' + '@SP\n' + 'M=D\n'
-        bootstrap_code += generator.generate_code(parsed_line)
-    dst_file.write(bootstrap_code)
 
-    for f_name in file_names:
+def translate_file(parsed_lines, f_name, generator, folder=None, optimiser=None, hot_loops=False, independent=False):
+    """
+    Translates the Commands of one file lazily: fold, peephole, hot loops, generate.
+    input:
+        parsed_lines    -iterable of the Commands of the file
+        f_name          -file name without the extension, used for the static variables
+        generator       -CodeGenerator
+        folder          -ConstantFolder, or None for no folding
+        optimiser       -VMOptimiser, or None for no peephole
+        hot_loops       -mark the hot loops for the shared comparisons
+        independent     -translate the file independently of the other files,
+                         see CodeGenerator.start_file
+    output:
+        generator of the Hack Assembly chunks
+    """
+    if independent:
+        generator.start_file(f_name)
+    else:
         generator.set_new_file_name(file_name=f_name)
-        src_file = open(os.path.join(path, f_name+'.vm'), 'r')
-        src_line = src_file.readline()
-        while src_line:
-            parsed_line = parser.parse(src_line)
-            if parsed_line:
-                output_code = generator.generate_code(parsed_line)
-                # print(output_code)
-                dst_file.write(output_code)
-            src_line = src_file.readline()
-        src_file.close()
+    if folder is not None:
+        parsed_lines = folder.fold(parsed_lines)
+    if optimiser is not None:
+        parsed_lines = optimiser.optimise(parsed_lines)
+    if hot_loops:
+        parsed_lines = generator.mark_hot_loops(parsed_lines)
+    yield from map(generator.generate_code, parsed_lines)
+    if independent:
+        yield generator.end_file()
+
+
+def translate_worker(src_path, f_name, generator_options, fold=False, peephole=False, keep=None):
+    """
+    Translates one '.vm' file independently of the other files, in a worker process.
+    input:
+        src_path            -path to the '.vm' file
+        f_name              -file name without the extension
+        generator_options   -dict of the CodeGenerator options
+        fold                -fold the constant expressions
+        peephole            -fuse common pairs of VM commands
+        keep                -set of the functions kept by the pruning, None to keep all
+    output:
+        (code in Hack Assembly, CodeGenerator.routine_usage, folding hits, peephole hits)
+    """
+    parser = Parser()
+    generator = CodeGenerator(**generator_options)
+    folder = ConstantFolder() if fold else None
+    optimiser = VMOptimiser() if peephole else None
+    parsed_lines = read_commands(src_path, parser)
+    if keep is not None:
+        parsed_lines = CallGraph().prune(parsed_lines, keep)
+    code = ''.join(translate_file(parsed_lines, f_name, generator, folder, optimiser,
+                                  hot_loops=generator_options.get('shared_comparisons', False), independent=True))
+    return (code, generator.routine_usage(),
+            folder.hits if folder else None, optimiser.hits if optimiser else None)
+
+
+def fragment_key(cache, src_path, f_name, generator_options, fold, peephole, kept_functions):
+    """
+    Computes the cache key of the fragment of one file translated by translate_worker.
+    input:
+        kept_functions  -list of the functions of the file kept by the pruning, None without pruning
+    """
+    src_file = open(src_path, 'rb')
+    content = src_file.read()
+    src_file.close()
+    options = repr(sorted(generator_options.items()))+repr((fold, peephole))
+    pruning = 'all' if kept_functions is None else ' '.join(kept_functions)
+    return cache.key(content, VERSION, options, f_name, pruning)
+
+
+def pack_fragment(result):
+    """
+    Converts a translate_worker result to the bytes of a cache entry: a JSON
+    header line with the routine usage and the hits, then the code.
+    """
+    code, (used_routines, n_shared, n_inline), fold_hits, peephole_hits = result
+    header = json.dumps([sorted(used_routines), n_shared, n_inline, fold_hits, peephole_hits])
+    return (header+'\n'+code).encode()
+
+
+def unpack_fragment(data):
+    """
+    Converts the bytes of a cache entry back to a translate_worker result.
+    """
+    header, code = data.decode().split('\n', 1)
+    used_routines, n_shared, n_inline, fold_hits, peephole_hits = json.loads(header)
+    return code, (set(used_routines), n_shared, n_inline), fold_hits, peephole_hits
+
+
+def write_chunks(dst_file, chunks):
+    """
+    Writes the chunks joined into writes of about WRITE_SIZE characters.
+    """
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= WRITE_SIZE:
+            dst_file.write(''.join(buffer))
+            buffer = []
+            size = 0
+    dst_file.write(''.join(buffer))
+
+# ========================= Translator CLASS
+
+class Translator(object):
+    """
+    Translates a '.vm' file, or a directory of '.vm' files with the bootstrap
+    code, to Hack Assembly; see chunks.
+    """
+    def __init__(self, path, trampolines=False, shared_comparisons=False, fold=False, peephole=False,
+                 cache_tos=False, track_sp=False, prune=False, keep=(), jobs=None, cache=None):
+        """
+        input:
+            path        -'.vm' file, or directory of '.vm' files
+            trampolines, shared_comparisons, cache_tos, track_sp
+                        -options of the CodeGenerator
+            fold        -fold the constant expressions
+            peephole    -fuse common pairs of VM commands
+            prune       -drop the functions not reachable from Sys.init (directory only)
+            keep        -additional roots of prune, shell-style patterns allowed
+            jobs        -number of the worker processes, None for the number of CPUs
+            cache       -ContentCache of the translated files, None to bypass the cache
+        """
+        self.file_names = []
+        if   os.path.isfile(path):
+            self.path, src_file = os.path.split(path)
+            if not src_file.endswith('.vm'):
+                raise ValueError("The file has to end with '.vm' extension.")
+            f_name = src_file.split('.')[0]
+            self.file_names.append(f_name)
+            self.name = f_name
+            self.bootstrap = False
+
+        elif os.path.isdir(path):
+            self.path = path
+            for file in sorted(os.listdir(path)):
+                if file.endswith('.vm'):
+                    f_name = file.split('.')[0]
+                    self.file_names.append(f_name)
+            if len(self.file_names) == 0:
+                raise ValueError("No files having '.vm' extension in the given directory.")
+            if path[-1] == os.sep:          # in case path ends with an os separator (i.e. 'os.sep')
+                self.name = os.path.basename(path[:-1])
+            else:
+                self.name = os.path.basename(path)
+            self.bootstrap = True
+
+        else:
+            raise ValueError("Provided argument is neither a '.vm' file nor a directory.")
+
+        if prune and not self.bootstrap:
+            raise ValueError("Dropping the unreachable functions needs a directory, i.e. the whole program.")
+
+        self.src_paths = [os.path.join(self.path, f_name+'.vm') for f_name in self.file_names]
+        self.generator_options = dict(trampolines=trampolines, shared_comparisons=shared_comparisons,
+                                      cache_tos=cache_tos, track_sp=track_sp)
+        self.fold = fold
+        self.peephole = peephole
+        self.prune = prune
+        self.keep_roots = ['Sys.init']+list(keep)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.cache = cache if self.bootstrap else None
+
+        self.parser = Parser()
+        self.generator = CodeGenerator(**self.generator_options)
+        self.optimiser = VMOptimiser()
+        self.folder = ConstantFolder()
+        self.call_graph = None
+        self.keep = None                # set of the functions kept by the pruning, None to keep all
+        self._file_functions = None     # functions of every file, known when pruning
+
+    def chunks(self):
+        """
+        Translates the program.
+        output:
+            generator of the Hack Assembly chunks
+        """
+        if self.prune:
+            self.call_graph = CallGraph()
+            self._file_functions = [self.call_graph.add_file(read_commands(src_path, self.parser))
+                                    for src_path in self.src_paths]
+            self.keep = self.call_graph.reachable(self.keep_roots)
+
+        if self.bootstrap:
+            yield '@256\n' + 'D=A\n' + '@SP\n' + 'M=D\n'
+            yield self.generator.generate_code(self.parser.parse('call Sys.init 0'))
+        # the files of a directory are translated independently, so that the output
+        # is the same with any number of the worker processes and can be cached per file
+        if not self.bootstrap or (self.cache is None and self.jobs == 1):
+            for f_name, src_path in zip(self.file_names, self.src_paths):
+                parsed_lines = read_commands(src_path, self.parser)
+                if self.keep is not None:
+                    parsed_lines = self.call_graph.prune(parsed_lines, self.keep)
+                yield from translate_file(parsed_lines, f_name, self.generator,
+                                          folder=self.folder if self.fold else None,
+                                          optimiser=self.optimiser if self.peephole else None,
+                                          hot_loops=self.generator_options['shared_comparisons'],
+                                          independent=self.bootstrap)
+        else:
+            yield from self._fragments()
+        yield self.generator.generate_routines()
+
+    def _fragments(self):
+        """
+        Translates the files missing in the cache, in the process pool if jobs > 1,
+        and splices the fragments of all the files in the order of the files.
+        """
+        n = len(self.file_names)
+        tasks = (self.src_paths, self.file_names, [self.generator_options]*n,
+                 [self.fold]*n, [self.peephole]*n, [self.keep]*n)
+        keys = [None]*n
+        cached = [None]*n
+        if self.cache is not None:
+            for i in range(n):
+                kept_functions = None if self.keep is None else \
+                                 [name for name in self._file_functions[i] if name in self.keep]
+                keys[i] = fragment_key(self.cache, self.src_paths[i], self.file_names[i], self.generator_options,
+                                       self.fold, self.peephole, kept_functions)
+                cached[i] = self.cache.get(keys[i])
+        misses = [i for i in range(n) if cached[i] is None]
+        miss_tasks = [[task[i] for i in misses] for task in tasks]
+
+        executor = ProcessPoolExecutor(max_workers=self.jobs) if self.jobs > 1 and len(misses) > 1 else None
+        try:
+            translated = executor.map(translate_worker, *miss_tasks) if executor else map(translate_worker, *miss_tasks)
+            for i in range(n):
+                if cached[i] is None:
+                    result = next(translated)
+                    if self.cache is not None:
+                        self.cache.put(keys[i], pack_fragment(result))
+                else:
+                    result = unpack_fragment(cached[i])
+                    cached[i] = None
+                code, usage, fold_hits, peephole_hits = result
+                self.generator.add_routine_usage(usage)
+                for hits, file_hits in [(self.folder.hits, fold_hits), (self.optimiser.hits, peephole_hits)]:
+                    for pattern in file_hits or ():
+                        hits[pattern] += file_hits[pattern]
+                yield code
+        finally:
+            # also when a worker raises or the caller stops reading the fragments
+            if executor is not None:
+                executor.shutdown()
+
+    def report(self):
+        """
+        output:
+            list of the lines reporting the pruning, the cache and the optimisations
+            of the translated program
+        """
+        lines = []
+        if self.prune:
+            dropped = sorted(set(self.call_graph.calls)-self.keep)
+            lines.append('Dropped {} of {} functions ({} commands): {}'.format(
+                len(dropped), len(self.call_graph.calls), sum(self.call_graph.sizes[name] for name in dropped),
+                ' '.join(dropped)))
+        if self.cache is not None:
+            lines.append('Cache: {hits} hits, {misses} misses, {evictions} evictions.'.format(**self.cache.stats()))
+        if self.generator_options['shared_comparisons']:
+            n_shared, n_inline, saved = self.generator.comparison_report()
+            lines.append('Comparisons: {} shared, {} inline in hot loops, {} ROM words saved.'.format(
+                n_shared, n_inline, saved))
+        if self.fold:
+            lines.append('Folded: '+', '.join('{} {}'.format(self.folder.hits[pattern], pattern)
+                                              for pattern in self.folder.PATTERNS))
+        if self.peephole:
+            lines.append('Fused commands: '+', '.join('{} {}'.format(self.optimiser.hits[pattern], pattern)
+                                                      for pattern in self.optimiser.PATTERNS))
+        return lines
+
+def add_arguments(arg_parser):
+    """
+    Adds the arguments of the Translator to the argparse parser.
+    """
+    arg_parser.add_argument('path', help="'.vm' file, or directory of '.vm' files")
+    arg_parser.add_argument('--trampolines', action='store_true',
+                            help="call and return through shared routines: smaller ROM, a few more cycles per call")
+    arg_parser.add_argument('--shared-comparisons', action='store_true',
+                            help="eq, gt and lt through shared routines, except in hot loops")
+    arg_parser.add_argument('--fold', action='store_true', help="fold the constant expressions")
+    arg_parser.add_argument('--peephole', action='store_true', help="fuse common pairs of VM commands")
+    arg_parser.add_argument('--cache-tos', action='store_true', help="keep the top of the stack in the D register")
+    arg_parser.add_argument('--track-sp', action='store_true', help="update SP once per basic block")
+    arg_parser.add_argument('--prune', action='store_true',
+                            help="drop the functions not reachable from Sys.init (directory only)")
+    arg_parser.add_argument('--keep', nargs='*', default=[], metavar='FUNCTION',
+                            help="additional roots of --prune, shell-style patterns allowed")
+    arg_parser.add_argument('--jobs', type=int, default=None,
+                            help="number of worker processes translating the files of a directory")
+    arg_parser.add_argument('--no-cache', action='store_true', help="bypass the cache of the translated files")
+    arg_parser.add_argument('--cache-dir', default=os.path.join(DEFAULT_CACHE_DIR, 'VMTranslator'))
+    arg_parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_BYTES//(1024*1024), help='cache size in MB')
+
+
+def translator_from_args(args):
+    """
+    Creates the Translator from the arguments added by add_arguments.
+    """
+    cache = None if args.no_cache else ContentCache(args.cache_dir, args.cache_size*1024*1024)
+    return Translator(args.path, trampolines=args.trampolines, shared_comparisons=args.shared_comparisons,
+                      fold=args.fold, peephole=args.peephole, cache_tos=args.cache_tos, track_sp=args.track_sp,
+                      prune=args.prune, keep=args.keep, jobs=args.jobs, cache=cache)
+
+# ========================= VM_Translator
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Translates '.vm' files to Hack Assembly.")
+    add_arguments(arg_parser)
+    translator = translator_from_args(arg_parser.parse_args())
+
+    dst_file = open(os.path.join(translator.path, translator.name+'.asm'), 'w+')
+    write_chunks(dst_file, translator.chunks())
     dst_file.close()
+    for line in translator.report():
+        print(line)
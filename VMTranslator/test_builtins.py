@@ -0,0 +1,75 @@
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from VMInterpreter import VMInterpreter, find_vm_files
+from OSBuiltins import select_builtins
+
+# ========================= OS builtins checks
+#
+# Runs programs with the OS of 12/Pong, verifying every builtin call against
+# the Jack implementation of the function (see VMInterpreter._verify_builtin).
+
+PONG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '12', 'Pong')
+
+# the builtins not reached early by Pong; the last drawPixel is off the screen,
+# so its builtin leaves it to the Jack implementation calling Sys.error
+MAIN_VM = ['function Main.main 1',
+           'push constant 1000', 'call Math.sqrt 1', 'pop static 0',
+           'push constant 17', 'push constant 5', 'call Math.mod 2', 'pop static 1',
+           'push constant 3', 'push constant 9', 'call Math.max 2', 'pop static 2',
+           'push constant 3', 'push constant 9', 'call Math.min 2', 'pop static 3',
+           'push constant 5000', 'push constant 42', 'call Memory.poke 2', 'pop temp 0',
+           'push constant 5000', 'call Memory.peek 1', 'pop static 4',
+           'push constant 10', 'call Memory.alloc 1', 'pop local 0',
+           'push local 0', 'call Memory.deAlloc 1', 'pop temp 0',
+           'push constant 10', 'push constant 10', 'call Screen.drawPixel 2', 'pop temp 0',
+           'push constant 20', 'push constant 30', 'push constant 100', 'push constant 30',
+           'call Screen.drawLine 4', 'pop temp 0',
+           'push constant 20', 'push constant 40', 'push constant 20', 'push constant 90',
+           'call Screen.drawLine 4', 'pop temp 0',
+           'push constant 30', 'push constant 40', 'push constant 90', 'push constant 100',
+           'call Screen.drawLine 4', 'pop temp 0',
+           'push constant 90', 'push constant 40', 'push constant 30', 'push constant 100',
+           'call Screen.drawLine 4', 'pop temp 0',
+           'push constant 200', 'push constant 120', 'push constant 20', 'call Screen.drawCircle 3', 'pop temp 0',
+           'push constant 65', 'call Output.printChar 1', 'pop temp 0',
+           'call Output.println 0', 'pop temp 0',
+           'push constant 66', 'call Output.printChar 1', 'pop temp 0',
+           'call Output.backSpace 0', 'pop temp 0',
+           'push constant 600', 'push constant 10', 'call Screen.drawPixel 2', 'pop temp 0',
+           'push constant 0', 'return']
+
+
+class BuiltinsTest(unittest.TestCase):
+
+    def test_pong_verified(self):
+        interpreter = VMInterpreter(find_vm_files([PONG_DIR]), builtins=select_builtins([]), verify=True)
+        self.assertEqual(interpreter.run(20000), 20000)
+        self.assertTrue(any(interpreter.ram[16384:24576]))      # the bat and the ball are drawn
+
+    def test_error_path(self):
+        work_dir = tempfile.mkdtemp(prefix='vm_builtins_')
+        try:
+            src_path = os.path.join(work_dir, 'Main.vm')
+            src_file = open(src_path, 'w')
+            src_file.write('\n'.join(MAIN_VM)+'\n')
+            src_file.close()
+            src_paths = find_vm_files([work_dir, PONG_DIR])
+            runs = [VMInterpreter(src_paths),
+                    VMInterpreter(src_paths, builtins=select_builtins([])),
+                    VMInterpreter(src_paths, builtins=select_builtins([]), verify=True)]
+        finally:
+            shutil.rmtree(work_dir)
+        statics = runs[0]._statics['Main']
+        for interpreter in runs:
+            interpreter.run(2000000)
+            # Sys.error(7) prints the error code and halts
+            self.assertEqual(interpreter.location()[0], 'Sys')
+            self.assertEqual([interpreter.peek(statics+i) for i in range(5)], [31, 2, 9, 3, 42])
+            self.assertEqual(interpreter.ram[16384:24576], runs[0].ram[16384:24576])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from VMInterpreter import VMInterpreter, BlockVMInterpreter
+
+# ========================= VM interpreter checks
+#
+# Runs a small program in both interpreters and compares the RAM with the
+# translated and assembled program run by the CPUEmulator (in a separate
+# process: the HackAssembler and the CPUEmulator have modules named like those
+# of the VMTranslator). The program has the cases at the block boundaries of
+# the BlockVMInterpreter:
+#   - if-goto on a comparison (also on a negated one)
+#   - pops below the SP at the start of a block (after the label AFTER)
+#   - a call following pushes in the same block
+# and the loop of Sys.init keeps the CPU busy after the end.
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+SYS_VM = ['function Sys.init 0',
+          'push constant 3000', 'pop pointer 1',
+          'call Main.main 0', 'pop temp 0',
+          'label END', 'goto END']
+
+MAIN_VM = ['function Main.main 2',
+           'push constant 0', 'pop local 0', 'push constant 0', 'pop local 1',
+           'label LOOP',
+           'push local 1', 'push local 0', 'push constant 3', 'call Main.mul 2', 'add', 'pop local 1',
+           'push local 0', 'push constant 1', 'add', 'pop local 0',
+           'push local 0', 'push constant 10', 'lt', 'if-goto LOOP',
+           'push constant 7', 'push constant 8', 'push local 1',
+           'label AFTER',
+           'add', 'sub', 'pop temp 1',
+           'push local 1', 'push constant 100', 'gt', 'not', 'if-goto SMALL',
+           'push constant 1', 'pop temp 2',
+           'label SMALL',
+           'push local 0', 'pop that 2', 'push local 1', 'neg', 'pop that 3',
+           'push local 1', 'return',
+           'function Main.mul 1',
+           'push constant 0', 'pop local 0',
+           'label MLOOP',
+           'push argument 1', 'push constant 0', 'eq', 'if-goto MDONE',
+           'push local 0', 'push argument 0', 'add', 'pop local 0',
+           'push argument 1', 'push constant 1', 'sub', 'pop argument 1',
+           'goto MLOOP',
+           'label MDONE',
+           'push local 0', 'return']
+
+DUMPED = [0, 1, 2, 3, 4, 5, 6, 7, 3002, 3003]
+STEPS = 2000
+
+
+def write_program(work_dir):
+    """
+    Writes Sys.vm and Main.vm to the directory.
+    output:
+        list of the '.vm' files
+    """
+    src_paths = []
+    for name, lines in [('Main', MAIN_VM), ('Sys', SYS_VM)]:
+        src_path = os.path.join(work_dir, name+'.vm')
+        src_file = open(src_path, 'w')
+        src_file.write('\n'.join(lines)+'\n')
+        src_file.close()
+        src_paths.append(src_path)
+    return src_paths
+
+
+def run_translated(work_dir, cycles):
+    """
+    Translates, assembles and runs the program of the directory.
+    output:
+        dictionary address -> value of the DUMPED cells
+    """
+    name = os.path.basename(work_dir)
+    subprocess.run([sys.executable, os.path.join(ROOT, 'VMTranslator', 'VMTranslator.py'), work_dir, '--no-cache'],
+                   check=True, capture_output=True)
+    subprocess.run([sys.executable, os.path.join(ROOT, 'HackAssembler', 'HackAssembler.py'), '--no-cache',
+                    os.path.join(work_dir, name+'.asm')], check=True, capture_output=True)
+    output = subprocess.run([sys.executable, os.path.join(ROOT, 'CPUEmulator', 'CPUEmulator.py'),
+                             os.path.join(work_dir, name+'.hack'), '--cycles', str(cycles),
+                             '--dump']+[str(address) for address in DUMPED],
+                            check=True, capture_output=True, text=True).stdout
+    cells = {}
+    for line in output.split('\n'):
+        if line.startswith('RAM['):
+            address, value = line[4:].split('] = ')
+            cells[int(address)] = int(value)
+    return cells
+
+
+class InterpreterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='vm_interpreter_')
+        self.src_paths = write_program(self.work_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_same_ram_as_translated(self):
+        expected = run_translated(self.work_dir, 20000)
+        self.assertEqual([expected[address] for address in [5, 6, 7, 3002, 3003]], [135, -136, 1, 10, -135])
+        for interpreter_class in (VMInterpreter, BlockVMInterpreter):
+            interpreter = interpreter_class(self.src_paths)
+            self.assertEqual(interpreter.run(STEPS), STEPS)
+            self.assertEqual({address: interpreter.peek(address) for address in DUMPED}, expected,
+                             interpreter_class.__name__)
+            self.assertEqual(interpreter.location()[0], 'Sys')
+
+    def test_run_splitting_blocks(self):
+        # after every run the state below SP is the same as command by command
+        for max_steps in (1, 3, 7, 40):
+            reference = VMInterpreter(self.src_paths)
+            interpreter = BlockVMInterpreter(self.src_paths)
+            steps = 0
+            while steps < STEPS:
+                self.assertEqual(interpreter.run(max_steps), reference.run(max_steps))
+                steps += max_steps
+                sp = reference.ram[0]
+                self.assertEqual(interpreter.pc, reference.pc, (max_steps, steps))
+                self.assertEqual(interpreter.ram[:sp], reference.ram[:sp], (max_steps, steps))
+                self.assertEqual(interpreter.ram[3000:3004], reference.ram[3000:3004], (max_steps, steps))
+
+
+if __name__ == "__main__":
+    unittest.main()
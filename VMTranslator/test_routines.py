@@ -0,0 +1,86 @@
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from VMTranslator import Translator
+
+# ========================= Shared routines checks
+#
+# Runs the translated programs with the tools of the repository in separate
+# processes: the HackAssembler and the CPUEmulator have modules named like
+# those of the VMTranslator.
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# a single file without bootstrap, as in the tests of project 07
+END_VM = ['push constant 7', 'push constant 7', 'eq',
+          'push constant 2', 'push constant 3', 'lt',
+          'pop temp 0', 'pop temp 1']
+
+# a loop closed by 'not; if-goto', fused into one command by --peephole
+LOOP_VM = ['push constant 0', 'pop temp 0',
+           'label LOOP',
+           'push temp 0', 'push constant 1', 'add', 'pop temp 0',
+           'push temp 0', 'push constant 4', 'gt', 'not', 'if-goto LOOP',
+           'push temp 0', 'pop temp 1']
+
+
+def run_single_file(lines, flags, cycles):
+    """
+    Translates, assembles and runs a '.vm' file with SP = 256.
+    output:
+        dictionary address -> value of RAM[0], RAM[5], RAM[6] and RAM[254]
+    """
+    work_dir = tempfile.mkdtemp(prefix='vm_routines_')
+    try:
+        src_path = os.path.join(work_dir, 'End.vm')
+        src_file = open(src_path, 'w')
+        src_file.write('\n'.join(lines)+'\n')
+        src_file.close()
+        subprocess.run([sys.executable, os.path.join(ROOT, 'VMTranslator', 'VMTranslator.py'), src_path,
+                        '--no-cache']+flags, check=True, capture_output=True)
+        subprocess.run([sys.executable, os.path.join(ROOT, 'HackAssembler', 'HackAssembler.py'), '--no-cache',
+                        os.path.join(work_dir, 'End.asm')], check=True, capture_output=True)
+        output = subprocess.run([sys.executable, os.path.join(ROOT, 'CPUEmulator', 'CPUEmulator.py'),
+                                 os.path.join(work_dir, 'End.hack'), '--cycles', str(cycles),
+                                 '--set', '0=256', '--dump', '0', '5', '6', '254'],
+                                check=True, capture_output=True, text=True).stdout
+    finally:
+        shutil.rmtree(work_dir)
+    cells = {}
+    for line in output.split('\n'):
+        if line.startswith('RAM['):
+            address, value = line[4:].split('] = ')
+            cells[int(address)] = int(value)
+    return cells
+
+
+class RoutinesTest(unittest.TestCase):
+
+    def test_running_past_the_end(self):
+        expected = run_single_file(END_VM, [], 1000)
+        self.assertEqual(expected, {0: 256, 5: -1, 6: -1, 254: 0})
+        for flags in (['--shared-comparisons'], ['--shared-comparisons', '--trampolines', '--cache-tos']):
+            self.assertEqual(run_single_file(END_VM, flags, 1000), expected, flags)
+
+    def test_hot_loop_closed_by_ifnot(self):
+        work_dir = tempfile.mkdtemp(prefix='vm_routines_')
+        try:
+            src_path = os.path.join(work_dir, 'Loop.vm')
+            src_file = open(src_path, 'w')
+            src_file.write('\n'.join(LOOP_VM)+'\n')
+            src_file.close()
+            for peephole in (False, True):
+                translator = Translator(src_path, shared_comparisons=True, peephole=peephole)
+                ''.join(translator.chunks())
+                self.assertEqual(translator.generator.comparison_report()[:2], (0, 1), peephole)
+        finally:
+            shutil.rmtree(work_dir)
+        self.assertEqual(run_single_file(LOOP_VM, ['--shared-comparisons', '--peephole'], 1000)[6], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import io
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from VMTranslator import Translator, write_chunks
+from ContentCache import ContentCache
+
+# ========================= Translator determinism checks
+#
+# The files of a directory are translated independently, so the program is
+# the same whether they are translated in one process or in the process pool,
+# and whether their fragments come from the cache or not.
+
+PONG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '12', 'Pong')
+
+OPTIONS = [{},
+           {'trampolines': True, 'shared_comparisons': True, 'fold': True, 'peephole': True,
+            'cache_tos': True, 'track_sp': True, 'prune': True}]
+
+
+def translate(path, options, jobs, cache=None):
+    """
+    output:
+        (Hack Assembly of the program, report lines of the Translator)
+    """
+    translator = Translator(path, jobs=jobs, cache=cache, **options)
+    dst_file = io.StringIO()
+    write_chunks(dst_file, translator.chunks())
+    return dst_file.getvalue(), translator.report()
+
+
+class TranslatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp(prefix='vm_translator_')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_same_output(self):
+        n_files = len([file for file in os.listdir(PONG_DIR) if file.endswith('.vm')])
+        for i, options in enumerate(OPTIONS):
+            expected, _ = translate(PONG_DIR, options, jobs=1)
+            self.assertEqual(translate(PONG_DIR, options, jobs=4)[0], expected, options)
+
+            cache_dir = os.path.join(self.cache_dir, str(i))
+            for jobs, hits in [(4, 0), (4, n_files), (1, n_files)]:
+                code, report = translate(PONG_DIR, options, jobs, ContentCache(cache_dir))
+                self.assertEqual(code, expected, (options, jobs, hits))
+                cache_line = [line for line in report if line.startswith('Cache:')][0]
+                self.assertTrue(cache_line.startswith('Cache: {} hits'.format(hits)), cache_line)
+
+
+if __name__ == "__main__":
+    unittest.main()